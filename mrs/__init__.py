@@ -48,15 +48,17 @@ from .fileformats import HexWriter, TextWriter, BinWriter, ZipWriter
 from .main import main
 from .mapreduce import MapReduce, IterativeMR, GeneratorCallbackMR
 from .serializers import (Serializer, output_serializers, raw_serializer,
-        str_serializer, int_serializer, make_struct_serializer,
-        make_primitive_serializer, make_protobuf_serializer)
+        str_serializer, int_serializer, sortable_int_serializer,
+        make_struct_serializer, make_primitive_serializer,
+        make_protobuf_serializer)
 
 __version__ = version.__version__
 
 # We need to set __all__ to make sure that pydoc has everything:
 __all__ = ['MapReduce', 'main', 'logger', 'BinWriter', 'HexWriter',
     'TextWriter', 'Serializer', 'output_serializers', 'raw_serializer',
-    'str_serializer', 'int_serializer', 'make_struct_serializer',
+    'str_serializer', 'int_serializer', 'sortable_int_serializer',
+    'make_struct_serializer',
     'make_primitive_serializer', 'make_protobuf_serializer',
     'GeneratorCallbackMR']
 
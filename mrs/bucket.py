@@ -15,6 +15,8 @@
 
 from __future__ import division, print_function
 
+import itertools
+from operator import itemgetter
 import os
 
 from . import fileformats
@@ -33,6 +35,10 @@ try:
     from cStringIO import StringIO as BytesIO
 except ImportError:
     from io import BytesIO
+try:
+    from itertools import imap as map, izip as zip
+except ImportError:
+    pass
 
 
 class ReadBucket(object):
@@ -44,6 +50,8 @@ class ReadBucket(object):
         serializers: A Serializers instance: functions for serializing and
             deserializing between Python objects and bytes.
         url: A string showing a URL that can be used to read the data.
+        nbytes: The size of the file at the URL in bytes (0 if unknown).
+        nrecords: The number of key-value pairs at the URL (0 if unknown).
     """
     def __init__(self, source, split, serializers=None):
         self._data = []
@@ -51,6 +59,8 @@ class ReadBucket(object):
         self.split = split
         self.serializers = serializers
         self.url = None
+        self.nbytes = 0
+        self.nrecords = 0
 
     def addpair(self, kvpair):
         """Collect a single key-value pair."""
@@ -79,8 +89,7 @@ class ReadBucket(object):
         if self._data:
             buf = BytesIO()
             with fileformats.BinWriter(buf, self.serializers) as writer:
-                for pair in self._data:
-                    writer.writepair(pair)
+                writer.writepairs(self._data)
             state['_data'] = buf.getvalue()
             buf.close()
         else:
@@ -126,6 +135,24 @@ class ReadBucket(object):
             for kvpair in reader:
                 yield kvpair
 
+    def stream_batches(self, serializers=None):
+        """Stream over (keys, values) batches from the remote URL.
+
+        Batches come straight from the reader, so columnar formats give
+        whole arrays.  Local data, if loaded, are batched from memory.
+        """
+        if self._data:
+            return util.iter_batches(self._data)
+        else:
+            if serializers is None:
+                serializers = self.serializers
+            return self._stream_batches(serializers)
+
+    def _stream_batches(self, serializers):
+        with fileformats.open_url(self.url, serializers=serializers) as reader:
+            for batch in reader.iterbatches():
+                yield batch
+
     def __iter__(self):
         """Iterate over all already-loaded data."""
         return iter(self._data)
@@ -146,6 +173,8 @@ class WriteBucket(ReadBucket):
         dir: A string specifying the directory for writes.
         format: The class to be used for formatting writes.
         path: The local path of the written file.
+        nbytes: The size of the written file (once the writer is closed).
+        nrecords: The number of key-value pairs collected.
     """
     def __init__(self, source, split, dir=None, format=None, **kwds):
         super(WriteBucket, self).__init__(source, split, **kwds)
@@ -165,6 +194,8 @@ class WriteBucket(ReadBucket):
         b = ReadBucket(self.source, self.split, self.serializers)
         b._data = self._data
         b.url = self._filename
+        b.nbytes = self.nbytes
+        b.nrecords = self.nrecords
         return b
 
     def open_writer(self):
@@ -192,12 +223,14 @@ class WriteBucket(ReadBucket):
                 os.fsync(self._output_file.fileno())
             self._output_file.close()
             self._output_file = None
+            self.nbytes = os.path.getsize(self._filename)
         # Delete the writer at the end because for some wrappers, this will
         # close the underlying file.
         self._writer = None
 
     def addpair(self, kvpair, write_only=False, serialized_key=None):
         """Collect a single key-value pair."""
+        self.nrecords += 1
         if not write_only:
             self._data.append(kvpair)
         if self.dir:
@@ -205,25 +238,33 @@ class WriteBucket(ReadBucket):
                 self.open_writer()
             self._writer.writepair(kvpair, serialized_key=serialized_key)
 
-    def collect(self, pairiter, write_only=False):
+    def collect(self, pairiter, write_only=False, serialized_keys=None):
         """Collect all key-value pairs from the given iterable
 
         The collection can be a generator or a Mrs format.  This will block if
-        the iterator blocks.
+        the iterator blocks.  If `serialized_keys` is given, it is an iterable
+        of already serialized keys corresponding to the pairs in `pairiter`.
         """
         data = self._data
         if self.dir:
             if not self._writer:
                 self.open_writer()
             if write_only:
-                for kvpair in pairiter:
-                    self._writer.writepair(kvpair)
+                # Count the pairs as the writer consumes them (without a
+                # Python-level loop).
+                counter = itertools.count()
+                pairs = map(itemgetter(0), zip(pairiter, counter))
+                self._writer.writepairs(pairs, serialized_keys)
+                self.nrecords += next(counter)
             else:
-                for kvpair in pairiter:
-                    data.append(kvpair)
-                    self._writer.writepair(kvpair)
+                start = len(data)
+                data.extend(pairiter)
+                self._writer.writepairs(data[start:], serialized_keys)
+                self.nrecords += len(data) - start
         elif not write_only:
+            start = len(data)
             data.extend(pairiter)
+            self.nrecords += len(data) - start
 
     def prefix(self):
         """Return the filename for the output split for the given index.
@@ -274,6 +315,8 @@ class URLConverter(object):
         elif (result.hostname == self.addr) and (result.port == self.port):
             path = result.path.lstrip('/')
             url = os.path.join(self.basedir, path)
+            if result.fragment:
+                url += '#' + result.fragment
         return url
 
 
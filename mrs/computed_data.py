@@ -55,6 +55,8 @@ class ComputedData(datasets.RemoteData):
 
         self.op = operation
         self.splits = splits
+        self.sorted = operation.output_sorted()
+        self.salted = bool(operation.hot_keys)
         self.id = '%s_%s' % (operation.id, self.id)
 
         self._computing = True
@@ -83,7 +85,7 @@ class ComputedData(datasets.RemoteData):
         input_data = datasets[self.input_id]
         self.splits = 1
         if self.format is not None:
-            ext = self.format.ext
+            ext = self.format.spec()
         else:
             ext = ''
         task = Task.from_op(self.op, input_data, self.id, 0, self.splits,
@@ -106,7 +108,7 @@ class ComputedData(datasets.RemoteData):
             self.dir = os.path.join(jobdir, self.id)
             os.mkdir(self.dir)
         if self.format is not None:
-            ext = self.format.ext
+            ext = self.format.spec()
         else:
             ext = ''
         return Task.from_op(self.op, input_data, self.id, task_index,
@@ -121,6 +123,7 @@ class ComputedData(datasets.RemoteData):
         """Uses the contents of the given LocalData."""
         self._data = output._data
         self.splits = len(output._data)
+        self.sorted = output.sorted
         self._fetched = True
 
     @property
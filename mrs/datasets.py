@@ -19,21 +19,36 @@
 
 import collections
 import heapq
-from itertools import chain
-from operator import itemgetter
+from itertools import chain, islice
+import multiprocessing
+from operator import attrgetter, itemgetter
+import os
 import random
+import sys
 import tempfile
 
 from . import bucket
 from . import fileformats
-from .serializers import (dumps_functions, loads_functions, raw_serializer,
-        Serializers)
+from .serializers import (bytes_comparable, dumps_functions,
+        loads_functions, raw_serializer, Serializers)
+from .sortbuffer import SortBuffer
 from . import util
 
 from logging import getLogger
 logger = getLogger('mrs')
 
 DATASET_ID_LENGTH = 8
+# Number of partitioned key-value pairs to accumulate before writing.
+COLLECT_BATCH_SIZE = 4096
+# Maximum amount of data (in MB) to sort in RAM if no limit is given.
+DEFAULT_MAX_SORT_SIZE = 100
+# Maximum number of sorted runs that are merged at once.  With a sort pool,
+# larger numbers of runs are first merged in groups in parallel.
+MERGE_FAN_IN = 64
+# Estimated bytes per record buffered by LocalData for sorting (beyond the
+# sizes of the serialized key and value), for the record tuple, its list slot,
+# the serialized key object, and the key itself.
+SORT_RECORD_OVERHEAD = 160
 
 
 class BaseDataset(object):
@@ -52,6 +67,9 @@ class BaseDataset(object):
             split from all sources, use splitdata()
         serializers: a Serializers instance that keeps track of serializers
             and their associated names.
+        sorted: whether each bucket is known to be sorted by key
+        salted: whether hot keys are spread across all splits, so that a
+            reduce of the dataset gives partial results for them
     """
     def __init__(self, splits=0, dir=None, format=None, permanent=True,
             serializers=None):
@@ -63,6 +81,8 @@ class BaseDataset(object):
 
         self.id = util.random_string(DATASET_ID_LENGTH)
         self.closed = False
+        self.sorted = False
+        self.salted = False
         self._close_callback = None
         self._extended_sources = 0
 
@@ -120,11 +140,43 @@ class BaseDataset(object):
         """Iterate over data from buckets for a given split."""
         return self.splitdata(split)
 
+    def stream_split_batches(self, split, serializers=None,
+            _called_in_runner=False):
+        """Iterate over (keys, values) batches for a given split."""
+        return util.iter_batches(self.splitdata(split, _called_in_runner))
+
     def sourcedata(self, source):
         """Iterate over data from buckets for a given source."""
         buckets = self[source, :]
         return chain.from_iterable(buckets)
 
+    def split_sizes(self):
+        """Returns a list of (nbytes, nrecords) totals for each split.
+
+        Sizes are only known for buckets written to files (see ReadBucket);
+        other buckets count as empty.
+        """
+        nbytes = [0] * self.splits
+        nrecords = [0] * self.splits
+        for b in self[:, :]:
+            if 0 <= b.split < self.splits:
+                nbytes[b.split] += b.nbytes
+                nrecords[b.split] += b.nrecords
+        return list(zip(nbytes, nrecords))
+
+    def skew(self):
+        """Returns the ratio of records in the largest split to the mean.
+
+        A perfectly balanced dataset has a skew of 1, and one with all of
+        its records in one of n splits has a skew of n.  Returns 0 if no
+        record counts are known.
+        """
+        nrecords = [n for _, n in self.split_sizes()]
+        total = sum(nrecords)
+        if not total:
+            return 0
+        return max(nrecords) * len(nrecords) / float(total)
+
     def _set_close_callback(self, callback):
         self._close_callback = callback
 
@@ -252,6 +304,12 @@ class LocalData(BaseDataset):
     Note that the `source`, which is just used for naming files, represents
     which output source is being created.
 
+    If `sort` is true and the data are written to files (`write_only`), then
+    each bucket is sorted by key.  At most about `max_sort_size` MB are held
+    in RAM; beyond that, sorted runs are spilled to temporary files and
+    merged into the buckets at the end.  The `sorted` attribute is only set
+    if the buckets were actually sorted.
+
     >>> lst = [(4, 'to_0'), (5, 'to_1'), (7, 'to_3'), (9, 'to_1')]
     >>> o = LocalData(lst, splits=4, parter=(lambda x, n: x%n))
     >>> list(o[0, 1])
@@ -261,7 +319,7 @@ class LocalData(BaseDataset):
     >>>
     """
     def __init__(self, itr, splits=None, source=0, parter=None,
-            write_only=False, **kwds):
+            write_only=False, sort=False, max_sort_size=None, **kwds):
         if parter is not None and splits is None:
             raise RuntimeError('The splits parameter is required when parter'
                     ' is specified.')
@@ -271,7 +329,13 @@ class LocalData(BaseDataset):
         self.fixed_source = source
 
         self.collected = False
-        self._collect(itr, parter, write_only)
+        if sort and write_only and self.dir and self.splits:
+            if max_sort_size is None:
+                max_sort_size = DEFAULT_MAX_SORT_SIZE
+            self._collect_sorted(itr, parter, max_sort_size)
+            self.sorted = True
+        else:
+            self._collect(itr, parter, write_only)
         for key, bucket in self._data.items():
             self._data[key] = bucket.readonly_copy()
         self.collected = True
@@ -303,20 +367,195 @@ class LocalData(BaseDataset):
                 bucket = self[source, 0]
                 bucket.collect(itr, write_only)
             else:
-                dumps_key, _ = dumps_functions(self.serializers)
-                for kvpair in itr:
-                    key, value = kvpair
-                    if dumps_key is None:
-                        serialized_key = key
-                    else:
-                        serialized_key = dumps_key(key)
-                    split = parter(key, serialized_key, n)
-                    bucket = self[source, split]
-                    bucket.addpair(kvpair, write_only,
-                            serialized_key=serialized_key)
+                self._collect_partitioned(itr, parter, write_only)
+        for bucket in self[:, :]:
+            bucket.close_writer(self.permanent)
+
+    def _collect_partitioned(self, itr, parter, write_only):
+        """Partition the key-value pairs and collect them in batches.
+
+        Pairs are grouped by split and handed to each bucket's `collect` so
+        that the writers see large batches rather than single pairs.
+        """
+        n = self.splits
+        dumps_key, _ = dumps_functions(self.serializers)
+        batches = collections.defaultdict(lambda: ([], []))
+
+        count = 0
+        for kvpair in itr:
+            key, value = kvpair
+            if dumps_key is None:
+                serialized_key = key
+            else:
+                serialized_key = dumps_key(key)
+            split = parter(key, serialized_key, n)
+            pairs, serialized_keys = batches[split]
+            pairs.append(kvpair)
+            serialized_keys.append(serialized_key)
+            count += 1
+            if count >= COLLECT_BATCH_SIZE:
+                self._flush_batches(batches, write_only)
+                count = 0
+        self._flush_batches(batches, write_only)
+
+    def _flush_batches(self, batches, write_only):
+        source = self.fixed_source
+        for split, (pairs, serialized_keys) in batches.items():
+            bucket = self[source, split]
+            bucket.collect(pairs, write_only, serialized_keys=serialized_keys)
+        batches.clear()
+
+    def _collect_sorted(self, itr, parter, max_sort_size):
+        """Partition the key-value pairs and write each bucket sorted by key.
+
+        Records are buffered per split as (key, serialized_key, value) until
+        the approximate size exceeds `max_sort_size` MB, at which point each
+        buffer is sorted and spilled to a temporary run.  At the end, the
+        runs and buffers of each split are merged into its bucket.  If the key
+        serializer is bytes-comparable, records are compared by serialized key.
+        """
+        n = self.splits
+        source = self.fixed_source
+        dumps_key, _ = dumps_functions(self.serializers)
+        if bytes_comparable(self.serializers):
+            sort_index = 1
+        else:
+            sort_index = 0
+        max_bytes = 1024 * 1024 * max_sort_size
+        buffers = collections.defaultdict(list)
+        runs = collections.defaultdict(list)
+
+        size = 0
+        for key, value in itr:
+            if dumps_key is None:
+                serialized_key = key
+            else:
+                serialized_key = dumps_key(key)
+            if parter is None or n == 1:
+                split = 0
+            else:
+                split = parter(key, serialized_key, n)
+            buffers[split].append((key, serialized_key, value))
+            size += (len(serialized_key) + _approximate_size(value)
+                    + SORT_RECORD_OVERHEAD)
+            if size > max_bytes:
+                self._spill_runs(buffers, runs, sort_index)
+                size = 0
+
+        for split in set(buffers) | set(runs):
+            records = buffers.pop(split, [])
+            records.sort(key=itemgetter(sort_index))
+            split_runs = runs.pop(split, [])
+            if split_runs:
+                streams = [self._iter_run(run) for run in split_runs]
+                streams.append(iter(records))
+                records = merge_by_key(streams, sort_index)
+            self._write_records(self[source, split], records)
+            for run in split_runs:
+                run.clean()
+
         for bucket in self[:, :]:
             bucket.close_writer(self.permanent)
 
+    def _spill_runs(self, buffers, runs, sort_index=0):
+        """Sort each buffer and write it to a temporary run."""
+        raw_serializers = Serializers(raw_serializer, 'raw_serializer',
+                raw_serializer, 'raw_serializer')
+        _, dumps_value = dumps_functions(self.serializers)
+        for split, records in buffers.items():
+            records.sort(key=itemgetter(sort_index))
+            run = bucket.WriteBucket(self.fixed_source, split, self.dir,
+                    fileformats.BinWriter, serializers=raw_serializers)
+            if dumps_value is None:
+                pairs = [(sk, value) for _, sk, value in records]
+            else:
+                pairs = [(sk, dumps_value(value)) for _, sk, value in records]
+            run.collect(pairs, write_only=True)
+            run.close_writer(False)
+            runs[split].append(run)
+        buffers.clear()
+
+    def _iter_run(self, run):
+        """Iterate over the (key, serialized_key, value) records of a run."""
+        raw_serializers = Serializers(raw_serializer, 'raw_serializer',
+                raw_serializer, 'raw_serializer')
+        loads_key, loads_value = loads_functions(self.serializers)
+        for serialized_key, raw_value in run.readonly_copy().stream(
+                raw_serializers):
+            if loads_key is None:
+                key = serialized_key
+            else:
+                key = loads_key(serialized_key)
+            if loads_value is None:
+                value = raw_value
+            else:
+                value = loads_value(raw_value)
+            yield key, serialized_key, value
+
+    def _write_records(self, bucket, records):
+        """Write (key, serialized_key, value) records to a bucket."""
+        records = iter(records)
+        while True:
+            chunk = list(islice(records, COLLECT_BATCH_SIZE))
+            if not chunk:
+                return
+            pairs = [(key, value) for key, _, value in chunk]
+            serialized_keys = [serialized_key for _, serialized_key, _
+                    in chunk]
+            bucket.collect(pairs, True, serialized_keys=serialized_keys)
+
+
+def _approximate_size(value):
+    """Estimates the size of a value in bytes (for bounding sort buffers)."""
+    try:
+        return len(value)
+    except TypeError:
+        return sys.getsizeof(value)
+
+
+def merge_by_key(streams, index=0):
+    """Merges sorted streams of (key, ...) records (such as pairs) by key.
+
+    The key is the field at the given index of each record.  Records with
+    equal keys come from earlier streams first, and other fields are never
+    compared.
+    """
+    decorated = [_decorate_records(i, s, index) for i, s in enumerate(streams)]
+    for item in heapq.merge(*decorated):
+        yield item[-1]
+
+
+def _decorate_records(stream_index, stream, index):
+    for i, record in enumerate(stream):
+        yield record[index], stream_index, i, record
+
+
+def _merge_serialized_keys(buckets, serializers):
+    """Merges sorted buckets by serialized key (which must be comparable)."""
+    loads_key, _ = loads_functions(serializers)
+    raw_key_serializers = Serializers(raw_serializer, 'raw_serializer',
+            serializers.value_s, serializers.value_s_name)
+    streams = [b.stream(raw_key_serializers) for b in buckets]
+    records = merge_by_key(streams)
+    if loads_key is None:
+        return records
+    else:
+        return deserialize_keys(records, loads_key)
+
+
+def deserialize_keys(pairs, loads_key):
+    """Deserializes the keys of key-sorted (serialized_key, value) pairs.
+
+    Consecutive equal keys share a single deserialized key, so `loads_key` is
+    only called at group boundaries.
+    """
+    last_raw_key = None
+    for raw_key, value in pairs:
+        if raw_key != last_raw_key:
+            key = loads_key(raw_key)
+            last_raw_key = raw_key
+        yield key, value
+
 
 class RemoteData(BaseDataset):
     """A Dataset whose contents can be downloaded and read.
@@ -395,6 +634,42 @@ class RemoteData(BaseDataset):
         random.shuffle(buckets)
         return self._stream_buckets(buckets, serializers)
 
+    def stream_split_sorted(self, split, serializers=None,
+            _called_in_runner=False):
+        """Iterate over data for a given split in key-sorted order.
+
+        Each bucket must already be sorted by key.  All of the buckets are
+        streamed at once and merged, so nothing is copied to local disk.  If
+        the key serializer is bytes-comparable, the merge compares serialized
+        keys, and each key is deserialized once per group.
+        """
+        self._assert_open(_called_in_runner)
+        if serializers is None:
+            serializers = self.serializers
+        if self._fetched:
+            streams = [iter(bucket) for bucket in self[:, split]]
+            return merge_by_key(streams)
+
+        buckets = [bucket for bucket in self[:, split] if bucket.url]
+        if not bytes_comparable(serializers):
+            return merge_by_key([b.stream(serializers) for b in buckets])
+        return _merge_serialized_keys(buckets, serializers)
+
+    def stream_split_batches(self, split, serializers=None,
+            _called_in_runner=False):
+        """Iterate over (keys, values) batches for a given split.
+
+        Batches are read directly from each bucket's reader.
+        """
+        self._assert_open(_called_in_runner)
+        if self._fetched:
+            return util.iter_batches(self.splitdata(split))
+
+        buckets = [bucket for bucket in self[:, split] if bucket.url]
+        random.shuffle(buckets)
+        streams = (b.stream_batches(serializers) for b in buckets)
+        return chain.from_iterable(streams)
+
     def notify_urls_known(self):
         """Signify that all buckets have been assigned urls."""
         self._urls_known = True
@@ -404,12 +679,23 @@ class MergeSortData(BaseDataset):
     """A locally stored copy, sorted by key, of another dataset.
 
     If the dataset is small enough, it will be stored in RAM.  Otherwise,
-    it will be stored in local temporary files.
+    it will be stored in local temporary files.  In either case, serialized
+    pairs are packed into a SortBuffer, so `max_sort_size` bounds the memory
+    that is actually used rather than just the size of the serialized data.
+
+    If `processes` is greater than 1, spilled runs are sorted and written by
+    a pool of that many processes while the input is still being read, and
+    if there are more than MERGE_FAN_IN runs, groups of runs are merged in
+    parallel.  The `max_sort_size` is divided among the processes so that it
+    still bounds the total memory used for sorting.
 
     Note that this class is very specific in its purpose and applicability.
+    If the key serializer is bytes-comparable, pairs are sorted and merged by
+    serialized key, and keys are only deserialized at group boundaries.
     """
     def __init__(self, input, input_split, max_sort_size, splits=None,
-            source=None, parter=None, _called_in_runner=False, **kwds):
+            source=None, parter=None, processes=1, _called_in_runner=False,
+            **kwds):
         if parter is not None:
             raise RuntimeError('The parter paramater must not be specified')
         if source is not None:
@@ -422,83 +708,151 @@ class MergeSortData(BaseDataset):
         self.fixed_split = input_split
         self.serializers = input.serializers
         self.permanent = False
+        self._sort_raw = bytes_comparable(input.serializers)
+        self._buffer = None
 
         self.collected = False
-        self._collect(input, input_split, max_sort_size, _called_in_runner)
+        self._collect(input, input_split, max_sort_size, processes,
+                _called_in_runner)
         self.collected = True
 
-    def _collect(self, input, input_split, max_sort_size, _called_in_runner):
+    def _collect(self, input, input_split, max_sort_size, processes,
+            _called_in_runner):
         assert not self.collected
-        loads_key, loads_value = loads_functions(input.serializers)
-        raw_serializers = Serializers(raw_serializer, 'raw_serializer',
-                raw_serializer, 'raw_serializer')
+        loads_key, _ = loads_functions(input.serializers)
+        if loads_key is None:
+            self._sort_raw = True
         max_ram_bytes = 1024 * 1024 * max_sort_size
 
-        current_bytes = 0
-        total_bytes = 0
-        data_list = []
-        for raw_key, raw_value in input.stream_split(input_split,
-                serializers=raw_serializers,
-                _called_in_runner=_called_in_runner):
-            pair_bytes = len(raw_key) + len(raw_value)
-            if current_bytes + pair_bytes > max_ram_bytes:
-                data_list.sort(key=itemgetter(0))
-                self._flush_data(data_list, raw_serializers, input.serializers)
-                data_list = []
-                current_bytes = 0
-
-            if loads_key is None:
-                data_list.append((raw_key, raw_value))
-            else:
-                key = loads_key(raw_key)
-                data_list.append((key, raw_key, raw_value))
-            current_bytes += pair_bytes
-            total_bytes += pair_bytes
-
-        if self._data:
-            data_list.sort(key=itemgetter(0))
-            self._flush_data(data_list, raw_serializers, input.serializers)
+        if self._sort_raw:
+            sort_buffer = SortBuffer()
         else:
-            data_list.sort(key=itemgetter(0))
-            b = bucket.WriteBucket(0, self.fixed_split)
-            data_itr = self._iter_deserialized(data_list, loads_key,
-                    loads_value)
-            b.collect(data_itr)
-            self._append_bucket(b)
+            sort_buffer = SortBuffer(loads_key)
+
+        pool = None
+        if processes > 1 and self.dir:
+            # The pool is started before any data are read so that the forked
+            # processes do not inherit a copy of a full buffer.
+            pool = _fork_pool(processes, _init_sort_process,
+                    (sort_buffer.loads_key,))
+        if pool is not None:
+            max_ram_bytes //= processes
+            try:
+                total_bytes = self._collect_parallel(input, input_split,
+                        sort_buffer, max_ram_bytes, pool, processes,
+                        _called_in_runner)
+                pool.close()
+            finally:
+                pool.terminate()
+                pool.join()
+        else:
+            total_bytes = self._collect_serial(input, input_split,
+                    sort_buffer, max_ram_bytes, _called_in_runner)
 
         logger.debug('MergeSortData initialized %s bytes in %s buckets'
                 % (total_bytes, len(self._data)))
 
-    def _iter_deserialized(self, data_list, loads_key, loads_value):
-        """Iterate over the deserialized key-value pairs of the data list."""
-        if loads_key is None and loads_value is None:
-            return data_list
-        elif loads_key is None:
-            return ((k, loads_value(raw_v)) for (k, raw_v) in data_list)
-        elif loads_value is None:
-            return ((k, raw_v) for (k, _, raw_v) in data_list)
+    def _collect_serial(self, input, input_split, sort_buffer, max_ram_bytes,
+            _called_in_runner):
+        """Sorts the input in RAM or in runs written by this process."""
+        raw_serializers = Serializers(raw_serializer, 'raw_serializer',
+                raw_serializer, 'raw_serializer')
+        total_bytes = 0
+        pairs = input.stream_split(input_split, serializers=raw_serializers,
+                _called_in_runner=_called_in_runner)
+        while sort_buffer.fill(pairs, max_ram_bytes):
+            total_bytes += sort_buffer.nbytes
+            self._flush_data(sort_buffer, raw_serializers, input.serializers)
+
+        total_bytes += sort_buffer.nbytes
+        sort_buffer.sort()
+        if self._data:
+            self._flush_data(sort_buffer, raw_serializers, input.serializers)
         else:
-            return ((k, loads_value(raw_v)) for (k, _, raw_v) in data_list)
+            self._buffer = sort_buffer
+        return total_bytes
 
-    def _iter_serialized(self, data_list, loads_key):
-        """Iterate over the deserialized key-value pairs of the data list."""
-        if loads_key is None:
-            return data_list
+    def _collect_parallel(self, input, input_split, sort_buffer,
+            max_ram_bytes, pool, processes, _called_in_runner):
+        """Sorts the input in RAM or in runs written by the pool.
+
+        At most `processes` runs are in progress at a time, so that no more
+        than about `processes` buffers are in memory at once.
+        """
+        raw_serializers = Serializers(raw_serializer, 'raw_serializer',
+                raw_serializer, 'raw_serializer')
+        total_bytes = 0
+        pending = []
+        pairs = input.stream_split(input_split, serializers=raw_serializers,
+                _called_in_runner=_called_in_runner)
+        while sort_buffer.fill(pairs, max_ram_bytes):
+            total_bytes += sort_buffer.nbytes
+            if len(pending) >= processes:
+                self._finish_run(pending.pop(0), input.serializers)
+            pending.append(self._start_run(pool, sort_buffer,
+                    len(self._data) + len(pending)))
+            sort_buffer = SortBuffer(sort_buffer.loads_key)
+
+        total_bytes += sort_buffer.nbytes
+        if pending:
+            pending.append(self._start_run(pool, sort_buffer,
+                    len(self._data) + len(pending)))
+            for result in pending:
+                self._finish_run(result, input.serializers)
+            self._merge_runs(pool, input.serializers)
+        else:
+            sort_buffer.sort()
+            self._buffer = sort_buffer
+        return total_bytes
+
+    def _start_run(self, pool, sort_buffer, source):
+        """Asynchronously sorts and writes a buffer in the pool."""
+        return pool.apply_async(_write_sorted_run,
+                (sort_buffer, self.dir, source, self.fixed_split))
+
+    def _finish_run(self, result, input_serializers):
+        """Waits for a run from the pool and adds it as a bucket."""
+        source, url = result.get()
+        b = bucket.ReadBucket(source, self.fixed_split, input_serializers)
+        b.url = url
+        self._data[source, self.fixed_split] = b
+
+    def _merge_runs(self, pool, input_serializers):
+        """Merges groups of runs in parallel until at most MERGE_FAN_IN remain.
+        """
+        while len(self._data) > MERGE_FAN_IN:
+            runs = sorted(self._data.values(), key=attrgetter('source'))
+            groups = [runs[i:i + MERGE_FAN_IN]
+                    for i in range(0, len(runs), MERGE_FAN_IN)]
+            results = [pool.apply_async(_merge_sorted_runs,
+                    ([b.url for b in group], self.dir, source,
+                        self.fixed_split))
+                    for source, group in enumerate(groups)]
+            self._data = {}
+            for result in results:
+                self._finish_run(result, input_serializers)
+
+    def _iter_deserialized(self, pairs, loads_key, loads_value):
+        """Iterate over the deserialized key-value pairs of serialized pairs.
+
+        Since the pairs are sorted, equal keys are adjacent, and each key is
+        only deserialized once.
+        """
+        if loads_key is not None:
+            pairs = deserialize_keys(pairs, loads_key)
+        if loads_value is None:
+            return pairs
         else:
-            return ((raw_k, raw_v) for (k, raw_k, raw_v) in data_list)
+            return ((k, loads_value(raw_v)) for (k, raw_v) in pairs)
 
-    def _flush_data(self, data_list, serializers, input_serializers):
-        if not data_list:
+    def _flush_data(self, sort_buffer, serializers, input_serializers):
+        if not len(sort_buffer):
             return
-        b = bucket.WriteBucket(len(self._data), self.fixed_split,
-                self.dir, serializers=serializers)
-        loads_key, _ = loads_functions(input_serializers)
-        data_itr = self._iter_serialized(data_list, loads_key)
-        b.collect(data_itr, write_only=True)
+        b = _write_run(sort_buffer, self.dir, len(self._data),
+                self.fixed_split)
         b.serializers = input_serializers
-        b.close_writer(False)
         self._append_bucket(b)
-        del data_list[:]
+        sort_buffer.clear()
 
     def _append_bucket(self, b):
         b = b.readonly_copy()
@@ -506,8 +860,106 @@ class MergeSortData(BaseDataset):
 
     def stream_data(self, serializers=None, _called_in_runner=False):
         """Iterate over data from all buckets in key-sorted order."""
-        streams = [b.stream(serializers) for b in self[:, :]]
-        return heapq.merge(*streams)
+        if serializers is None:
+            serializers = self.serializers
+        if self._buffer is not None:
+            loads_key, loads_value = loads_functions(serializers)
+            return self._iter_deserialized(self._buffer, loads_key,
+                    loads_value)
+
+        # Runs are merged in order so that the sort is stable.
+        buckets = sorted(self[:, :], key=attrgetter('source'))
+        if (self._sort_raw and bytes_comparable(serializers)
+                and all(b.url for b in buckets)):
+            return _merge_serialized_keys(buckets, serializers)
+        streams = [b.stream(serializers) for b in buckets]
+        return merge_by_key(streams)
+
+    def clear(self):
+        super(MergeSortData, self).clear()
+        self._buffer = None
+
+
+def _write_run(sort_buffer, dir, source, split):
+    """Sorts a SortBuffer and writes it to a bucket of serialized pairs."""
+    raw_serializers = Serializers(raw_serializer, 'raw_serializer',
+            raw_serializer, 'raw_serializer')
+    sort_buffer.sort()
+    b = bucket.WriteBucket(source, split, dir, serializers=raw_serializers)
+    b.collect(sort_buffer, write_only=True)
+    b.close_writer(False)
+    return b
+
+
+# The function for deserializing keys in a sort process, or None if keys are
+# compared as bytes (see _init_sort_process).
+_sort_loads_key = None
+
+
+def _fork_pool(processes, initializer, initargs):
+    """Starts a pool of forked processes, or returns None if fork is missing.
+
+    The processes are forked even where another start method is the default
+    (as on macOS in Python 3.8), since the initializer arguments need not be
+    picklable.
+    """
+    try:
+        if hasattr(multiprocessing, 'get_context'):
+            context = multiprocessing.get_context('fork')
+        elif sys.platform != 'win32':
+            # Python 2 always forks where it can.
+            context = multiprocessing
+        else:
+            raise ValueError('fork is unavailable')
+    except ValueError:
+        logger.warning('Sorting in one process since fork is unavailable.')
+        return None
+    return context.Pool(processes, initializer, initargs)
+
+
+def _init_sort_process(loads_key):
+    """Initializes a process in the MergeSortData pool.
+
+    The pool is forked (see _fork_pool), so `loads_key` need not be
+    picklable.
+    """
+    global _sort_loads_key
+    _sort_loads_key = loads_key
+
+
+def _write_sorted_run(sort_buffer, dir, source, split):
+    """Sorts and writes a run in a sort process, returning (source, url)."""
+    sort_buffer.loads_key = _sort_loads_key
+    b = _write_run(sort_buffer, dir, source, split)
+    return source, b.readonly_copy().url
+
+
+def _merge_sorted_runs(urls, dir, source, split):
+    """Merges runs into one in a sort process, returning (source, url).
+
+    The merged runs are removed.
+    """
+    raw_serializers = Serializers(raw_serializer, 'raw_serializer',
+            raw_serializer, 'raw_serializer')
+    loads_key = _sort_loads_key
+    streams = []
+    for url in urls:
+        run = bucket.ReadBucket(source, split, raw_serializers)
+        run.url = url
+        if loads_key is None:
+            streams.append(run.stream())
+        else:
+            streams.append((loads_key(k), k, v) for k, v in run.stream())
+    records = merge_by_key(streams)
+    if loads_key is not None:
+        records = ((k, v) for _, k, v in records)
+
+    b = bucket.WriteBucket(source, split, dir, serializers=raw_serializers)
+    b.collect(records, write_only=True)
+    b.close_writer(False)
+    for url in urls:
+        os.remove(url)
+    return source, b.readonly_copy().url
 
 
 class FileData(RemoteData):
@@ -515,7 +967,9 @@ class FileData(RemoteData):
 
     By default, all of the files come from a single source, with one split for
     each file.  If a split is given, then the dataset will have enough sources
-    to evenly divide the files.
+    to evenly divide the files.  If `split_size` is given, then line-oriented
+    files larger than `split_size` bytes are divided into byte ranges, each
+    of which is treated as a separate file (see `fileformats.split_url`).
 
     >>> urls = ['http://aml.cs.byu.edu/', 'LICENSE']
     >>> data = FileData(urls)
@@ -532,7 +986,10 @@ class FileData(RemoteData):
     >>>
     """
     def __init__(self, urls, sources=None, splits=None,
-            first_source=0, first_split=0, **kwds):
+            first_source=0, first_split=0, split_size=None, **kwds):
+        if split_size:
+            urls = [split for url in urls
+                    for split in fileformats.split_url(url, split_size)]
         n = len(urls)
 
         if splits is None:
@@ -15,35 +15,87 @@
 
 from __future__ import division, print_function
 
+import array
+import bisect
 import codecs
+from collections import namedtuple
+import functools
 import gzip
 from itertools import islice
+import mmap
 import os
 import struct
 import sys
+import threading
+import traceback
+import weakref
+import zlib
 
 PY3 = sys.version_info[0] == 3
 if PY3:
     from urllib.parse import urlparse
-    from urllib.request import urlopen, URLopener
+    from urllib.request import urlopen, Request, URLopener
     import io
+    import queue
 else:
     from urlparse import urlparse
     from urllib import URLopener
-    from urllib2 import urlopen
+    from urllib2 import urlopen, Request
+    import Queue as queue
+
+try:
+    import cPickle as pickle
+except ImportError:
+    import pickle
+
+try:
+    import lz4.frame
+except ImportError:
+    lz4 = None
+
+try:
+    import zstandard
+except ImportError:
+    zstandard = None
+
+try:
+    import numpy
+except ImportError:
+    numpy = None
 
 from . import hdfs
-from .serializers import dumps_functions, loads_functions
+from . import util
+from .serializers import (dumps_functions, loads_functions, int_serializer,
+        raw_serializer, str_serializer)
 
+from logging import getLogger
+logger = getLogger('mrs')
 
-DEFAULT_BUFFER_SIZE = 4096
+
+READ_BUFFER_SIZE = 256 * 1024
+WRITE_BUFFER_SIZE = 256 * 1024
 # 1 is fast and unaggressive, 9 is slow and aggressive
 COMPRESS_LEVEL = 9
+# Number of decompressed blocks that a BlockReader may read ahead.
+READ_AHEAD_BLOCKS = 4
+# Number of records in each batch of a ColumnWriter.
+COLUMN_BATCH_SIZE = 64 * 1024
+# Fixed-width types (as array typecodes) allowed in columnar files.
+COLUMN_TYPES = 'bBhHiIqQfd'
 
 hex_encoder = codecs.getencoder('hex_codec')
 hex_decoder = codecs.getdecoder('hex_codec')
 
 len_struct = struct.Struct('<I')
+# Block header: uncompressed length and compressed length.
+block_struct = struct.Struct('<II')
+# Indexed block header: record count, uncompressed length, stored length,
+# CRC-32 of the stored data, and lengths of the first and last keys.
+index_block_struct = struct.Struct('<IIIIII')
+index_offset_struct = struct.Struct('<Q')
+# Index trailer: index offset, number of blocks, flags, and magic cookie.
+index_trailer_struct = struct.Struct('<QII4s')
+INDEX_SORTED = 1
 
 
 class Writer(object):
@@ -65,9 +117,28 @@ class Writer(object):
         self.fileobj = fileobj
         self.dumps_key, self.dumps_value = dumps_functions(serializers)
 
+    @classmethod
+    def spec(cls):
+        """Returns a string identifying the format (see `writerformat`)."""
+        return cls.ext
+
     def writepair(self, kvpair, **kwds):
         raise NotImplementedError
 
+    def writepairs(self, kvpairs, serialized_keys=None):
+        """Write all key-value pairs from the given iterable.
+
+        If `serialized_keys` is given, it is an iterable of already
+        serialized keys corresponding to the pairs in `kvpairs`.
+        """
+        writepair = self.writepair
+        if serialized_keys is None:
+            for kvpair in kvpairs:
+                writepair(kvpair)
+        else:
+            for kvpair, serialized_key in zip(kvpairs, serialized_keys):
+                writepair(kvpair, serialized_key=serialized_key)
+
     def finish(self):
         """Flush the file object, which may be a buffering wrapper."""
         self.fileobj.flush()
@@ -101,6 +172,13 @@ class Reader(object):
     def __iter__(self, kvpair):
         raise NotImplementedError
 
+    def iterbatches(self, size=util.BATCH_SIZE):
+        """Iterate over (keys, values) batches of up to `size` records.
+
+        Formats that store data in batches may ignore the size.
+        """
+        return util.iter_batches(self, size)
+
     def __enter__(self):
         return self
 
@@ -118,26 +196,37 @@ class LineReader(Reader):
     line contents (as a string).  The input file is assumed to be encoded in
     UTF-8, and the error mode is 'replace' (invalid characters are replaced
     with u'\ufffd').
+
+    If `byte_range` is given as a (start, end) pair, then only lines that
+    begin within the range are read, and each key is the byte offset of the
+    line instead of its line number (see `open_url`).
     """
+    splittable = True
+
     def __init__(self, fileobj, *args, **kwds):
-        if PY3:
+        self.byte_range = kwds.pop('byte_range', None)
+        if PY3 and self.byte_range is None:
             fileobj = io.TextIOWrapper(fileobj, encoding='utf-8',
                     errors='replace')
         super(LineReader, self).__init__(fileobj, *args, **kwds)
 
-    if PY3:
-        def __iter__(self):
-            """Iterate over key-value pairs.
+    def __iter__(self):
+        """Iterate over key-value pairs.
 
-            Inheriting classes will almost certainly override this method.
-            """
+        Inheriting classes will almost certainly override this method.
+        """
+        if self.byte_range is not None:
+            start, end = self.byte_range
+            lines = _iter_range_lines(self.fileobj, start, end)
+            return ((offset, line.decode('utf-8', 'replace'))
+                    for offset, line in lines)
+        return self._iter_lines()
+
+    if PY3:
+        def _iter_lines(self):
             return enumerate(self.fileobj)
     else:
-        def __iter__(self):
-            """Iterate over key-value pairs.
-
-            Inheriting classes will almost certainly override this method.
-            """
+        def _iter_lines(self):
             for i, s in enumerate(self.fileobj):
                 yield i, s.decode('utf-8', 'replace')
 
@@ -146,19 +235,198 @@ class BytesLineReader(Reader):
     """Reads key-value pairs from a file object.
 
     In this basic reader, the key-value pair is composed of a line number
-    and line contents (as a bytes object).
+    and line contents (as a bytes object).  As in LineReader, a `byte_range`
+    may be given, in which case keys are byte offsets.
     """
+    splittable = True
+
+    def __init__(self, fileobj, *args, **kwds):
+        self.byte_range = kwds.pop('byte_range', None)
+        super(BytesLineReader, self).__init__(fileobj, *args, **kwds)
+
     def __iter__(self):
         """Iterate over key-value pairs.
 
         Inheriting classes will almost certainly override this method.
         """
+        if self.byte_range is not None:
+            start, end = self.byte_range
+            return _iter_range_lines(self.fileobj, start, end)
         return enumerate(self.fileobj)
 
 
-# TODO: implement TextReader
-# class TextReader(LineReader) should read lines and do:
-# key, value = line.split(None, 1)
+def _iter_range_lines(fileobj, start, end):
+    """Iterates over (offset, line) pairs for lines beginning in [start, end).
+
+    The file object must be positioned at `start - 1` (or at 0 if `start` is
+    0).  As in Hadoop's TextInputFormat, the rest of the line containing that
+    byte is skipped, since it belongs to the previous range.  The last line
+    is read to completion even if it extends past the end of the range.
+    """
+    position = start
+    if start > 0:
+        position += len(fileobj.readline()) - 1
+    while position < end:
+        line = fileobj.readline()
+        if not line:
+            return
+        yield position, line
+        position += len(line)
+
+
+def _iter_range_chunks(fileobj, start, end, size=READ_BUFFER_SIZE):
+    """Iterates over chunks of the lines beginning in [start, end).
+
+    The lines are the same as those of `_iter_range_lines`, but they are read
+    about `size` bytes at a time, and each chunk holds whole lines (the last
+    of which lacks a newline only at the end of the file).
+    """
+    position = start
+    if start > 0:
+        position += len(fileobj.readline()) - 1
+    # The data (from `position`) not yet yielded.
+    data = b''
+    while position < end:
+        # Reads stop at the end of the range unless the last line goes on.
+        read_end = position + len(data)
+        if read_end < end:
+            chunk = fileobj.read(min(size, end - read_end))
+        else:
+            chunk = fileobj.read(size)
+        if not chunk:
+            if data:
+                yield data
+            return
+        data += chunk
+
+        if position + len(data) >= end:
+            # The line containing the last byte of the range is the last one.
+            newline = data.find(b'\n', end - 1 - position)
+            if newline >= 0:
+                yield data[:newline + 1]
+                return
+        else:
+            cut = data.rfind(b'\n') + 1
+            if cut:
+                yield data[:cut]
+                data = data[cut:]
+                position += cut
+
+
+class TextReader(Reader):
+    """Reads key-value pairs from files written by TextWriter.
+
+    Each line is split at the first space into a key and a value.  Since the
+    text cannot be unpickled, the serializers are used only as type hints:
+    by default, keys and values are strings, but if a serializer is given,
+    its `loads` function is applied to the UTF-8 encoded text (so
+    `int_serializer` gives ints and `raw_serializer` gives bytes).
+
+    The file is read and decoded a large buffer at a time, and the lines of
+    each buffer are split together.  A `byte_range` may be given as in
+    LineReader.
+    """
+    splittable = True
+
+    def __init__(self, fileobj, serializers=None, **kwds):
+        self.byte_range = kwds.pop('byte_range', None)
+        super(TextReader, self).__init__(fileobj, **kwds)
+        if serializers is None:
+            key_s = value_s = None
+        else:
+            key_s = serializers.key_s
+            value_s = serializers.value_s
+        self._raw = (key_s is raw_serializer and value_s is raw_serializer)
+        if self._raw:
+            self.loads_key = self.loads_value = None
+        else:
+            self.loads_key = _text_loads(key_s)
+            self.loads_value = _text_loads(value_s)
+
+    def __iter__(self):
+        """Iterate over key-value pairs."""
+        loads_key = self.loads_key
+        loads_value = self.loads_value
+        if self._raw:
+            separator = b' '
+        else:
+            separator = u' '
+        for lines in self._iter_line_blocks():
+            if loads_key is None and loads_value is None:
+                for line in lines:
+                    key, _, value = line.partition(separator)
+                    yield key, value
+            else:
+                for line in lines:
+                    key, _, value = line.partition(separator)
+                    if loads_key is not None:
+                        key = loads_key(key)
+                    if loads_value is not None:
+                        value = loads_value(value)
+                    yield key, value
+
+    def _iter_line_blocks(self):
+        """Iterate over lists of lines (without line endings).
+
+        Lines are decoded from UTF-8 unless both serializers are raw.
+        """
+        raw = self._raw
+        if self.byte_range is not None:
+            start, end = self.byte_range
+            for data in _iter_range_chunks(self.fileobj, start, end):
+                if not raw:
+                    data = data.decode('utf-8', 'replace')
+                yield _split_lines(data)
+            return
+
+        remainder = b''
+        while True:
+            data = self.fileobj.read(READ_BUFFER_SIZE)
+            if not data:
+                break
+            data = remainder + data
+            end = data.rfind(b'\n') + 1
+            remainder = data[end:]
+            data = data[:end]
+            if not raw:
+                data = data.decode('utf-8', 'replace')
+            yield _split_lines(data)
+        if remainder:
+            if not raw:
+                remainder = remainder.decode('utf-8', 'replace')
+            yield [remainder]
+
+
+def _text_loads(serializer):
+    """Returns a function to convert text for the given serializer.
+
+    Returns None if the text should be left as is.
+    """
+    if serializer is None or serializer is str_serializer:
+        return None
+    elif serializer is raw_serializer:
+        return _encode_text
+    elif serializer is int_serializer:
+        return int
+    else:
+        loads = serializer.loads
+        return lambda text: loads(text.encode('utf-8'))
+
+
+def _encode_text(text):
+    return text.encode('utf-8')
+
+
+def _split_lines(data):
+    """Splits text or bytes at newlines, ignoring a final newline."""
+    if isinstance(data, bytes):
+        lines = data.split(b'\n')
+    else:
+        lines = data.split(u'\n')
+    if not lines[-1]:
+        lines.pop()
+    return lines
+
 
 class TextWriter(Writer):
     """A basic line-oriented format, primarily for user interaction.
@@ -236,16 +504,22 @@ class HexWriter(Writer):
 class BinWriter(Writer):
     """A key-value store using a simple binary record format.
 
-    By default, the given file will be closed when the writer is closed,
-    but the close argument makes this configurable.  Setting close to False
-    is useful for StringIO/BytesIO.
+    Records are appended to an in-memory buffer, which is written to the file
+    object in large chunks.  The buffer is flushed by `finish`, so the file
+    object is incomplete until then.  The `buffer_size` attribute sets the
+    size at which the buffer is flushed (and the block size of subclasses).
     """
     ext = 'mrsb'
     magic = b'MrsB'
+    buffer_size = WRITE_BUFFER_SIZE
 
     def __init__(self, fileobj, *args, **kwds):
         super(BinWriter, self).__init__(fileobj, *args, **kwds)
-        self.fileobj.write(self.magic)
+        self._buffer = bytearray()
+        self._write_header()
+
+    def _write_header(self):
+        self._buffer += self.magic
 
     def writepair(self, kvpair, serialized_key=None):
         """Write a key-value pair."""
@@ -256,71 +530,215 @@ class BinWriter(Writer):
             key = self.dumps_key(key)
         if self.dumps_value is not None:
             value = self.dumps_value(value)
-        write = self.fileobj.write
 
-        binlen = len_struct.pack(len(key))
-        write(binlen)
-        write(key)
+        buf = self._buffer
+        buf += len_struct.pack(len(key))
+        buf += key
+        buf += len_struct.pack(len(value))
+        buf += value
+        if len(buf) >= self.buffer_size:
+            self._flush_buffer()
+
+    def writepairs(self, kvpairs, serialized_keys=None):
+        """Write all key-value pairs from the given iterable.
 
-        binlen = len_struct.pack(len(value))
-        write(binlen)
-        write(value)
+        If `serialized_keys` is given, it is an iterable of already
+        serialized keys corresponding to the pairs in `kvpairs`.
+        """
+        dumps_key = self.dumps_key
+        dumps_value = self.dumps_value
+        if serialized_keys is not None:
+            pairs = zip(serialized_keys, (value for _, value in kvpairs))
+        elif dumps_key is not None:
+            pairs = ((dumps_key(key), value) for key, value in kvpairs)
+        else:
+            pairs = kvpairs
+
+        pack = len_struct.pack
+        buf = self._buffer
+        buffer_size = self.buffer_size
+        for key, value in pairs:
+            if dumps_value is not None:
+                value = dumps_value(value)
+            buf += pack(len(key))
+            buf += key
+            buf += pack(len(value))
+            buf += value
+            if len(buf) >= buffer_size:
+                self._flush_buffer()
+
+    def _flush_buffer(self):
+        """Write out the buffered records (keeping the buffer for reuse)."""
+        buf = self._buffer
+        if buf:
+            self.fileobj.write(buf)
+            del buf[:]
+
+    def finish(self):
+        self._flush_buffer()
+        super(BinWriter, self).finish()
 
 
 class BinReader(Reader):
-    """A key-value store using a simple binary record format."""
+    """A key-value store using a simple binary record format.
+
+    Data are read in large blocks into a reusable bytearray, and records are
+    parsed in place with an offset cursor, so the only copies made are of the
+    keys and values themselves (and not even those if the loads function can
+    read directly from a memoryview).
+    """
     magic = b'MrsB'
 
     def __init__(self, fileobj, *args, **kwds):
         super(BinReader, self).__init__(fileobj, *args, **kwds)
-        self._buffer = b''
+        self._buffer = bytearray()
+        self._offset = 0
+        self._eof = False
         self._magic_read = False
 
     def __iter__(self):
         """Iterate over key-value pairs."""
-        #TODO: check for 'MRSB' magic cookie
+        if self._buffer is None:
+            raise ValueError('I/O operation on closed file')
         if not self._magic_read:
             buf = self.fileobj.read(len(self.magic))
             if buf != self.magic:
-                raise RuntimeError('Invalid file header: "%s"'
-                    % buf.encode('hex_codec'))
+                encoded, _ = hex_encoder(buf)
+                raise RuntimeError('Invalid file header: "%s"' % encoded)
             self._magic_read = True
 
-        while True:
-            key = self._read_record()
-            if key is None:
-                return
-            value = self._read_record()
-            if value is None:
-                raise RuntimeError('File ended with a lone key')
-            if self.loads_key is not None:
-                key = self.loads_key(key)
-            if self.loads_value is not None:
-                value = self.loads_value(value)
-            yield (key, value)
+        loads_key = self.loads_key
+        loads_value = self.loads_value
+        key_from_view = _loads_from_view(loads_key)
+        value_from_view = _loads_from_view(loads_value)
+        unpack_from = len_struct.unpack_from
+        lensize = len_struct.size
 
-    def _fill_buffer(self, size=DEFAULT_BUFFER_SIZE):
-        self._buffer += self.fileobj.read(size)
-
-    def _read_record(self):
-        if len(self._buffer) < len_struct.size:
-            self._fill_buffer()
-        if not self._buffer:
-            return None
-
-        lenfield = self._buffer[:len_struct.size]
-        length, = len_struct.unpack(lenfield)
+        while True:
+            buf = self._buffer
+            view = memoryview(buf)
+            offset = self._offset
+            end = len(buf)
+            while True:
+                if offset + lensize > end:
+                    break
+                key_len, = unpack_from(buf, offset)
+                key_start = offset + lensize
+                key_end = key_start + key_len
+                if key_end + lensize > end:
+                    break
+                value_len, = unpack_from(buf, key_end)
+                value_start = key_end + lensize
+                value_end = value_start + value_len
+                if value_end > end:
+                    break
+
+                if loads_key is None:
+                    key = view[key_start:key_end].tobytes()
+                elif key_from_view:
+                    key = loads_key(view[key_start:key_end])
+                else:
+                    key = loads_key(view[key_start:key_end].tobytes())
+                if loads_value is None:
+                    value = view[value_start:value_end].tobytes()
+                elif value_from_view:
+                    value = loads_value(view[value_start:value_end])
+                else:
+                    value = loads_value(view[value_start:value_end].tobytes())
+
+                offset = value_end
+                self._offset = offset
+                yield (key, value)
+                if self._buffer is None:
+                    # The reader was closed while the iterator was suspended.
+                    raise ValueError('I/O operation on closed file')
+
+            # The buffer can't be resized while a memoryview is exported.
+            del view
+            if not self._fill_buffer(offset):
+                break
+
+        if self._offset < len(self._buffer):
+            remaining = len(self._buffer) - self._offset
+            if remaining >= lensize:
+                key_len, = unpack_from(self._buffer, self._offset)
+                if remaining == lensize + key_len:
+                    raise RuntimeError('File ended with a lone key')
+            raise RuntimeError('File ended unexpectedly')
 
-        end = len_struct.size + length
-        if end > len(self._buffer):
-            self._fill_buffer(end - len(self._buffer))
+    def _fill_buffer(self, offset, size=READ_BUFFER_SIZE):
+        """Discard consumed data and append the next block from the file.
 
-        if end > len(self._buffer):
-            raise RuntimeError('File ended unexpectedly')
+        Returns False if no more data are available.
+        """
+        if self._eof:
+            return False
+        buf = self._buffer
+        del buf[:offset]
+        self._offset = 0
+        data = self.fileobj.read(size)
+        if not data:
+            self._eof = True
+            return False
+        buf += data
+        return True
+
+
+class MmapBinReader(BinReader):
+    """A BinReader that reads a local file through a read-only memory map.
+
+    Records are parsed straight from the mapped region, so readers on the
+    same host share the page cache instead of copying the file into Python
+    buffers.  If the file cannot be mapped (e.g., it is empty or is not a
+    regular file), this falls back to normal buffered reads.  Iterating after
+    the reader is closed raises ValueError, as reading a closed file does.
+    """
+    def __init__(self, fileobj, *args, **kwds):
+        super(MmapBinReader, self).__init__(fileobj, *args, **kwds)
+        try:
+            self._mmap = mmap.mmap(fileobj.fileno(), 0,
+                    access=mmap.ACCESS_READ)
+        except (AttributeError, ValueError, EnvironmentError):
+            self._mmap = None
+            return
+
+        magic_len = len(self.magic)
+        header = self._mmap[:magic_len]
+        if header != self.magic:
+            encoded, _ = hex_encoder(header)
+            self.close()
+            raise RuntimeError('Invalid file header: "%s"' % encoded)
+        self._buffer = self._mmap
+        self._offset = magic_len
+        self._eof = True
+        self._magic_read = True
+
+    def _fill_buffer(self, offset, size=READ_BUFFER_SIZE):
+        if self._mmap is None:
+            return super(MmapBinReader, self)._fill_buffer(offset, size)
+        self._offset = offset
+        return False
 
-        data = self._buffer[len_struct.size:end]
-        self._buffer = self._buffer[end:]
-        return data
+    def close(self):
+        if self._mmap is not None:
+            self._buffer = None
+            try:
+                self._mmap.close()
+            except BufferError:
+                # A suspended iterator still holds a view of the map; it
+                # will be unmapped when the iterator is collected.
+                pass
+            self._mmap = None
+        super(MmapBinReader, self).close()
+
+
+def _loads_from_view(loads):
+    """Reports whether the given loads function accepts a memoryview.
+
+    This avoids copying each key or value into a temporary bytes object.  Only
+    pickle is known to be safe; user serializers may expect real bytes.
+    """
+    return PY3 and loads is pickle.loads
 
 
 class ZipWriter(BinWriter):
@@ -339,6 +757,7 @@ class ZipWriter(BinWriter):
         super(ZipWriter, self).__init__(fileobj, *args, **kwds)
 
     def finish(self):
+        self._flush_buffer()
         # Close the gzip file (which does not close the underlying file).
         self.fileobj.close()
 
@@ -358,13 +777,757 @@ class ZipReader(BinReader):
         self.original_file.close()
 
 
+###############################################################################
+# Compression codecs for block-compressed files
+
+Codec = namedtuple('Codec', ('compress', 'decompress', 'default_level'))
+
+def _zlib_compress(data, level):
+    return zlib.compress(bytes(data), level)
+
+def _identity_compress(data, level):
+    return bytes(data)
+
+def _identity_decompress(data):
+    return data
+
+codec_map = {
+        'none': Codec(_identity_compress, _identity_decompress, 0),
+        'zlib': Codec(_zlib_compress, zlib.decompress, 1),
+        }
+
+if lz4 is not None:
+    def _lz4_compress(data, level):
+        return lz4.frame.compress(bytes(data), compression_level=level)
+
+    codec_map['lz4'] = Codec(_lz4_compress, lz4.frame.decompress, 0)
+
+if zstandard is not None:
+    def _zstd_compress(data, level):
+        return zstandard.ZstdCompressor(level=level).compress(bytes(data))
+
+    def _zstd_decompress(data):
+        return zstandard.ZstdDecompressor().decompress(data)
+
+    codec_map['zstd'] = Codec(_zstd_compress, _zstd_decompress, 1)
+
+DEFAULT_CODEC = 'zlib'
+
+
+def register_codec(name, compress, decompress, default_level=0):
+    """Makes a compression codec available to block-compressed files.
+
+    The `compress` function takes bytes and a level, and `decompress` takes
+    compressed bytes.  The codec must be registered under the same name on
+    the master and all slaves (e.g., at import time in the program's module).
+    """
+    codec_map[name] = Codec(compress, decompress, default_level)
+
+
+def get_codec(name):
+    """Returns the Codec registered under the given name."""
+    try:
+        return codec_map[name]
+    except KeyError:
+        raise RuntimeError('Unknown compression codec: "%s" (available: %s)'
+                % (name, ', '.join(sorted(codec_map))))
+
+
+class BlockWriter(BinWriter):
+    """A key-value store using independently compressed blocks of records.
+
+    Each block holds whole records in the BinWriter layout and is compressed
+    separately, so a reader can decompress blocks in a background thread.
+    The codec name is stored in the file header, so any BlockReader can read
+    the file.  Use `codec_writer` to make a writer with a particular codec and
+    level; otherwise, the defaults set by `set_default_codec` are used.
+    """
+    ext = 'mrsc'
+    magic = b'MrsC'
+    codec = None
+    level = None
+
+    @classmethod
+    def spec(cls):
+        if cls.codec is None:
+            return cls.ext
+        elif cls.level is None:
+            return '%s:%s' % (cls.ext, cls.codec)
+        else:
+            return '%s:%s:%s' % (cls.ext, cls.codec, cls.level)
+
+    @classmethod
+    def from_spec(cls, params):
+        """Creates a writer class from the codec and level in a spec."""
+        codec, _, level = params.partition(':')
+        if level:
+            level = int(level)
+        else:
+            level = None
+        return cls.with_codec(codec, level)
+
+    @classmethod
+    def with_codec(cls, codec, level=None):
+        """Returns a subclass that uses the given codec and level."""
+        get_codec(codec)
+        attrs = {'codec': codec, 'level': level}
+        return type(cls.__name__, (cls,), attrs)
+
+    def _write_header(self):
+        codec = self.codec
+        level = self.level
+        if codec is None:
+            codec, level = default_codec
+        self._codec = get_codec(codec)
+        if level is None:
+            level = self._codec.default_level
+        self._level = level
+
+        name = codec.encode('ascii')
+        header = self.magic + struct.pack('B', len(name)) + name
+        self.fileobj.write(header)
+        self._position = len(header)
+
+    def _flush_buffer(self):
+        buf = self._buffer
+        if buf:
+            data = self._codec.compress(buf, self._level)
+            self.fileobj.write(block_struct.pack(len(buf), len(data)))
+            self.fileobj.write(data)
+            del buf[:]
+
+
+class BlockReader(BinReader):
+    """Reads files written by BlockWriter.
+
+    If `threaded` is true (the default), blocks are read and decompressed
+    in a background thread while records are parsed from earlier blocks.
+    The thread stops when the reader is closed or garbage collected.
+    """
+    magic = b'MrsC'
+
+    def __init__(self, fileobj, *args, **kwds):
+        self.threaded = kwds.pop('threaded', True)
+        super(BlockReader, self).__init__(fileobj, *args, **kwds)
+        # The magic cookie is checked along with the codec name.
+        self._magic_read = True
+        self._blocks = None
+        self._queue = None
+        self._stop = threading.Event()
+
+    def _start(self):
+        magic = self._read_exactly(len(self.magic))
+        if magic != self.magic:
+            encoded, _ = hex_encoder(magic)
+            raise RuntimeError('Invalid file header: "%s"' % encoded)
+        name_len, = struct.unpack('B', self._read_exactly(1))
+        name = self._read_exactly(name_len).decode('ascii')
+        self._codec = get_codec(name)
+
+        self._blocks = self._iter_blocks()
+        if self.threaded:
+            self._queue = queue.Queue(READ_AHEAD_BLOCKS)
+            thread = threading.Thread(target=_read_ahead,
+                    name='Block Reader',
+                    args=(weakref.ref(self), self._queue, self._stop))
+            thread.daemon = True
+            thread.start()
+
+    def _iter_blocks(self):
+        """Iterate over decompressed blocks."""
+        decompress = self._codec.decompress
+        while True:
+            header = self._read_exactly(block_struct.size)
+            if not header:
+                return
+            elif len(header) < block_struct.size:
+                raise RuntimeError('File ended unexpectedly')
+            raw_len, compressed_len = block_struct.unpack(header)
+            data = self._read_exactly(compressed_len)
+            if len(data) < compressed_len:
+                raise RuntimeError('File ended unexpectedly')
+            block = decompress(data)
+            if len(block) != raw_len:
+                raise RuntimeError('Corrupt block (expected %s bytes, got %s)'
+                        % (raw_len, len(block)))
+            yield block
+
+    def _read_exactly(self, size):
+        """Reads `size` bytes, or fewer only if the file ends."""
+        return _read_exactly(self.fileobj, size)
+
+    def _next_block(self):
+        if self._queue is None:
+            return next(self._blocks, None)
+        block = self._queue.get()
+        if isinstance(block, Exception):
+            raise block
+        return block
+
+    def _fill_buffer(self, offset, size=READ_BUFFER_SIZE):
+        if self._eof:
+            return False
+        if self._blocks is None:
+            self._start()
+        buf = self._buffer
+        del buf[:offset]
+        self._offset = 0
+        block = self._next_block()
+        if block is None:
+            self._eof = True
+            return False
+        buf += block
+        return True
+
+    def close(self):
+        self._stop.set()
+        super(BlockReader, self).close()
+
+
+def _read_ahead(reader_ref, block_queue, stop):
+    """Fills the queue with blocks from a BlockReader (in a thread).
+
+    Only a weak reference to the reader is kept while waiting for room in
+    the queue, so the thread ends once the reader is closed (setting `stop`)
+    or garbage collected.  The end of the file is marked with None, and
+    errors are passed along to be raised in the reading thread.
+    """
+    while True:
+        reader = reader_ref()
+        if reader is None:
+            return
+        try:
+            block = next(reader._blocks, None)
+        except Exception as e:
+            # The traceback's frames would keep the reader alive.
+            tb = getattr(e, '__traceback__', None)
+            if tb is not None:
+                traceback.clear_frames(tb)
+            block = e
+        del reader
+
+        while True:
+            if stop.is_set() or reader_ref() is None:
+                return
+            try:
+                block_queue.put(block, timeout=0.1)
+                break
+            except queue.Full:
+                pass
+        if block is None or isinstance(block, Exception):
+            return
+
+
+class IndexedWriter(BlockWriter):
+    """A block-structured key-value store with checksums and an index.
+
+    Each block has a header giving its record count, its uncompressed and
+    stored lengths, a CRC-32 of the stored data, and its first and last
+    serialized keys.  After the blocks, a footer index repeats the block
+    headers along with their offsets, so a reader of a seekable file can
+    split it into ranges of blocks or find the blocks for a range of keys.
+    Blocks are uncompressed unless a codec is given with `with_codec`.
+    """
+    ext = 'mrsi'
+    magic = b'MrsI'
+    codec = 'none'
+
+    def _write_header(self):
+        super(IndexedWriter, self)._write_header()
+        self._index = []
+        self._sorted = True
+
+    def _flush_buffer(self):
+        buf = self._buffer
+        if not buf:
+            return
+        count, first_key, last_key, block_sorted = _scan_records(buf)
+        if self._sorted and (not block_sorted or (self._index and
+                first_key < self._index[-1].last_key)):
+            self._sorted = False
+
+        data = self._codec.compress(buf, self._level)
+        crc = zlib.crc32(data) & 0xffffffff
+        info = BlockInfo(self._position, count, len(buf), len(data), crc,
+                first_key, last_key)
+        self._index.append(info)
+
+        header = _pack_block_header(info)
+        self.fileobj.write(header)
+        self.fileobj.write(data)
+        self._position += len(header) + len(data)
+        del buf[:]
+
+    def finish(self):
+        self._flush_buffer()
+        write = self.fileobj.write
+        # An empty block header marks the end of the blocks.
+        end_marker = index_block_struct.pack(0, 0, 0, 0, 0, 0)
+        write(end_marker)
+        index_offset = self._position + len(end_marker)
+        for info in self._index:
+            write(index_offset_struct.pack(info.offset))
+            write(_pack_block_header(info))
+        flags = INDEX_SORTED if self._sorted else 0
+        write(index_trailer_struct.pack(index_offset, len(self._index), flags,
+            self.magic))
+        Writer.finish(self)
+
+
+class IndexedReader(BlockReader):
+    """Reads files written by IndexedWriter.
+
+    Every block's checksum is verified unless `verify` is false.  If
+    `skip_corrupt` is true, corrupted blocks are skipped (with a warning)
+    instead of raising an error.  If `blocks` is a (start, stop) pair, only
+    that range of blocks is read, which requires a seekable file (see
+    `block_range_url`).
+    """
+    magic = b'MrsI'
+    block_splittable = True
+
+    def __init__(self, fileobj, *args, **kwds):
+        self.verify = kwds.pop('verify', True)
+        self.skip_corrupt = kwds.pop('skip_corrupt', False)
+        self.block_range = kwds.pop('blocks', None)
+        super(IndexedReader, self).__init__(fileobj, *args, **kwds)
+        self._index = None
+        self.sorted = None
+
+    def _start(self):
+        # The index is read before the read-ahead thread starts using the
+        # file, since reading the index seeks the same file object.
+        if self.block_range is not None:
+            self.read_index()
+        super(IndexedReader, self)._start()
+
+    def read_index(self):
+        """Returns the list of BlockInfo entries from the footer index.
+
+        Requires a seekable file.  Also sets the `sorted` attribute, which
+        indicates whether all serialized keys in the file are in order.  In
+        a threaded reader, the index must be read before any records.
+        """
+        if self._index is not None:
+            return self._index
+        if self._queue is not None:
+            raise RuntimeError('The index must be read before the records')
+        fileobj = self.fileobj
+        position = fileobj.tell()
+        fileobj.seek(-index_trailer_struct.size, os.SEEK_END)
+        trailer = self._read_exactly(index_trailer_struct.size)
+        index_offset, nblocks, flags, magic = index_trailer_struct.unpack(
+                trailer)
+        if magic != self.magic:
+            raise RuntimeError('Invalid index trailer')
+
+        fileobj.seek(index_offset)
+        index = []
+        for _ in range(nblocks):
+            offset, = index_offset_struct.unpack(
+                    self._read_exactly(index_offset_struct.size))
+            info = self._read_block_header(offset)
+            index.append(info)
+        fileobj.seek(position)
+
+        self._index = index
+        self.sorted = bool(flags & INDEX_SORTED)
+        return index
+
+    def find_blocks(self, first_key=None, last_key=None):
+        """Returns the (start, stop) range of blocks that may contain keys.
+
+        The keys are serialized keys, and the range includes every block that
+        might contain a key from `first_key` to `last_key` (inclusive).  This
+        is only possible if the file was written in sorted order.
+        """
+        index = self.read_index()
+        if not self.sorted:
+            raise RuntimeError('Key lookup requires a sorted file')
+        start = 0
+        stop = len(index)
+        if first_key is not None:
+            last_keys = [info.last_key for info in index]
+            start = bisect.bisect_left(last_keys, first_key)
+        if last_key is not None:
+            first_keys = [info.first_key for info in index]
+            stop = bisect.bisect_right(first_keys, last_key)
+        return start, max(start, stop)
+
+    def _read_block_header(self, offset):
+        header = self._read_exactly(index_block_struct.size)
+        if len(header) < index_block_struct.size:
+            raise RuntimeError('File ended unexpectedly')
+        (count, raw_len, data_len, crc, first_len,
+                last_len) = index_block_struct.unpack(header)
+        first_key = self._read_exactly(first_len)
+        last_key = self._read_exactly(last_len)
+        return BlockInfo(offset, count, raw_len, data_len, crc, first_key,
+                last_key)
+
+    def _iter_blocks(self):
+        """Iterate over decompressed blocks, checking their checksums."""
+        decompress = self._codec.decompress
+        if self.block_range is None:
+            offsets = None
+        else:
+            start, stop = self.block_range
+            offsets = [info.offset for info in self.read_index()[start:stop]]
+
+        i = 0
+        while True:
+            if offsets is not None:
+                if i == len(offsets):
+                    return
+                self.fileobj.seek(offsets[i])
+                i += 1
+            info = self._read_block_header(None)
+            if info.count == 0:
+                return
+            data = self._read_exactly(info.data_len)
+            if len(data) < info.data_len:
+                raise RuntimeError('File ended unexpectedly')
+            if self.verify and (zlib.crc32(data) & 0xffffffff) != info.crc:
+                if self.skip_corrupt:
+                    logger.warning('Skipping a corrupt block of %s records.'
+                            % info.count)
+                    continue
+                raise RuntimeError('Checksum mismatch in a block of %s records'
+                        % info.count)
+            block = decompress(data)
+            if len(block) != info.raw_len:
+                raise RuntimeError('Corrupt block (expected %s bytes, got %s)'
+                        % (info.raw_len, len(block)))
+            yield block
+
+
+BlockInfo = namedtuple('BlockInfo', ('offset', 'count', 'raw_len',
+    'data_len', 'crc', 'first_key', 'last_key'))
+
+
+def _pack_block_header(info):
+    """Returns the serialized header (including keys) for a BlockInfo."""
+    header = index_block_struct.pack(info.count, info.raw_len, info.data_len,
+            info.crc, len(info.first_key), len(info.last_key))
+    return header + info.first_key + info.last_key
+
+
+def _scan_records(buf):
+    """Finds the count, first and last keys, and sortedness of records."""
+    unpack_from = len_struct.unpack_from
+    lensize = len_struct.size
+    end = len(buf)
+    offset = 0
+    count = 0
+    first_key = None
+    last_key = None
+    in_order = True
+    while offset < end:
+        key_len, = unpack_from(buf, offset)
+        key_start = offset + lensize
+        key_end = key_start + key_len
+        value_len, = unpack_from(buf, key_end)
+        offset = key_end + lensize + value_len
+
+        key = bytes(buf[key_start:key_end])
+        if last_key is None:
+            first_key = key
+        elif key < last_key:
+            in_order = False
+        last_key = key
+        count += 1
+    return count, first_key, last_key, in_order
+
+
+def block_splits(index, n):
+    """Divides the blocks of an index into at most n contiguous ranges.
+
+    Returns a list of (start, stop) pairs with roughly equal amounts of
+    uncompressed data, suitable for the `blocks` argument of IndexedReader.
+    """
+    total = sum(info.raw_len for info in index)
+    splits = []
+    start = 0
+    size = 0
+    for i, info in enumerate(index):
+        size += info.raw_len
+        if size * n >= total * (len(splits) + 1):
+            splits.append((start, i + 1))
+            start = i + 1
+    if start < len(index):
+        splits.append((start, len(index)))
+    return splits
+
+
+class ColumnWriter(Writer):
+    """A columnar format for fixed-width numeric keys and values.
+
+    Keys and values are stored as contiguous little-endian arrays in batches
+    of up to `batch_size` records.  Their types are `array` typecodes given
+    by the `key_type` and `value_type` attributes (see `with_types`); by
+    default, keys are 64-bit integers and values are doubles.  Since the
+    data are stored in binary form, serializers are ignored.
+
+    Whole batches may be written with `writebatch`, which accepts arrays
+    (including NumPy arrays) and avoids per-record overhead.
+    """
+    ext = 'mrsa'
+    magic = b'MrsA'
+    key_type = 'q'
+    value_type = 'd'
+    batch_size = COLUMN_BATCH_SIZE
+
+    def __init__(self, fileobj, *args, **kwds):
+        super(ColumnWriter, self).__init__(fileobj, *args, **kwds)
+        self._keys = array.array(self.key_type)
+        self._values = array.array(self.value_type)
+        self.fileobj.write(self.magic + self.key_type.encode('ascii') +
+                self.value_type.encode('ascii'))
+
+    @classmethod
+    def spec(cls):
+        return '%s:%s:%s' % (cls.ext, cls.key_type, cls.value_type)
+
+    @classmethod
+    def from_spec(cls, params):
+        """Creates a writer class from the key and value types in a spec."""
+        key_type, _, value_type = params.partition(':')
+        return cls.with_types(key_type, value_type or cls.value_type)
+
+    @classmethod
+    def with_types(cls, key_type, value_type):
+        """Returns a subclass that uses the given key and value typecodes."""
+        _check_column_type(key_type)
+        _check_column_type(value_type)
+        attrs = {'key_type': key_type, 'value_type': value_type}
+        return type(cls.__name__, (cls,), attrs)
+
+    def writepair(self, kvpair, serialized_key=None):
+        """Write a key-value pair."""
+        key, value = kvpair
+        self._keys.append(key)
+        self._values.append(value)
+        if len(self._keys) >= self.batch_size:
+            self._flush_batch()
+
+    def writepairs(self, kvpairs, serialized_keys=None):
+        """Write all key-value pairs from the given iterable.
+
+        Any `serialized_keys` are ignored.
+        """
+        keys = self._keys
+        values = self._values
+        batch_size = self.batch_size
+        for key, value in kvpairs:
+            keys.append(key)
+            values.append(value)
+            if len(keys) >= batch_size:
+                self._flush_batch()
+
+    def writebatch(self, keys, values):
+        """Write a batch of keys and values given as equal-length sequences."""
+        if len(keys) != len(values):
+            raise RuntimeError('Batch has %s keys but %s values'
+                    % (len(keys), len(values)))
+        self._flush_batch()
+        self._write_batch(len(keys), _column_bytes(keys, self.key_type),
+                _column_bytes(values, self.value_type))
+
+    def _flush_batch(self):
+        keys = self._keys
+        values = self._values
+        if keys:
+            self._write_batch(len(keys), _column_bytes(keys, self.key_type),
+                    _column_bytes(values, self.value_type))
+            del keys[:]
+            del values[:]
+
+    def _write_batch(self, count, key_data, value_data):
+        write = self.fileobj.write
+        write(len_struct.pack(count))
+        write(key_data)
+        write(value_data)
+
+    def finish(self):
+        self._flush_batch()
+        super(ColumnWriter, self).finish()
+
+
+class ColumnReader(Reader):
+    """Reads files written by ColumnWriter.
+
+    Iterating gives key-value pairs, and `iterbatches` gives (keys, values)
+    pairs of whole columns.  The columns are NumPy arrays if NumPy is
+    available (unless `use_numpy` is false) or `array.array` objects
+    otherwise.
+
+    Keys and values are numbers regardless of the serializers, except that if
+    serialized keys or values are requested (with `raw_serializer`), they are
+    pickled, as with the default serializers.  Thus datasets in this format
+    should use the default serializers.
+    """
+    magic = b'MrsA'
+
+    def __init__(self, fileobj, *args, **kwds):
+        self.use_numpy = kwds.pop('use_numpy', numpy is not None)
+        super(ColumnReader, self).__init__(fileobj, *args, **kwds)
+        self.key_type = None
+        self.value_type = None
+
+    def __iter__(self):
+        """Iterate over key-value pairs."""
+        dumps = functools.partial(pickle.dumps, protocol=-1)
+        dumps_key = dumps if self.loads_key is None else None
+        dumps_value = dumps if self.loads_value is None else None
+        for keys, values in self._iter_columns(False):
+            keys = keys.tolist()
+            values = values.tolist()
+            if dumps_key is not None:
+                keys = [dumps_key(key) for key in keys]
+            if dumps_value is not None:
+                values = [dumps_value(value) for value in values]
+            for kvpair in zip(keys, values):
+                yield kvpair
+
+    def iterbatches(self, size=None):
+        """Iterate over (keys, values) pairs of column arrays.
+
+        Each batch has the records of one batch in the file, regardless of
+        the given size.
+        """
+        return self._iter_columns(self.use_numpy)
+
+    def _iter_columns(self, use_numpy):
+        fileobj = self.fileobj
+        header = _read_exactly(fileobj, len(self.magic) + 2)
+        magic = header[:len(self.magic)]
+        if magic != self.magic or len(header) < len(self.magic) + 2:
+            encoded, _ = hex_encoder(magic)
+            raise RuntimeError('Invalid file header: "%s"' % encoded)
+        self.key_type = header[-2:-1].decode('ascii')
+        self.value_type = header[-1:].decode('ascii')
+        key_size = _check_column_type(self.key_type)
+        value_size = _check_column_type(self.value_type)
+
+        while True:
+            count_data = _read_exactly(fileobj, len_struct.size)
+            if not count_data:
+                return
+            elif len(count_data) < len_struct.size:
+                raise RuntimeError('File ended unexpectedly')
+            count, = len_struct.unpack(count_data)
+            key_data = _read_exactly(fileobj, count * key_size)
+            value_data = _read_exactly(fileobj, count * value_size)
+            if len(value_data) < count * value_size:
+                raise RuntimeError('File ended unexpectedly')
+            if use_numpy:
+                keys = numpy.frombuffer(key_data, '<' + self.key_type)
+                values = numpy.frombuffer(value_data, '<' + self.value_type)
+            else:
+                keys = _column_array(key_data, self.key_type)
+                values = _column_array(value_data, self.value_type)
+            yield keys, values
+
+
+def _check_column_type(typecode):
+    """Checks that a typecode is allowed in columns and returns its size."""
+    if len(typecode) != 1 or typecode not in COLUMN_TYPES:
+        raise RuntimeError('Invalid column type: %r' % typecode)
+    return struct.calcsize('<' + typecode)
+
+
+def _column_bytes(seq, typecode):
+    """Converts a sequence or array to little-endian bytes."""
+    if numpy is not None and isinstance(seq, numpy.ndarray):
+        return seq.astype('<' + typecode, copy=False).tobytes()
+    if isinstance(seq, array.array) and seq.typecode == typecode:
+        column = seq
+    else:
+        column = array.array(typecode, seq)
+    if column.itemsize != struct.calcsize('<' + typecode):
+        # The platform's C type has an unusual size, so pack it explicitly.
+        return struct.pack('<%s%s' % (len(column), typecode), *column)
+    if sys.byteorder != 'little':
+        if column is seq:
+            column = array.array(typecode, seq)
+        column.byteswap()
+    if PY3:
+        return column.tobytes()
+    else:
+        return column.tostring()
+
+
+def _column_array(data, typecode):
+    """Converts little-endian bytes to an array."""
+    column = array.array(typecode)
+    if column.itemsize != struct.calcsize('<' + typecode):
+        column.extend(struct.unpack('<%s%s' % (len(data) //
+            struct.calcsize('<' + typecode), typecode), data))
+        return column
+    if PY3:
+        column.frombytes(data)
+    else:
+        column.fromstring(data)
+    if sys.byteorder != 'little':
+        column.byteswap()
+    return column
+
+
+def _read_exactly(fileobj, size):
+    """Reads `size` bytes, or fewer only if the file ends."""
+    data = fileobj.read(size)
+    if len(data) == size or not data:
+        return data
+    chunks = [data]
+    remaining = size - len(data)
+    while remaining:
+        data = fileobj.read(remaining)
+        if not data:
+            break
+        chunks.append(data)
+        remaining -= len(data)
+    return b''.join(chunks)
+
+
+def codec_writer(codec, level=None):
+    """Returns a BlockWriter class that uses the given codec and level.
+
+    The class can be given as the format of any dataset, e.g.:
+        job.map_data(source, self.map, format=codec_writer('zlib', 1))
+    """
+    return BlockWriter.with_codec(codec, level)
+
+
+def set_default_codec(codec, level=None):
+    """Compress intermediate data with the given codec by default.
+
+    This makes BlockWriter the default write format.  A level of None (or
+    negative) selects the codec's default level.
+    """
+    global default_codec, default_write_format
+    get_codec(codec)
+    if level is not None and level < 0:
+        level = None
+    default_codec = (codec, level)
+    default_write_format = BlockWriter
+
+
 def writerformat(extension):
-    """Returns the writer class associated with the given file extension."""
-    return writer_map[extension]
+    """Returns the writer class associated with the given file extension.
+
+    The extension may be a spec with additional parameters (as returned by the
+    `spec` method of the writer class), such as "mrsc:zlib:1".
+    """
+    extension, _, params = extension.partition(':')
+    writer_cls = writer_map[extension]
+    if params:
+        writer_cls = writer_cls.from_spec(params)
+    return writer_cls
 
 
 def fileformat(filename):
     """Returns the Reader class associated with the given file extension."""
+    filename = filename.partition('#')[0]
     extension = os.path.splitext(filename)[1]
     # strip the dot off:
     extension = extension[1:]
@@ -372,16 +1535,43 @@ def fileformat(filename):
 
 
 def open_url(url, **kwds):
-    """Opens a url or file and returns an appropriate key-value reader."""
+    """Opens a url or file and returns an appropriate key-value reader.
+
+    A url with a fragment of the form "#bytes=start-end" (see
+    `byte_range_url`) is opened at the given offset and read with the given
+    `byte_range`.  A url with a fragment of the form "#blocks=start-stop"
+    (see `block_range_url`) is read with the given range of `blocks`.
+    """
     reader_cls = fileformat(url)
 
     parsed_url = urlparse(url, 'file')
+    byte_range = parse_byte_range(parsed_url.fragment)
+    block_range = parse_block_range(parsed_url.fragment)
+    offset = 0
+    if byte_range is not None:
+        kwds['byte_range'] = byte_range
+        offset = max(byte_range[0] - 1, 0)
+        url = url.partition('#')[0]
+    elif block_range is not None:
+        kwds['blocks'] = block_range
+        url = url.partition('#')[0]
+
     if parsed_url.scheme == 'file':
         f = open(parsed_url.path, 'rb')
+        if offset:
+            f.seek(offset)
+        if reader_cls is BinReader:
+            reader_cls = MmapBinReader
     else:
+        headers = {}
         if parsed_url.scheme == 'hdfs':
             server, username, path = hdfs.urlsplit(url)
-            url = hdfs.datanode_url(server, username, path)
+            if offset:
+                url = hdfs.datanode_url(server, username, path, offset=offset)
+            else:
+                url = hdfs.datanode_url(server, username, path)
+        elif offset:
+            headers['Range'] = 'bytes=%s-' % offset
 
         if reader_cls is ZipReader and sys.version_info < (3, 2):
             # In Python <3.2, the gzip module is broken because it depends on
@@ -391,28 +1581,164 @@ def open_url(url, **kwds):
             f = open(filename, 'rb')
             os.unlink(filename)
         else:
-            f = urlopen(url)
+            f = urlopen(Request(url, headers=headers))
+            if 'Range' in headers:
+                _skip_to_range(f, offset)
 
     return reader_cls(f, **kwds)
 
 
+def _skip_to_range(f, offset):
+    """Ensures that a response to a Range request starts at `offset`.
+
+    A server that honors the request answers with status 206 (or 200 with a
+    Content-Range header).  Otherwise, the server sent the whole file, and
+    the bytes before the offset are read and discarded.
+    """
+    content_range = f.info().get('Content-Range')
+    if f.getcode() == 206 or content_range:
+        unit, _, byte_range = (content_range or '').partition(' ')
+        start = byte_range.partition('-')[0]
+        if unit != 'bytes' or start != str(offset):
+            raise RuntimeError('Expected content starting at byte %s but'
+                    ' got range "%s"' % (offset, content_range))
+        return
+
+    logger.debug('Server ignored a range request for %s; skipping %s bytes.'
+            % (f.geturl(), offset))
+    remaining = offset
+    while remaining > 0:
+        data = f.read(min(remaining, READ_BUFFER_SIZE))
+        if not data:
+            break
+        remaining -= len(data)
+
+
+def byte_range_url(url, start, end):
+    """Returns a url for the lines of a file that begin in [start, end)."""
+    return '%s#bytes=%s-%s' % (url, start, end)
+
+
+def parse_byte_range(fragment):
+    """Returns the (start, end) pair from a url fragment, or None.
+
+    >>> parse_byte_range('bytes=100-200')
+    (100, 200)
+    >>> parse_byte_range('') is None
+    True
+    >>>
+    """
+    name, _, value = fragment.partition('=')
+    if name != 'bytes':
+        return None
+    start, _, end = value.partition('-')
+    try:
+        return int(start), int(end)
+    except ValueError:
+        raise RuntimeError('Invalid byte range: %s' % fragment)
+
+
+def block_range_url(url, start, stop):
+    """Returns a url for the blocks [start, stop) of an indexed file."""
+    return '%s#blocks=%s-%s' % (url, start, stop)
+
+
+def parse_block_range(fragment):
+    """Returns the (start, stop) pair from a url fragment, or None.
+
+    >>> parse_block_range('blocks=2-5')
+    (2, 5)
+    >>> parse_block_range('bytes=100-200') is None
+    True
+    >>>
+    """
+    name, _, value = fragment.partition('=')
+    if name != 'blocks':
+        return None
+    start, _, stop = value.partition('-')
+    try:
+        return int(start), int(stop)
+    except ValueError:
+        raise RuntimeError('Invalid block range: %s' % fragment)
+
+
+def url_size(url):
+    """Returns the size of the file at the given url, or None if unknown.
+
+    Sizes are known for local files and for files in HDFS.
+    """
+    parsed_url = urlparse(url, 'file')
+    if parsed_url.scheme == 'file':
+        return os.path.getsize(parsed_url.path)
+    elif parsed_url.scheme == 'hdfs':
+        server, username, path = hdfs.urlsplit(url)
+        return hdfs.hdfs_get_file_status(server, username, path)['length']
+    else:
+        return None
+
+
+def split_url(url, split_size):
+    """Divides a file into urls of about `split_size` bytes.
+
+    Line-oriented files are divided by byte ranges, and local indexed files
+    are divided by ranges of blocks (see `block_splits`).  Files that cannot
+    be split (because of their format or because their size is unknown) are
+    returned as a single url.
+    """
+    reader_cls = fileformat(url)
+    if getattr(reader_cls, 'block_splittable', False):
+        return _split_blocks_url(url, split_size)
+    if not getattr(reader_cls, 'splittable', False):
+        return [url]
+    size = url_size(url)
+    if not size or size <= split_size:
+        return [url]
+    return [byte_range_url(url, start, min(start + split_size, size))
+            for start in range(0, size, split_size)]
+
+
+def _split_blocks_url(url, split_size):
+    """Divides a local indexed file into urls for ranges of blocks."""
+    parsed_url = urlparse(url, 'file')
+    if parsed_url.scheme != 'file' or parsed_url.fragment:
+        return [url]
+    size = os.path.getsize(parsed_url.path)
+    if size <= split_size:
+        return [url]
+    with open(parsed_url.path, 'rb') as f:
+        index = IndexedReader(f, threaded=False).read_index()
+    n = -(-size // split_size)
+    splits = block_splits(index, n)
+    if len(splits) <= 1:
+        return [url]
+    return [block_range_url(url, start, stop) for start, stop in splits]
+
+
 def test():
     import doctest
     doctest.testmod()
 
 
 reader_map = {
+        'mtxt': TextReader,
         'mrsx': HexReader,
         'mrsb': BinReader,
         'mrsz': ZipReader,
+        'mrsc': BlockReader,
+        'mrsi': IndexedReader,
+        'mrsa': ColumnReader,
         }
 writer_map = {
         'mtxt': TextWriter,
         'mrsx': HexWriter,
         'mrsb': BinWriter,
         'mrsz': ZipWriter,
+        'mrsc': BlockWriter,
+        'mrsi': IndexedWriter,
+        'mrsa': ColumnWriter,
         }
 default_read_format = LineReader
 default_write_format = BinWriter
+default_codec = (DEFAULT_CODEC, None)
 
 # vim: et sw=4 sts=4
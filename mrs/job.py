@@ -17,6 +17,9 @@ from __future__ import division, print_function
 
 import multiprocessing
 import os
+import binascii
+import collections
+from itertools import chain, islice
 import select
 import threading
 import time
@@ -28,13 +31,16 @@ from . import computed_data
 from . import datasets
 from . import httpmrs
 from . import registry
-from .serializers import Serializers
+from .serializers import Serializers, dumps_functions
 from . import tasks
 from . import util
 
 from logging import getLogger
 logger = getLogger('mrs')
 
+# Number of input records to sample for range boundaries by default.
+RANGE_SAMPLE_SIZE = 10000
+
 
 class Job(object):
     """Keep track of all operations that need to be performed.
@@ -54,6 +60,11 @@ class Job(object):
         self.default_partition = program.partition
         self.default_reduce_tasks = getattr(opts, 'mrs__reduce_tasks', 1)
         self.default_reduce_splits = 1
+        self.default_split_size = (getattr(opts, 'mrs__split_size', 0)
+                * 1024 * 1024)
+        self.default_skew_sample = getattr(opts, 'mrs__skew_sample', 0)
+        self.default_range_sample = getattr(opts, 'mrs__range_sample', 0)
+        self.default_map_sort = getattr(opts, 'mrs__map_sort', False)
 
     def wait(self, *datasets, **kwds):
         """Wait for any of the given Datasets to complete.
@@ -64,9 +75,16 @@ class Job(object):
         """
         return self._manager.wait(*datasets, **kwds)
 
-    def file_data(self, filenames):
-        """Defines a set of data from a list of urls."""
-        ds = datasets.FileData(filenames)
+    def file_data(self, filenames, split_size=None):
+        """Defines a set of data from a list of urls.
+
+        Line-oriented files larger than `split_size` bytes are divided into
+        several splits.  By default, the split size is given by the
+        --mrs-split-size option, and if it is 0, each file is one split.
+        """
+        if split_size is None:
+            split_size = self.default_split_size
+        ds = datasets.FileData(filenames, split_size=split_size)
         self._manager.submit(ds)
         ds._close_callback = self._manager.close_dataset
         return ds
@@ -102,18 +120,128 @@ class Job(object):
         ds._close_callback = self._manager.close_dataset
         return ds
 
+    def sample_hot_keys(self, input, mapper, splits=None, sample_size=None,
+            threshold=None, **kwds):
+        """Finds heavy keys by running the mapper on a sample of the input.
+
+        Up to `sample_size` input records (by default, the --mrs-skew-sample
+        option), taken from the beginning of each input split, are mapped in
+        the job process.  A key is hot if it has more than `threshold` of the
+        sampled map output (by default, half of a split's fair share with
+        the given number of `splits`).  Returns a list of hot keys, which can
+        be given as `hot_keys` to `map_data` or `reducemap_data`.
+
+        Called from the user-specified run function.
+        """
+        if splits is None:
+            splits = self.default_reduce_tasks
+        if sample_size is None:
+            sample_size = self.default_skew_sample
+        if threshold is None:
+            threshold = 0.5 / splits
+        if sample_size <= 0 or not input.splits:
+            return []
+
+        map_name, mapper = self._named_attr(mapper)
+        self._set_serializers(mapper, kwds)
+        dumps_key, _ = dumps_functions(kwds['serializers'])
+
+        # Keys are counted by serialized key, since they may be unhashable.
+        counts = collections.defaultdict(int)
+        first_keys = {}
+        total = 0
+        for key, value in self._sample(input, map_name, sample_size):
+            if dumps_key is None:
+                serialized_key = key
+            else:
+                serialized_key = dumps_key(key)
+            counts[serialized_key] += 1
+            first_keys.setdefault(serialized_key, key)
+            total += 1
+
+        hot_keys = [first_keys[k] for k, count in counts.items()
+                if count > threshold * total]
+        if hot_keys:
+            logger.info('Found %s hot key(s) in a sample of %s map outputs.'
+                    % (len(hot_keys), total))
+        return hot_keys
+
+    def sample_boundaries(self, input, mapper=None, splits=None,
+            sample_size=None):
+        """Finds key range boundaries from a sample of the input.
+
+        Up to `sample_size` input records (by default, the --mrs-range-sample
+        option, or RANGE_SAMPLE_SIZE if it is not given), taken from the
+        beginning of each input split, are mapped in the job process with
+        the given `mapper` (or used as is if there is no mapper).  Returns a
+        sorted list of `splits` - 1 keys that divide the sampled keys into
+        nearly equal ranges.  Given as `boundaries` to `map_data` or
+        `reducemap_data`, they make the output splits (and thus the outputs
+        of the following reduce tasks) ordered by key, so the reduce output
+        is globally sorted.  All keys must be comparable with each other.
+
+        Called from the user-specified run function.
+        """
+        if splits is None:
+            splits = self.default_reduce_tasks
+        if sample_size is None:
+            sample_size = self.default_range_sample or RANGE_SAMPLE_SIZE
+        if splits <= 1 or sample_size <= 0 or not input.splits:
+            return []
+
+        if mapper is None:
+            map_name = None
+        else:
+            map_name, _ = self._named_attr(mapper)
+        keys = sorted(key for key, value
+                in self._sample(input, map_name, sample_size))
+        if not keys:
+            return []
+        boundaries = [keys[i * len(keys) // splits]
+                for i in range(1, splits)]
+        logger.info('Found %s range boundaries in a sample of %s keys.'
+                % (len(boundaries), len(keys)))
+        return boundaries
+
+    def _sample(self, input, map_name, sample_size):
+        """Iterates over map output for a sample of the input.
+
+        Up to `sample_size` records are taken from the beginning of the input
+        splits.  If `map_name` is None, the input records are not mapped.
+        """
+        if getattr(input, 'computing', False):
+            self.wait(input)
+        per_split = max(sample_size // input.splits, 1)
+        sample = chain.from_iterable(islice(input.stream_split(split),
+            per_split) for split in range(input.splits))
+        if map_name is None:
+            return sample
+        op = tasks.MapOperation(map_name, '', None)
+        return op.map(self._program, sample)
+
     def map_data(self, input, mapper, splits=None, outdir=None, combiner=None,
-            parter=None, **kwds):
+            parter=None, sort=None, hot_keys=(), boundaries=(), **kwds):
         """Define a set of data computed with a map operation.
 
         Specify the input dataset and a mapper function.  The mapper must be
-        in the program instance.
+        in the program instance.  If `sort` is true, each output bucket is
+        sorted by key (the default is given by the --mrs-map-sort option).
+
+        Records with any of the given `hot_keys` (see `sample_hot_keys`) are
+        spread across all splits instead of being partitioned.  A reduce of
+        the resulting dataset then runs the reducer twice (see
+        `reduce_data`), so the reducer must be associative.
+
+        If `boundaries` (see `sample_boundaries`) are given, then records are
+        partitioned by key range instead of with `parter`, and there must be
+        one more split than boundaries.
 
         Called from the user-specified run function.
         """
         if splits is None:
             splits = self.default_reduce_tasks
         assert isinstance(splits, int)
+        self._check_boundaries(splits, hot_keys, boundaries)
 
         if outdir:
             permanent = True
@@ -132,7 +260,13 @@ class Job(object):
         else:
             combine_name = ''
 
-        op = tasks.MapOperation(map_name, combine_name, part_name)
+        if sort is None:
+            sort = self.default_map_sort
+        hot_keys = self._encode_keys(hot_keys, kwds['serializers'])
+        boundaries = self._encode_keys(boundaries, kwds['serializers'])
+
+        op = tasks.MapOperation(map_name, combine_name, part_name, sort, False,
+                hot_keys, boundaries)
         ds = computed_data.ComputedData(op, input, splits=splits, dir=outdir,
                 permanent=permanent, **kwds)
         self._manager.submit(ds)
@@ -146,8 +280,28 @@ class Job(object):
         Specify the input dataset and a reducer function.  The reducer must be
         in the program instance.
 
+        If the input is salted (its hot keys are spread across all splits),
+        then the reducer is first applied to each split, giving partial
+        results for the hot keys, and then applied again to merge them.  The
+        results for other keys are passed through the second pass unchanged.
+
         Called from the user-specified run function.
         """
+        partial, merge_keys = self._reduce_salted(input, reducer)
+        if partial is None:
+            return self._reduce_data(input, reducer, splits, outdir, parter,
+                    **kwds)
+        ds = self._reduce_data(partial, reducer, splits, outdir, parter,
+                merge_keys, **kwds)
+        partial.close()
+        return ds
+
+    def _reduce_data(self, input, reducer, splits=None, outdir=None,
+            parter=None, merge_keys=(), **kwds):
+        """Define a reduce dataset (without checking for a salted input).
+
+        Only the `merge_keys` (if any) are reduced (see `tasks.Operation`).
+        """
         if splits is None:
             splits = self.default_reduce_splits
 
@@ -164,7 +318,8 @@ class Job(object):
         reduce_name, reducer = self._named_attr(reducer)
         self._set_serializers(reducer, kwds, input.serializers)
 
-        op = tasks.ReduceOperation(reduce_name, part_name)
+        op = tasks.ReduceOperation(reduce_name, part_name, False,
+                input.sorted, (), (), merge_keys)
         ds = computed_data.ComputedData(op, input, splits=splits, dir=outdir,
                 permanent=permanent, **kwds)
         self._manager.submit(ds)
@@ -172,13 +327,23 @@ class Job(object):
         return ds
 
     def reducemap_data(self, input, reducer, mapper, splits=None, outdir=None,
-            combiner=None, parter=None, **kwds):
+            combiner=None, parter=None, sort=None, hot_keys=(), boundaries=(),
+            **kwds):
         """Define a set of data computed with the reducemap operation.
 
+        As in `map_data`, `sort` determines whether the output is sorted,
+        `hot_keys` are spread across all splits, and `boundaries` give key
+        ranges.  As in `reduce_data`, a salted input is first reduced to
+        partial results.
+
         Called from the user-specified run function.
         """
         if splits is None:
             splits = self.default_reduce_tasks
+        self._check_boundaries(splits, hot_keys, boundaries)
+        partial, merge_keys = self._reduce_salted(input, reducer)
+        if partial is not None:
+            input = partial
 
         if outdir:
             permanent = True
@@ -198,18 +363,62 @@ class Job(object):
             combine_name = ''
         part_name, _ = self._named_attr(parter)
 
+        if sort is None:
+            sort = self.default_map_sort
+        hot_keys = self._encode_keys(hot_keys, kwds['serializers'])
+        boundaries = self._encode_keys(boundaries, kwds['serializers'])
+
         op = tasks.ReduceMapOperation(reduce_name, map_name, combine_name,
-                part_name)
+                part_name, sort, input.sorted, hot_keys, boundaries,
+                merge_keys)
         ds = computed_data.ComputedData(op, input, splits=splits, dir=outdir,
                 permanent=permanent, **kwds)
         self._manager.submit(ds)
         ds._close_callback = self._manager.close_dataset
+        if partial is not None:
+            partial.close()
         return ds
 
     def progress(self, dataset):
         """Reports the progress (fraction complete) of the given dataset."""
         return self._manager.progress(dataset)
 
+    def _reduce_salted(self, input, reducer):
+        """Reduces a salted input to partial results.
+
+        Returns the partial results and their hot keys (encoded for an
+        Operation's `merge_keys`), or (None, ()) if the input is not salted.
+        The partial results are partitioned with the default partition
+        function into as many splits as the input, so each hot key's partial
+        results end up in a single split.
+        """
+        if not input.salted:
+            return None, ()
+        partial = self._reduce_data(input, reducer, splits=input.splits)
+        hot_keys = tasks.load_keys(input.op.hot_keys, input.serializers)
+        return partial, self._encode_keys(hot_keys, partial.serializers)
+
+    def _check_boundaries(self, splits, hot_keys, boundaries):
+        """Checks that range boundaries fit the number of splits."""
+        if not boundaries:
+            return
+        if len(boundaries) != splits - 1:
+            raise RuntimeError('Expected %s range boundaries for %s splits '
+                    'but got %s.' % (splits - 1, splits, len(boundaries)))
+        if hot_keys:
+            raise RuntimeError('Hot keys cannot be spread across splits '
+                    'that are partitioned by key range.')
+
+    def _encode_keys(self, keys, serializers):
+        """Serializes and hex-encodes keys for an Operation."""
+        dumps_key, _ = dumps_functions(serializers)
+        encoded = []
+        for key in keys:
+            if dumps_key is not None:
+                key = dumps_key(key)
+            encoded.append(binascii.hexlify(key).decode('ascii'))
+        return encoded
+
     def _set_serializers(self, f, kwds, fallback_serializers=None):
         """Add any serializers specified on the given function to kwds."""
 
@@ -122,7 +122,8 @@ def option_parser():
     parser.usage = USAGE
     parser.add_option('-I', '--mrs', dest='mrs', metavar='IMPLEMENTATION',
             action='extend', search=['mrs.main'], default='Serial',
-            help='Mrs Implementation (Serial, Master, Slave, Bypass, etc.)')
+            help='Mrs Implementation (Serial, Local, Master, Slave, Bypass,'
+            ' etc.)')
 
     return parser
 
@@ -189,9 +190,13 @@ class BaseImplementation(ParamObj):
         return job_proc, job_conn, job_quit_pipe
 
     def start_worker_process(self, profile):
+        self.worker_pipe = self.make_worker_process(profile)
+
+    def make_worker_process(self, profile, name='Worker'):
+        """Starts a worker process and returns a pipe to it."""
         from . import worker
 
-        self.worker_pipe, worker_pipe2 = multiprocessing.Pipe()
+        worker_pipe, worker_pipe2 = multiprocessing.Pipe()
 
         w = worker.Worker(self.program_class, worker_pipe2)
         if profile:
@@ -199,14 +204,29 @@ class BaseImplementation(ParamObj):
         else:
             target = w.run
 
-        worker_process = multiprocessing.Process(target=target, name='Worker')
+        worker_process = multiprocessing.Process(target=target, name=name)
         worker_process.start()
+        return worker_pipe
 
     def stop_worker_process(self):
         if self.worker_pipe is not None:
             from . import worker
             self.worker_pipe.send(worker.WorkerQuitRequest())
 
+    def start_worker_processes(self, profile, workers):
+        """Starts the given number of worker processes."""
+        if workers == 1:
+            names = ['Worker']
+        else:
+            names = ['Worker-%s' % i for i in range(workers)]
+        self.worker_pipes = [self.make_worker_process(profile, name)
+                for name in names]
+
+    def stop_worker_processes(self):
+        from . import worker
+        for pipe in self.worker_pipes:
+            pipe.send(worker.WorkerQuitRequest())
+
 
 class Bypass(BaseImplementation):
     """Runs a program, bypassing the MapReduce functions."""
@@ -224,6 +244,7 @@ class Implementation(BaseImplementation):
     shared = None
     use_bucket_server = False
     worker_pipe = None
+    worker_pipes = ()
 
     def _main(self, opts, args):
         from . import job
@@ -233,6 +254,11 @@ class Implementation(BaseImplementation):
         if self.runner_class is None:
             raise NotImplementedError('Subclasses must set runner_class.')
 
+        codec = getattr(opts, 'mrs__codec', '')
+        if codec:
+            from . import fileformats
+            fileformats.set_default_codec(codec, opts.mrs__codec_level)
+
         if self.shared:
             jobdir = util.mktempdir(self.shared, 'mrs.job_')
             self.use_bucket_server = False
@@ -257,8 +283,8 @@ class Implementation(BaseImplementation):
 
             self.start_worker_process(opts.mrs__profile)
 
-            self.runner = self.runner_class(self.program_class, opts, args,
-                    job_conn, jobdir, default_dir, self.worker_pipe)
+            self.runner = self.make_runner(opts, args, job_conn, jobdir,
+                    default_dir)
 
             if opts.mrs__profile:
                 exitcode = util.profile_call(self.runner.run, (), {},
@@ -280,6 +306,11 @@ class Implementation(BaseImplementation):
                 util.remove_recursive(default_dir)
         return exitcode
 
+    def make_runner(self, opts, args, job_conn, jobdir, default_dir):
+        """Creates the runner, giving it the worker pipe."""
+        return self.runner_class(self.program_class, opts, args, job_conn,
+                jobdir, default_dir, self.worker_pipe)
+
     def sigusr1_handler(self, signum, stack_frame):
         # Apparently the setting siginterrupt can get reset on some platforms.
         signal.siginterrupt(signal.SIGUSR1, False)
@@ -314,6 +345,13 @@ class TaskRunnerParams(ParamObj):
         shared=Param(doc='Global shared area for temporary storage (optional)'),
         reduce_tasks=Param(default=1, type='int',
             doc='Default number of reduce tasks'),
+        range_sample=Param(default=0, type='int',
+            doc='Sample this many map inputs to partition the map output by'
+            ' key range, making the reduce output globally sorted'
+            ' (0 to disable)'),
+        skew_sample=Param(default=0, type='int',
+            doc='Sample this many map inputs to spread hot keys across reduce'
+            ' tasks (0 to disable; the reducer must be associative)'),
         timing_interval=Param(default=0, type='float',
             doc="Interval (seconds) between outputting timing statistics"),
         sequential_datasets=Param(type='bool',
@@ -322,6 +360,18 @@ class TaskRunnerParams(ParamObj):
             doc='Maximum number of tolerable failures per task'),
         max_sort_size=Param(default=100, type='int',
             doc='Maximum amount of data (in MB) to sort in RAM'),
+        sort_processes=Param(default=1, type='int',
+            doc='Number of processes for sorting the input of a reduce task'),
+        map_sort=Param(type='bool',
+            doc='Sort the output of each map task by key'),
+        codec=Param(default='',
+            doc='Compress intermediate data with the given codec'
+                ' (e.g., zlib, lz4, zstd)'),
+        codec_level=Param(default=-1, type='int',
+            doc='Compression level (-1 for the default of the codec)'),
+        split_size=Param(default=0, type='int',
+            doc='Split input text files into pieces of this many MB'
+                ' (0 for one split per file)'),
         )
 
 
@@ -339,6 +389,36 @@ class MockParallel(Implementation, FileParams, TaskRunnerParams):
     runner_class = runner.MockParallelRunner
 
 
+class Local(Implementation, FileParams, TaskRunnerParams):
+    """MapReduce execution on a pool of worker processes on one machine.
+
+    Like MockParallel, this creates all of the tasks of the normal parallel
+    implementation and stores intermediate data in local temporary files,
+    but it runs up to --mrs-workers tasks at once.  Workers are given bucket
+    paths directly, so no master, slaves, RPC, or bucket server is needed.
+    """
+    _params = dict(
+        workers=Param(default=0, type='int',
+            doc='Number of worker processes (0 for one per CPU)'),
+        )
+
+    runner_class = runner.LocalRunner
+
+    def start_worker_process(self, profile):
+        workers = self.workers
+        if workers < 1:
+            workers = multiprocessing.cpu_count()
+        self.start_worker_processes(profile, workers)
+
+    def stop_worker_process(self):
+        self.stop_worker_processes()
+
+    def make_runner(self, opts, args, job_conn, jobdir, default_dir):
+        """Creates the runner, giving it the pool of worker pipes."""
+        return self.runner_class(self.program_class, opts, args, job_conn,
+                jobdir, default_dir, self.worker_pipes)
+
+
 class NetworkParams(ParamObj):
     _params = dict(
         port=Param(default=0, type='int', shortopt='-P',
@@ -354,6 +434,9 @@ class Master(Implementation, FileParams, NetworkParams, TaskRunnerParams):
     _params = dict(
         runfile=Param(default='',
             doc="Server's RPC port will be written here"),
+        speculative_slowdown=Param(default=0, type='float',
+            doc='Back up tasks running this many times longer than the'
+            ' median task (0 to disable)'),
         )
 
     runner_class = master.MasterRunner
@@ -367,8 +450,12 @@ class Master(Implementation, FileParams, NetworkParams, TaskRunnerParams):
 class Slave(BaseImplementation, FileParams, NetworkParams):
     _params = dict(
         master=Param(shortopt='-M', doc='URL of the Master RPC server'),
+        workers=Param(default=1, type='int',
+            doc='Number of worker processes (tasks to run at once)'),
         )
 
+    worker_pipes = ()
+
     def _main(self, opts, args):
         """Run Mrs Slave
 
@@ -381,14 +468,18 @@ class Slave(BaseImplementation, FileParams, NetworkParams):
             logger.critical('No master URL specified.')
             return 1
 
-        self.start_worker_process(opts.mrs__profile)
+        if self.workers < 1:
+            logger.critical('The number of workers must be positive.')
+            return 1
+
+        self.start_worker_processes(opts.mrs__profile, self.workers)
 
         s = slave.Slave(self.program_class, self.master, self.tmpdir,
-                self.pingdelay, self.timeout, self.worker_pipe)
+                self.pingdelay, self.timeout, self.worker_pipes)
         try:
             exitcode = s.run()
         finally:
-            self.stop_worker_process()
+            self.stop_worker_processes()
         return exitcode
 
 # vim: et sw=4 sts=4
@@ -24,6 +24,7 @@ from __future__ import division, print_function
 
 import hashlib
 import sys
+import zlib
 
 from . import fileformats
 from . import serializers
@@ -67,7 +68,12 @@ class MapReduce(object):
     Attributes:
         opts: An optparse.Values instance with all command-line options.
         args: A list of command-line positional arguments.
+        immutable_data: If true, the program promises that its map and reduce
+            functions never modify their input keys and values, so the Serial
+            implementation can pass them along without copying.
     """
+    immutable_data = False
+
     def map(self, key, value):
         """Map function.
 
@@ -150,7 +156,15 @@ class MapReduce(object):
             combiner = self.combine
         except AttributeError:
             combiner = None
-        interm_data = job.map_data(source_data, self.map, combiner=combiner)
+        if job.default_range_sample:
+            boundaries = job.sample_boundaries(source_data, self.map)
+            hot_keys = ()
+        else:
+            boundaries = ()
+            # Empty unless the --mrs-skew-sample option is given.
+            hot_keys = job.sample_hot_keys(source_data, self.map)
+        interm_data = job.map_data(source_data, self.map, combiner=combiner,
+                hot_keys=hot_keys, boundaries=boundaries)
         return interm_data
 
     def make_reduce_data(self, job, interm_data):
@@ -182,6 +196,16 @@ class MapReduce(object):
             big_endian_digest = ''.join(reversed(digest))
             return int(big_endian_digest.encode('hex'), 16) % n
 
+    def crc32_partition(self, key, serialized_key, n):
+        """A partition function using the CRC-32 of the serialized key.
+
+        Like md5_partition, it spreads keys evenly even if they are not
+        contiguous, and it gives the same split in every process (unlike
+        Python's randomized hash), but it is several times faster.  The
+        checksum is masked because Python 2 may return a negative value.
+        """
+        return (zlib.crc32(serialized_key) & 0xffffffff) % n
+
     def hash_partition(self, key, serialized_key, n):
         """A partition function that hashes the key (DEPRECATED).
 
@@ -209,8 +233,8 @@ class MapReduce(object):
         """
         return int(key) % n
 
-    # The default partition function is md5_partition:
-    partition = md5_partition
+    # The default partition function is crc32_partition:
+    partition = crc32_partition
 
     def bypass(self):
         """Bypass implementation.
@@ -261,6 +285,7 @@ class MapReduce(object):
     raw_serializer = serializers.raw_serializer
     int_serializer = serializers.int_serializer
     str_serializer = serializers.str_serializer
+    sortable_int_serializer = serializers.sortable_int_serializer
 
 
 # May be deprecated soon:
@@ -52,13 +52,15 @@ if not PY3:
 
 INITIAL_PEON_THREADS = 4
 MAX_PEON_THREADS = 20
+# Interval (in seconds) between checks for straggling tasks to back up.
+SPECULATION_INTERVAL = 1.0
 
 
 class MasterRunner(runner.TaskRunner):
     """A TaskRunner that assigns tasks to remote slaves.
 
     Attributes:
-        idle_slaves: a set of slaves that are ready to be assigned
+        idle_slaves: the slaves with idle slots that are ready to be assigned
         result_maps: a dict mapping a dataset id to the corresponding result
             map, which keeps track of which slaves produced which data
     """
@@ -83,6 +85,7 @@ class MasterRunner(runner.TaskRunner):
         self.event_loop.register_fd(self.sched_pipe, self.read_sched_pipe)
         self.slaves = Slaves(sched_write_pipe, self.chore_queue,
                 self.opts.mrs__timeout, self.opts.mrs__pingdelay)
+        self.sched_speculation()
 
         try:
             self.start_rpc_server()
@@ -144,23 +147,28 @@ class MasterRunner(runner.TaskRunner):
         for slave in changed_slaves:
             if slave.alive():
                 self.dead_slaves.discard(slave)
-                if not slave.busy():
-                    logger.debug('Adding slave %s to idle_slaves.' % slave.id)
-                    self.idle_slaves.add(slave)
+                idle_slots = slave.idle_slots()
+                if idle_slots:
+                    logger.debug('Adding slave %s to idle_slaves (%s slots).'
+                            % (slave.id, idle_slots))
+                self.idle_slaves.add(slave, idle_slots)
             else:
                 self.dead_slaves.add(slave)
                 self.idle_slaves.discard(slave)
-                assignment = slave.current_assignment()
-                if assignment is not None:
-                    dataset_id, task_index = assignment
+                for dataset_id, task_index in slave.current_assignments():
                     self.task_lost(dataset_id, task_index)
 
         for slave, dataset_id, source, urls in results:
             try:
-                self.result_maps[dataset_id].add(slave, source)
+                result_map = self.result_maps[dataset_id]
             except KeyError:
                 # Dataset already deleted, so this source should be removed.
-                self.remove_sources(dataset_id, (slave, source), delete=True)
+                self.remove_sources(dataset_id, [(slave, source)],
+                        delete=True)
+                continue
+            repeated = slave in result_map.get(source)
+            if not repeated:
+                result_map.add(slave, source)
 
             # Note: if this is the last task in the dataset, this will wake
             # up datasets.  Thus this happens _after_ slaves are added to
@@ -169,6 +177,12 @@ class MasterRunner(runner.TaskRunner):
             if not success:
                 logger.info('Ignoring a redundant result (%s, %s).' %
                         (dataset_id, source))
+                if not repeated:
+                    # Another slave finished first (e.g., the task was
+                    # backed up), so this slave's output is not needed.
+                    result_map.remove(slave, source)
+                    self.remove_sources(dataset_id, [(slave, source)],
+                            delete=True)
 
         # Add one peon thread for each new active slave (minus dead slaves).
         if self.peon_thread_count < MAX_PEON_THREADS:
@@ -177,20 +191,24 @@ class MasterRunner(runner.TaskRunner):
             for i in range(new_peon_thread_count - self.peon_thread_count):
                 self.start_peon_thread()
 
-        chore_list = []
+        assigned_slaves = []
         while self.idle_slaves:
             # find the next job to run
             next = self.next_task()
+            slave = None
             if next is None:
-                # TODO: duplicate currently assigned tasks here (while adding
-                # a mechanism for unassigning duplicate tasks once the result
-                # comes back).
-                break
+                # With idle slots and no new work, back up stragglers.  The
+                # first copy to finish wins, and the other is ignored.
+                slave = self.idle_slaves.pop()
+                next = self.next_backup_task(slave.current_assignments())
+                if next is None:
+                    self.idle_slaves.add(slave,
+                            self.idle_slaves.slots(slave) + 1)
+                    break
             dataset_id, source = next
             dataset = self.datasets[dataset_id]
 
-            slave = None
-            if dataset.affinity:
+            if slave is None and dataset.affinity:
                 # Slave-task affinity: when possible, assign to the slave that
                 # computed the task with the same source id in the input
                 # dataset.
@@ -203,22 +221,79 @@ class MasterRunner(runner.TaskRunner):
                 if input_results is not None:
                     for s in input_results.get(source):
                         if s in self.idle_slaves:
-                            self.idle_slaves.remove(s)
+                            self.idle_slaves.add(s,
+                                    self.idle_slaves.slots(s) - 1)
                             slave = s
                             break
+            if slave is None:
+                slave = self.pop_local_slave(dataset, source)
             if slave is None:
                 slave = self.idle_slaves.pop()
 
             if slave.busy():
                 logger.error('Slave %s mistakenly in idle_slaves.' % slave.id)
+                self.idle_slaves.discard(slave)
                 self.task_lost(*next)
                 continue
 
             slave.prepare_assignment(next, self.datasets)
-            chore_item = slave.send_assignment, ()
-            chore_list.append(chore_item)
+            if slave not in assigned_slaves:
+                assigned_slaves.append(slave)
+
+        # Assignments to the same slave are sent together in one RPC.
+        chore_list = [(slave.send_assignments, ())
+                for slave in assigned_slaves]
         self.chore_queue.do_many(chore_list)
 
+    def pop_local_slave(self, dataset, task_index):
+        """Takes an idle slot near the input of the given task.
+
+        Each host is scored by the number of bytes of the task's input that
+        were computed by slaves on that host, and a slot is taken from the
+        idle host with the highest score.  Returns the slave, or None if no
+        host with an idle slot has any of the input.
+        """
+        try:
+            input_results = self.result_maps[dataset.input_id]
+        except KeyError:
+            # The input is not a computed dataset (e.g., FileData).
+            return None
+        input_ds = self.datasets[dataset.input_id]
+
+        host_scores = collections.defaultdict(int)
+        for bucket in input_ds[:, task_index]:
+            if not bucket.url:
+                continue
+            # Buckets of unknown size still count for something.
+            nbytes = max(bucket.nbytes, 1)
+            hosts = set(s.host for s in input_results.get(bucket.source))
+            for host in hosts:
+                if self.idle_slaves.host_slots(host):
+                    host_scores[host] += nbytes
+
+        if not host_scores:
+            return None
+        host = max(host_scores, key=host_scores.get)
+        return self.idle_slaves.pop(host)
+
+    def next_backup_task(self, exclude=()):
+        """Returns a straggling task to back up, or None if there is none.
+
+        Tasks in `exclude` (such as those already running on the slave that
+        would run the backup) are skipped.
+        """
+        slowdown = self.opts.mrs__speculative_slowdown
+        if slowdown <= 0:
+            return None
+        for ds in self.runnable_datasets:
+            tasklist = self.tasklists.get(ds.id)
+            if tasklist is None:
+                continue
+            t = tasklist.pop_straggler(slowdown, exclude)
+            if t is not None:
+                return t
+        return None
+
     def available_workers(self):
         """Returns the total number of idle workers."""
         return len(self.idle_slaves)
@@ -247,6 +322,16 @@ class MasterRunner(runner.TaskRunner):
                 for slave, source in slave_source_list]
         self.chore_queue.do_many(items)
 
+    def sched_speculation(self):
+        """Periodically wakes up the scheduler to look for stragglers."""
+        if self.opts.mrs__speculative_slowdown > 0:
+            self.chore_queue.do(self.do_speculation,
+                    delay=SPECULATION_INTERVAL)
+
+    def do_speculation(self):
+        self.slaves.trigger_sched()
+        self.sched_speculation()
+
     def sched_timing_stats(self):
         if self.opts.mrs__timing_interval > 0:
             self.chore_queue.do(self.do_timing_stats,
@@ -277,6 +362,10 @@ class ResultMap(object):
         """Returns the list of slaves that computed the given source."""
         return self._dict[source]
 
+    def remove(self, slave, source):
+        """Forgets that the given slave computed the given source."""
+        self._dict[source].remove(slave)
+
     def all(self):
         """Iterate over slave, source pairs."""
         for source, slave_list in self._dict.items():
@@ -315,11 +404,12 @@ class MasterInterface(object):
 
     @httpmrs.uses_host
     def xmlrpc_signin(self, version, cookie, slave_port, program_hash,
-            host=None):
+            slots=1, host=None):
         """Slave reporting for duty.
 
-        It returns the slave_id and option dictionary.  Returns
-        (-1, '', '', {}, []) if the signin is rejected.
+        The slave can run up to `slots` tasks at once.  It returns the
+        slave_id and option dictionary.  Returns (-1, '', '', {}, []) if the
+        signin is rejected.
         """
         if version != __version__:
             logger.warning('Slave tried to sign in with mismatched version.')
@@ -329,11 +419,16 @@ class MasterInterface(object):
             logger.warning('Slave tried to sign in with nonmatching code.')
             return -1, '', '', {}, []
 
-        slave = self.slaves.new_slave(host, slave_port, cookie)
+        if slots < 1:
+            logger.warning('Slave tried to sign in with no slots.')
+            return -1, '', '', {}, []
+
+        slave = self.slaves.new_slave(host, slave_port, cookie, slots)
         if slave is None:
             logger.warning('Slave tried to sign in during shutdown.')
             return -1, '', '', {}, []
-        logger.info('New slave %s on host %s' % (slave.id, host))
+        logger.info('New slave %s on host %s (%s slots)'
+                % (slave.id, host, slots))
 
         return (slave.id, host, self.jobdir, self.opts_dict, self.args)
 
@@ -356,13 +451,16 @@ class MasterInterface(object):
             host=None):
         """Slave is done with the task it was working on.
 
-        The output is available in the list of urls.
+        The output is available in the list of urls, which contains a
+        (split, url, nbytes, nrecords) list for each output bucket.
         """
         slave = self.slaves.get_slave(slave_id, cookie)
         if slave is not None:
             logger.debug('Slave %s reported completion of task: %s, %s'
                     % (slave_id, dataset_id, source))
             slave.update_timestamp()
+            urls = [(split, url, int(nbytes), int(nrecords))
+                    for split, url, nbytes, nrecords in urls]
             self.slaves.slave_result(slave, dataset_id, source, urls)
             return True
         else:
@@ -404,12 +502,16 @@ class RemoteSlave(object):
     """The master's view of a remote slave.
 
     The master can use this object to make assignments, check status, etc.
+
+    Attributes:
+        slots: the number of tasks that the slave can run at once
     """
-    def __init__(self, slave_id, host, port, cookie, slaves):
+    def __init__(self, slave_id, host, port, cookie, slaves, slots=1):
         self.id = slave_id
         self.host = host
         self.port = port
         self.cookie = cookie
+        self.slots = slots
         self.slaves = slaves
         self.chore_queue = slaves.chore_queue
         self.pingdelay = slaves.pingdelay
@@ -418,10 +520,10 @@ class RemoteSlave(object):
         self._rpc = httpmrs.TimeoutServerProxy(uri, slaves.rpc_timeout)
         self._rpc_lock = threading.Lock()
 
-        self._assignment = None
+        self._assignments = set()
         self._assignment_lock = threading.Lock()
-        self._rpc_func = None
-        self._rpc_args = None
+        self._pending_tasks = []
+        self._pending_lock = threading.Lock()
 
         # The `_state` is either 'alive', 'failed', 'exiting', or 'exited'
         self._state = 'alive'
@@ -437,59 +539,62 @@ class RemoteSlave(object):
         return (cookie == self.cookie)
 
     def busy(self):
-        """Indicates whether the slave has a current assignment."""
-        return (self._assignment is not None)
+        """Indicates whether all of the slave's slots have assignments."""
+        return len(self._assignments) >= self.slots
+
+    def idle_slots(self):
+        """Returns the number of slots without a current assignment."""
+        return max(self.slots - len(self._assignments), 0)
 
-    def pop_assignment(self):
-        """Removes and returns the current assignment."""
+    def pop_assignments(self):
+        """Removes and returns the list of current assignments."""
         with self._assignment_lock:
-            assignment = self._assignment
-            self._assignment = None
-            return assignment
+            assignments = list(self._assignments)
+            self._assignments.clear()
+            return assignments
 
-    def current_assignment(self):
-        """Returns the current assignment.
+    def current_assignments(self):
+        """Returns a list of the current assignments.
 
         Note that this could change in another thread (so be careful).
-        You usually want pop_assignment instead.
+        You usually want pop_assignments instead.
         """
-        return self._assignment
+        with self._assignment_lock:
+            return list(self._assignments)
 
     def set_assignment(self, new_assignment):
-        """Sets the assignment to new_assignment.
+        """Adds new_assignment to the current assignments.
 
-        Assumes that the assignment is currently None.  Returns True if the
+        Assumes that the slave has an idle slot.  Returns True if the
         operation succeeds.
         """
         with self._assignment_lock:
-            if self._assignment is None:
-                self._assignment = new_assignment
+            if (len(self._assignments) < self.slots and
+                    new_assignment not in self._assignments):
+                self._assignments.add(new_assignment)
                 return True
             else:
                 return False
 
     def clear_assignment(self, old_assignment):
-        """Sets the assignment to None.
+        """Removes old_assignment from the current assignments.
 
-        Assumes that the assignment is currently `old_assignment` or `None`.
-        Returns True if the old assignment was set or False if it was None.
+        Returns True if the old assignment was set or False if it was not.
         """
         with self._assignment_lock:
-            if self._assignment == old_assignment:
-                self._assignment = None
+            try:
+                self._assignments.remove(old_assignment)
                 return True
-            elif self._assignment is None:
-                return False
-            else:
-                logger.error("clear_assignment called with an invalid argument")
+            except KeyError:
                 return False
 
     def prepare_assignment(self, assignment, datasets):
         """Sets up an RPC request to make the slave work on the assignment.
 
         Called from the Runner.  Note that the assignment will _not_ actually
-        happen until `send_assignment` is subsequently called.  This is the
-        responsibility of the caller.
+        happen until `send_assignments` is subsequently called.  This is the
+        responsibility of the caller.  Several assignments may be prepared
+        before they are sent together.
         """
         success = self.set_assignment(assignment)
         assert success
@@ -502,22 +607,33 @@ class RemoteSlave(object):
         task = dataset.get_task(task_index, datasets, '')
         task_args = task.to_args()
 
-        with self._rpc_lock:
-            assert self._rpc_args is None
-            self._rpc_func = self._rpc.start_task
-            self._rpc_args = task_args + (self.cookie,)
+        with self._pending_lock:
+            self._pending_tasks.append(task_args)
 
-    def send_assignment(self):
+    def send_assignments(self):
+        """Sends all prepared assignments to the slave in a single RPC."""
         with self._rpc_lock:
+            with self._pending_lock:
+                task_list = self._pending_tasks
+                self._pending_tasks = []
+            if not task_list:
+                # Already sent along with an earlier batch.
+                return
             if not self.alive():
                 logger.warning('Canceling RPC call because slave %s is no'
                         ' longer alive.' % self.id)
                 return
 
-            logger.debug('Sending assignment to slave %s: %s, %s'
-                    % (self.id, self._rpc_args[2], self._rpc_args[3]))
+            logger.debug('Sending %s assignment(s) to slave %s: %s' %
+                    (len(task_list), self.id, ', '.join('%s, %s' %
+                        (args[2], args[3]) for args in task_list)))
             try:
-                success = self._rpc_func(*self._rpc_args)
+                if len(task_list) == 1:
+                    started = [self._rpc.start_task(
+                            *(task_list[0] + (self.cookie,)))]
+                else:
+                    started = self._rpc.start_tasks(task_list, self.cookie)
+                success = True
             except Fault as f:
                 logger.error('Fault in RPC to slave %s: %s' %
                         (self.id, f.faultString))
@@ -533,12 +649,19 @@ class RemoteSlave(object):
             if success:
                 self.update_timestamp()
 
-            self._rpc_func = None
-            self._rpc_args = None
-
         if not success:
             logger.info('Failed to assign a task to slave %s.' % self.id)
             self.critical_failure()
+            return
+
+        # A slave that rejects a task (e.g., if all of its workers are busy)
+        # is still usable, so only the rejected tasks are requeued.
+        for args, task_started in zip(task_list, started):
+            if not task_started:
+                dataset_id, task_index = args[2], args[3]
+                logger.warning('Slave %s rejected task %s, %s.'
+                        % (self.id, dataset_id, task_index))
+                self.slaves.slave_failed(self, dataset_id, task_index)
 
     def remove(self, dataset_id, source, delete):
         with self._rpc_lock:
@@ -735,7 +858,7 @@ class Slaves(object):
         else:
             return None
 
-    def new_slave(self, host, slave_port, cookie):
+    def new_slave(self, host, slave_port, cookie, slots=1):
         """Add and return a new slave.
 
         Also set slave.id for the new slave.  Note that the slave will not be
@@ -746,7 +869,8 @@ class Slaves(object):
                 return None
             slave_id = self._next_slave_id
             self._next_slave_id += 1
-            slave = RemoteSlave(slave_id, host, slave_port, cookie, self)
+            slave = RemoteSlave(slave_id, host, slave_port, cookie, self,
+                    slots)
             self._slaves[slave_id] = slave
         return slave
 
@@ -755,7 +879,7 @@ class Slaves(object):
             if not slave.resurrect():
                 return
 
-        if slave.busy():
+        if slave.current_assignments():
             logger.error('Slave %s reported ready but has an assignment; '
                     'check the slave logs for errors.' % slave.id)
 
@@ -853,86 +977,107 @@ class Slaves(object):
 
 
 class IdleSlaves(object):
-    """A priority-queue-like container of Slave objects.
+    """A priority-queue-like container of Slave objects with idle slots.
+
+    Each slave has some number of idle slots (one by default), and `pop`
+    takes one slot from a slave on the host with the most idle slots.
 
     Attributes:
         _host_map: A map from a host to the corresponding set of slaves.
+        _host_slots: A map from a host to its total number of idle slots.
         _counter: A dictionary that maps a count c to a set of hosts with c
-            idle slaves.
+            idle slots.
+        _all_slaves: A map from each slave to its number of idle slots.
     """
     def __init__(self):
         self._host_map = collections.defaultdict(set)
+        self._host_slots = collections.defaultdict(int)
         self._counter = collections.defaultdict(set)
-        self._all_slaves = set()
+        self._all_slaves = {}
         self._max_count = 0
+        self._total_slots = 0
 
-    def add(self, slave):
-        host = slave.host
+    def add(self, slave, slots=1):
+        """Sets the number of idle slots for the given slave.
 
-        # Remove the host's slave set from the counter.
-        slave_set = self._host_map[host]
-        self._remove_from_counter(host, len(slave_set))
-
-        # Add the host to the slave_set.
-        slave_set.add(slave)
-        self._all_slaves.add(slave)
-
-        # Reinsert the slave_set with its new count.
-        self._add_to_counter(host, len(slave_set))
+        Adding a slave that is already present replaces its slot count.
+        """
+        if slots <= 0:
+            self.discard(slave)
+            return
+        old_slots = self._all_slaves.get(slave, 0)
+        self._all_slaves[slave] = slots
+        self._host_map[slave.host].add(slave)
+        self._change_host_slots(slave.host, slots - old_slots)
 
     def remove(self, slave):
-        """Remove the given slave from the set.
+        """Remove the given slave (and all of its slots) from the set.
 
         If it is not a member, raise a KeyError.
         """
-        self._all_slaves.remove(slave)
-        host = slave.host
-
-        # Find the host's slave set and remove it from the counter.
-        slave_set = self._host_map[host]
-        self._remove_from_counter(host, len(slave_set))
-
-        # Remove the host from the slave_set.
-        slave_set.remove(slave)
-
-        # Reinsert the slave_set with its new count.
-        self._add_to_counter(host, len(slave_set))
+        slots = self._all_slaves.pop(slave)
+        self._host_map[slave.host].remove(slave)
+        self._change_host_slots(slave.host, -slots)
 
     def discard(self, slave):
         """Remove the given slave from the set, if present."""
-        self._all_slaves.discard(slave)
-        host = slave.host
-
-        # Find the host's slave set and remove it from the counter.
-        slave_set = self._host_map[host]
-        self._remove_from_counter(host, len(slave_set))
-
-        # Discard the host from the slave_set.
-        slave_set.discard(slave)
-
-        # Reinsert the slave_set with its new count.
-        self._add_to_counter(host, len(slave_set))
-
-    def pop(self):
-        """Remove and return a slave from the most idle host."""
-        # Find and remove a host with the maximum number of idle slaves.
-        counter_set = self._counter[self._max_count]
-        host = counter_set.pop()
-        if not counter_set:
-            self._max_count -= 1
-
-        # Pop a slave and reinsert the host (with its new count).
-        slave_set = self._host_map[host]
-        slave = slave_set.pop()
-        self._all_slaves.remove(slave)
-        self._add_to_counter(host, len(slave_set))
+        if slave in self._all_slaves:
+            self.remove(slave)
+
+    def pop(self, host=None):
+        """Take an idle slot and return its slave.
+
+        The slot is taken from the given host, or from the host with the most
+        idle slots if `host` is None.  Raises a KeyError if there is no idle
+        slot.
+        """
+        if host is None:
+            if not self._max_count:
+                raise KeyError('pop from an empty IdleSlaves')
+            # Find a host with the maximum number of idle slots.
+            counter_set = self._counter[self._max_count]
+            host = next(iter(counter_set))
+        elif not self._host_slots.get(host):
+            raise KeyError('no idle slots on host %s' % host)
+
+        # Take a slot from the host's slave with the most idle slots.
+        slave = max(self._host_map[host], key=self._all_slaves.get)
+        slots = self._all_slaves[slave] - 1
+        if slots:
+            self._all_slaves[slave] = slots
+        else:
+            del self._all_slaves[slave]
+            self._host_map[host].remove(slave)
+        self._change_host_slots(host, -1)
         return slave
 
+    def slots(self, slave):
+        """Returns the number of idle slots of the given slave."""
+        return self._all_slaves.get(slave, 0)
+
+    def host_slots(self, host):
+        """Returns the total number of idle slots on the given host."""
+        return self._host_slots.get(host, 0)
+
+    def _change_host_slots(self, host, delta):
+        if not delta:
+            return
+        host_size = self._host_slots[host]
+        self._remove_from_counter(host, host_size)
+        host_size += delta
+        self._host_slots[host] = host_size
+        self._total_slots += delta
+        self._add_to_counter(host, host_size)
+
     def _add_to_counter(self, host, host_size):
-        counter_set = self._counter[host_size]
-        counter_set.add(host)
-        if host_size > self._max_count:
-            self._max_count = host_size
+        if host_size != 0:
+            counter_set = self._counter[host_size]
+            counter_set.add(host)
+            if host_size > self._max_count:
+                self._max_count = host_size
+        else:
+            while self._max_count > 0 and not self._counter[self._max_count]:
+                self._max_count -= 1
 
     def _consistency_check(self):
         assert self._max_count >= 0
@@ -941,12 +1086,18 @@ class IdleSlaves(object):
             if self._counter[count] and count > max_count:
                 max_count = count
         assert self._max_count == max_count
+        for host, slaves in self._host_map.items():
+            host_size = sum(self._all_slaves[slave] for slave in slaves)
+            assert self._host_slots[host] == host_size
+            if host_size:
+                assert host in self._counter[host_size]
+        assert self._total_slots == sum(self._all_slaves.values())
 
     def _remove_from_counter(self, host, host_size):
         if host_size != 0:
             counter_set = self._counter[host_size]
             counter_set.remove(host)
-            if self._max_count == host_size and not counter_set:
+            while self._max_count > 0 and not self._counter[self._max_count]:
                 self._max_count -= 1
 
     def __nonzero__(self):
@@ -959,6 +1110,7 @@ class IdleSlaves(object):
         return slave in self._all_slaves
 
     def __len__(self):
-        return len(self._all_slaves)
+        """Returns the total number of idle slots."""
+        return self._total_slots
 
 # vim: et sw=4 sts=4
@@ -17,7 +17,10 @@
 
 from __future__ import division, print_function
 
+import bisect
 import collections
+import functools
+from operator import itemgetter
 import os
 import sys
 import time
@@ -41,6 +44,8 @@ if not PY3:
 
 INITIAL_PEON_THREADS = 4
 PROGRESS_INTERVAL = 0.25
+# Tasks that have run for less than this many seconds are never backed up.
+MIN_SPECULATIVE_RUNTIME = 1.0
 
 
 class BaseRunner(object):
@@ -409,8 +414,8 @@ class TaskRunner(BaseRunner):
         Arguments:
             dataset_id: string
             task_index: integer id of the task that produced the data
-            outurls: list of (number, string) pairs representing the split and
-                url of the outputs.
+            outurls: list of (split, url, nbytes, nrecords) tuples giving the
+                url and size of each output bucket.
         """
         tasklist = self.tasklists[dataset_id]
         if tasklist.is_task_done(task_index):
@@ -421,9 +426,11 @@ class TaskRunner(BaseRunner):
         tasklist.task_done(task_index)
 
         dataset = self.datasets[dataset_id]
-        for split, url in outurls:
+        for split, url, nbytes, nrecords in outurls:
             bucket = dataset[task_index, split]
             bucket.url = url
+            bucket.nbytes = nbytes
+            bucket.nrecords = nrecords
             if not dataset.closed:
                 response = job.BucketReady(dataset_id, bucket)
                 self.job_conn.send(response)
@@ -462,6 +469,10 @@ class TaskRunner(BaseRunner):
 
     def dataset_done(self, dataset):
         self.runnable_datasets.remove(dataset)
+        if dataset.splits > 1:
+            logger.info('Dataset %s is done with a skew of %.2f (records in'
+                    ' the largest split over the mean).'
+                    % (dataset.id, dataset.skew()))
         super(TaskRunner, self).dataset_done(dataset)
 
     def _wakeup_dependents(self, dataset_id):
@@ -563,7 +574,11 @@ class TaskRunner(BaseRunner):
 
 
 class TaskList(object):
-    """Manages the list of tasks associated with a single dataset."""
+    """Manages the list of tasks associated with a single dataset.
+
+    The TaskList also keeps the runtimes of completed tasks so that tasks
+    running much longer than the median (stragglers) can be backed up.
+    """
 
     def __init__(self, dataset, input_ds):
         self.dataset = dataset
@@ -575,6 +590,11 @@ class TaskList(object):
         self._num_tasks = 0
         self._last_progress_report = 0.0
         self._failures = collections.defaultdict(int)
+        # Start time and number of running copies of each running task.
+        self._start_times = {}
+        self._copies = {}
+        # Sorted list of the runtimes of completed tasks.
+        self._runtimes = []
 
     def make_tasks(self, done_tasks, backlink_tasks, incomplete_sources):
         """Generate tasks for the given dataset, adding them to ready_tasks.
@@ -584,20 +604,30 @@ class TaskList(object):
         are in the given incomplete_sources set will be ignored.
 
         Backlinked tasks get added to the remaining_tasks set but not to the
-        ready_tasks set.  Done tasks aren't added to either.
+        ready_tasks set.  Done tasks aren't added to either.  Ready tasks are
+        ordered by the total size of their input, largest first, so that
+        big tasks do not start last and stretch out the dataset.
         """
+        ready_tasks = []
         for task_index in range(self.dataset.ntasks):
             if task_index in done_tasks:
                 pass
             elif task_index in backlink_tasks:
                 self._remaining_tasks.add(task_index)
             else:
+                has_input = False
+                input_bytes = 0
                 for b in self.input_ds[:, task_index]:
                     # Don't add empty or incomplete sources.
                     if b.url and (b.source not in incomplete_sources):
-                        self._ready_tasks.append(task_index)
-                        self._remaining_tasks.add(task_index)
-                        break
+                        has_input = True
+                        input_bytes += b.nbytes
+                if has_input:
+                    ready_tasks.append((input_bytes, task_index))
+                    self._remaining_tasks.add(task_index)
+        # The sort is stable, so tasks of unknown size keep their order.
+        ready_tasks.sort(key=itemgetter(0), reverse=True)
+        self._ready_tasks.extend(task_index for _, task_index in ready_tasks)
         self._num_tasks = len(self._remaining_tasks)
         self._tasks_made = True
 
@@ -631,6 +661,10 @@ class TaskList(object):
 
     def task_done(self, task_index):
         self._remaining_tasks.remove(task_index)
+        self._copies.pop(task_index, None)
+        start_time = self._start_times.pop(task_index, None)
+        if start_time is not None:
+            bisect.insort(self._runtimes, time.time() - start_time)
 
     def is_task_done(self, task_index):
         """Returns True if the task has been completed."""
@@ -644,17 +678,72 @@ class TaskList(object):
         assert self._tasks_made
         try:
             task_index = self._ready_tasks.popleft()
-            return (self.dataset.id, task_index)
         except IndexError:
             return None
+        self._start_times.setdefault(task_index, time.time())
+        self._copies[task_index] = self._copies.get(task_index, 0) + 1
+        return (self.dataset.id, task_index)
+
+    def median_runtime(self):
+        """Returns the median runtime of completed tasks (or None)."""
+        if self._runtimes:
+            return self._runtimes[len(self._runtimes) // 2]
+        else:
+            return None
+
+    def pop_straggler(self, slowdown, exclude=()):
+        """Pop off a backup copy of a straggling task (or None).
+
+        A running task is a straggler if it has run more than `slowdown`
+        times as long as the median completed task.  Only one backup is made
+        of each task, and tasks in `exclude` (a collection of
+        (dataset_id, task_index) pairs) are skipped.  Returns a
+        (dataset_id, task_index) pair for the straggler that started first.
+
+        Tasks of permanent datasets are never backed up because both copies
+        would write to the same output directory.
+        """
+        median = self.median_runtime()
+        if median is None or self.dataset.permanent:
+            return None
+        threshold = max(slowdown * median, MIN_SPECULATIVE_RUNTIME)
+        now = time.time()
+
+        straggler = None
+        first_start = None
+        for task_index, start_time in self._start_times.items():
+            if (self._copies[task_index] != 1 or now - start_time < threshold
+                    or (self.dataset.id, task_index) in exclude):
+                continue
+            if first_start is None or start_time < first_start:
+                straggler = task_index
+                first_start = start_time
+
+        if straggler is None:
+            return None
+        self._copies[straggler] += 1
+        logger.info('Backing up task (%s, %s) after %.1f seconds (median'
+                ' %.1f seconds).' % (self.dataset.id, straggler,
+                    now - first_start, median))
+        return (self.dataset.id, straggler)
 
     def task_failed(self, task_index):
         """Push back a failed task.
 
         Called if, for example, a Task is aborted.  Returns the number of
-        times that this particular task has failed.
+        times that this particular task has failed.  The task is only pushed
+        back if no other copy of it is still running, and failures of tasks
+        that are already done (such as a backup that lost) are ignored.
         """
-        self._ready_tasks.append(task_index)
+        if self.is_task_done(task_index):
+            return 0
+        copies = self._copies.get(task_index, 1) - 1
+        if copies > 0:
+            self._copies[task_index] = copies
+        else:
+            self._copies.pop(task_index, None)
+            self._start_times.pop(task_index, None)
+            self._ready_tasks.append(task_index)
         self._failures[task_index] += 1
         return self._failures[task_index]
 
@@ -707,4 +796,59 @@ class MockParallelRunner(TaskRunner, worker.WorkerManager):
         """Called when a worker sends a WorkerFailure."""
         raise RuntimeError('Task failed')
 
+
+class LocalRunner(TaskRunner, worker.WorkerPoolManager):
+    """Runs tasks on a pool of Worker processes on the local machine.
+
+    Task requests go straight to idle Workers over pipes, and Workers read
+    their input from the local filesystem by path, so neither RPC nor the
+    HTTP bucket server is needed.  Failed tasks are retried as in the
+    Master.
+    """
+    def __init__(self, program_class, opts, args, job_conn, jobdir,
+            default_dir, worker_pipes):
+        super(LocalRunner, self).__init__(program_class, opts, args, job_conn,
+                jobdir, default_dir, None)
+
+        self.init_worker_pool(worker_pipes)
+        for index, pipe in enumerate(self.worker_pipes):
+            self.event_loop.register_fd(pipe.fileno(),
+                    functools.partial(self.read_worker_pipe, index))
+
+    def run(self):
+        for _ in range(INITIAL_PEON_THREADS):
+            self.start_peon_thread()
+        if not self.worker_setup(self.opts, self.args, self.default_dir):
+            return 1
+        self.schedule()
+        self.event_loop.run()
+        return self.exitcode
+
+    def schedule(self):
+        """Gives a task to each idle Worker (while there are tasks)."""
+        while self.idle_slots():
+            next_task = self.next_task()
+            if next_task is None:
+                return
+            dataset_id, task_index = next_task
+            ds = self.datasets[dataset_id]
+            task = ds.get_task(task_index, self.datasets, self.jobdir)
+            request = worker.WorkerTaskRequest(*task.to_args())
+            result = self.submit_request(request)
+            assert result
+
+    def available_workers(self):
+        """Returns the total number of idle workers."""
+        return self.idle_slots()
+
+    def worker_success(self, r):
+        """Called when a worker sends a WorkerSuccess."""
+        self.task_done(r.dataset_id, r.task_index, r.outurls)
+        self.schedule()
+
+    def worker_failure(self, r):
+        """Called when a worker sends a WorkerFailure."""
+        self.task_lost(r.dataset_id, r.task_index)
+        self.schedule()
+
 # vim: et sw=4 sts=4
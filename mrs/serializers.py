@@ -27,6 +27,17 @@ except ImportError:
 
 Serializer = namedtuple('Serializer', ('dumps', 'loads'))
 
+
+class ComparableSerializer(Serializer):
+    """A Serializer whose serialized bytes sort in the same order as objects.
+
+    Keys with a bytes-comparable serializer can be sorted and merged in their
+    serialized form, so they only need to be deserialized once per group.
+    """
+    __slots__ = ()
+    bytes_comparable = True
+
+
 def output_serializers(**kwargs):
     """A decorator to specify key and value serializers for map or reduce
     functions.
@@ -95,6 +106,18 @@ def from_names(names, program):
     return Serializers(key_s, key_s_name, value_s, value_s_name)
 
 
+def bytes_comparable(serializers):
+    """Returns whether serialized keys sort in the same order as keys.
+
+    Parameters:
+        serializers: A Serializers instance, or None for the default (pickle)
+            serializers, which are not bytes-comparable.
+    """
+    if serializers is None:
+        return False
+    return getattr(serializers.key_s, 'bytes_comparable', False)
+
+
 def dumps_functions(serializers):
     """Return a pair of dumps functions (for the key and value).
 
@@ -154,7 +177,7 @@ def loads_functions(serializers):
 ###############################################################################
 # bytes <-> bytes (no-op)
 
-raw_serializer = Serializer(None, None)
+raw_serializer = ComparableSerializer(None, None)
 
 ###############################################################################
 # str <-> bytes
@@ -165,7 +188,8 @@ def str_dumps(s):
 def str_loads(b):
     return b.decode('utf-8')
 
-str_serializer = Serializer(str_dumps, str_loads)
+# UTF-8 preserves the order of code points.
+str_serializer = ComparableSerializer(str_dumps, str_loads)
 
 ###############################################################################
 # int <-> bytes
@@ -178,6 +202,22 @@ def int_loads(b):
 
 int_serializer = Serializer(int_dumps, int_loads)
 
+###############################################################################
+# int <-> bytes (order-preserving)
+
+# Offset binary: the sign bit is flipped so that negative numbers sort first.
+_sortable_int_struct = struct.Struct('>Q')
+_SORTABLE_INT_OFFSET = 1 << 63
+
+def sortable_int_dumps(i):
+    return _sortable_int_struct.pack(i + _SORTABLE_INT_OFFSET)
+
+def sortable_int_loads(b):
+    return _sortable_int_struct.unpack(b)[0] - _SORTABLE_INT_OFFSET
+
+sortable_int_serializer = ComparableSerializer(sortable_int_dumps,
+        sortable_int_loads)
+
 ###############################################################################
 # struct <-> bytes
 
@@ -185,7 +225,8 @@ def make_primitive_serializer(format):
     """Create a serializer for a primitive type from a struct format string.
 
     The given `format` is a format string as defined in the `struct` module
-    and is expected to include a single primitive type.
+    and is expected to include a single primitive type.  Big-endian unsigned
+    integer formats (such as '>I') give bytes-comparable serializers.
 
     See: http://docs.python.org/library/struct.html
     """
@@ -193,7 +234,10 @@ def make_primitive_serializer(format):
     def loads(b):
         return structure.unpack(b)[0]
 
-    return Serializer(structure.pack, loads)
+    if format[:1] in ('>', '!') and format[1:] in ('B', 'H', 'I', 'L', 'Q'):
+        return ComparableSerializer(structure.pack, loads)
+    else:
+        return Serializer(structure.pack, loads)
 
 def make_struct_serializer(format):
     """Create a serializer from a struct format string.
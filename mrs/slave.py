@@ -15,8 +15,9 @@
 
 """Mrs Slave
 
-The Mrs Slave runs in two processes: the main process and the worker process.
-The main process has a main thread, a slave thread and an rpc thread.
+The Mrs Slave runs in two processes: the main process and the worker process
+(or several worker processes, one for each task slot).  The main process has
+a main thread, a slave thread and an rpc thread.
 
 The main thread doesn't really do anything.  It starts the other two threads
 and waits for them to finish.  If the user hits CTRL-C, the main thread will
@@ -25,7 +26,8 @@ the main thread exists at all is to deal with signals.
 
 The worker process executes the user's map function and reduce function.
 That's it.  It just does what the main process tells it to.  The worker
-process is terminated when the main process exits.
+process is terminated when the main process exits.  All of the workers in a
+slave share one bucket server and one temporary directory.
 """
 
 # Number of ping timeouts before giving up:
@@ -34,6 +36,7 @@ PING_ATTEMPTS = 50
 COOKIE_LEN = 8
 
 import datetime
+import functools
 import multiprocessing
 import optparse
 import socket
@@ -50,14 +53,17 @@ from logging import getLogger
 logger = getLogger('mrs')
 
 
-class Slave(worker.WorkerManager):
+class Slave(worker.WorkerPoolManager):
     """State of a Mrs slave
 
+    The `worker_pipes` parameter is a list of pipes to Worker processes (or a
+    single pipe), and the slave reports one task slot per Worker.
+
     Attributes:
         _outdirs: map from a (dataset_id, source) pair to an output directory
     """
     def __init__(self, program_class, master_url, tmpdir, pingdelay,
-            timeout, worker_pipe):
+            timeout, worker_pipes):
         self.program_class = program_class
         self.master_url = master_url
         self.tmpdir = tmpdir
@@ -74,15 +80,17 @@ class Slave(worker.WorkerManager):
         self.url_converter = None
 
         self.setup_complete = False
-        self.current_task = None
         self._outdirs = {}
         self._outdirs_lock = threading.Lock()
 
         self.event_loop = util.EventLoop()
-        self.worker_pipe = worker_pipe
+        if not isinstance(worker_pipes, (list, tuple)):
+            worker_pipes = [worker_pipes]
+        self.init_worker_pool(worker_pipes)
         self.exit_pipe_recv, self.exit_pipe_send = multiprocessing.Pipe(False)
-        self.event_loop.register_fd(self.worker_pipe.fileno(),
-                self.read_worker_pipe)
+        for index, pipe in enumerate(self.worker_pipes):
+            self.event_loop.register_fd(pipe.fileno(),
+                    functools.partial(self.read_worker_pipe, index))
         self.event_loop.register_fd(self.exit_pipe_recv.fileno(),
                 self.read_exit_pipe)
 
@@ -147,7 +155,8 @@ class Slave(worker.WorkerManager):
 
         try:
             slave_id, addr, jobdir, optdict, args = self.master_rpc.signin(
-                    __version__, cookie, self.rpc_port, program_hash)
+                    __version__, cookie, self.rpc_port, program_hash,
+                    self.slots)
         except socket.error as e:
             msg = str(e)
             logger.critical('Unable to contact master at %s: %s' %
@@ -179,7 +188,7 @@ class Slave(worker.WorkerManager):
 
         This is the callback after user_setup is called.
         """
-        assert self.current_task is None
+        assert self.idle_slots() == self.slots
 
         try:
             self.master_rpc.ready(self.id, self.cookie)
@@ -196,7 +205,12 @@ class Slave(worker.WorkerManager):
         outurls = r.outurls
         if self.url_converter:
             convert_url = self.url_converter.local_to_global
-            outurls = [(s, convert_url(url)) for s, url in outurls]
+        else:
+            convert_url = lambda url: url
+        # XML-RPC integers are limited to 32 bits, so sizes are sent as
+        # floats (which are exact up to 2**53).
+        outurls = [(s, convert_url(url), float(nbytes), float(nrecords))
+                for s, url, nbytes, nrecords in outurls]
         self.master_rpc.done(self.id, r.dataset_id, r.task_index, outurls,
                 self.cookie)
 
@@ -258,6 +272,23 @@ class SlaveInterface(object):
             storage, ext, input_ser_names, ser_names, cookie, host=None):
         self.slave.check_cookie(cookie)
         self.slave.update_timestamp()
+        return self._start_task(op_args, urls, dataset_id, task_index, splits,
+                storage, ext, input_ser_names, ser_names, host)
+
+    @httpmrs.uses_host
+    def xmlrpc_start_tasks(self, task_list, cookie, host=None):
+        """Starts several tasks (one per idle worker) in a single request.
+
+        Each item of task_list is a list of arguments as for start_task
+        (without the cookie).  Returns a list with the success of each.
+        """
+        self.slave.check_cookie(cookie)
+        self.slave.update_timestamp()
+        return [self._start_task(*(tuple(task_args) + (host,)))
+                for task_args in task_list]
+
+    def _start_task(self, op_args, urls, dataset_id, task_index, splits,
+            storage, ext, input_ser_names, ser_names, host):
         op_name = op_args[0]
         logger.info('Received %s assignment: %s, %s' %
                 (op_name, dataset_id, task_index))
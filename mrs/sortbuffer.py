@@ -0,0 +1,193 @@
+# Mrs
+# Copyright 2008-2012 Brigham Young University
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""Compact in-memory buffers for sorting serialized key-value pairs."""
+
+from array import array
+import heapq
+import sys
+
+# Python 3 compatibility
+PY3 = sys.version_info[0] == 3
+if not PY3:
+    range = xrange
+
+# The index is sorted in chunks of this many pairs, which are then merged, so
+# that sorting only needs a bounded number of temporary Python objects.
+SORT_CHUNK_SIZE = 1024 * 1024
+
+# Estimated bytes per pair of a chunk being sorted, for its sort key object
+# and the slots and index objects in the temporary lists (in addition to the
+# bytes of the key itself).
+SORT_KEY_OVERHEAD = 100
+
+# Typecode for offsets and indices (unsigned long, since 'Q' is unavailable in
+# Python 2).
+INDEX_TYPECODE = 'L'
+
+
+class SortBuffer(object):
+    """Packs serialized key-value pairs into a single bytearray for sorting.
+
+    Each pair is stored as its key bytes followed by its value bytes, and
+    only an offset and a key length are kept per pair.  A buffered pair thus
+    costs its serialized size plus a few machine words, whereas a tuple of
+    two bytes objects costs more than 100 bytes of overhead.
+
+    If `loads_key` is None, pairs are sorted by serialized key, which must
+    be bytes-comparable.  Otherwise, they are sorted by `loads_key(key)`.  The
+    sort is stable, and iterating gives (key, value) pairs of bytes, in
+    sorted order after `sort()` is called and in insertion order otherwise.
+
+    Sorting a chunk of pairs temporarily needs a Python object per key, so
+    `nbytes` reserves room for these objects for the pairs in the first
+    chunk, which is the most that is ever needed at once.
+
+    Attributes:
+        nbytes: memory used by the buffer (including the sort index and the
+            room reserved for sorting), in bytes
+
+    >>> buf = SortBuffer()
+    >>> for key, value in [(b'b', b'1'), (b'a', b'2'), (b'b', b'3')]:
+    ...     buf.append(key, value)
+    >>> buf.sort()
+    >>> [(k.decode(), v.decode()) for k, v in buf]
+    [('a', '2'), ('b', '1'), ('b', '3')]
+    >>>
+    """
+    def __init__(self, loads_key=None):
+        self.loads_key = loads_key
+        # Bytes per pair for its offset, key length, and place in the order.
+        self._pair_overhead = 3 * array(INDEX_TYPECODE).itemsize
+        self.clear()
+
+    def clear(self):
+        """Removes all pairs and frees their memory."""
+        self._data = bytearray()
+        # The pair with index i is at data[offsets[i]:offsets[i + 1]].
+        self._offsets = array(INDEX_TYPECODE, [0])
+        self._key_lengths = array(INDEX_TYPECODE)
+        self._order = None
+        self.nbytes = 0
+
+    def __getstate__(self):
+        """Pickle without `loads_key`, which may not be picklable.
+
+        The receiver must set `loads_key` if keys are not bytes-comparable.
+        """
+        state = self.__dict__.copy()
+        state['loads_key'] = None
+        return state
+
+    def __len__(self):
+        return len(self._key_lengths)
+
+    def append(self, key, value):
+        """Adds a pair of serialized key and value."""
+        self.fill(((key, value),))
+
+    def fill(self, pairs, max_nbytes=None):
+        """Adds serialized pairs from an iterator until the buffer is full.
+
+        Returns True if the buffer reached `max_nbytes` (so that some pairs
+        may remain in the iterator) and False if the iterator is exhausted.
+        """
+        data = self._data
+        add_offset = self._offsets.append
+        add_key_length = self._key_lengths.append
+        pair_overhead = self._pair_overhead
+        # Pairs that still need room reserved for sorting.
+        unreserved = SORT_CHUNK_SIZE - len(self)
+        nbytes = self.nbytes
+        self._order = None
+        try:
+            for key, value in pairs:
+                data += key
+                add_key_length(len(key))
+                data += value
+                add_offset(len(data))
+                nbytes += len(key) + len(value) + pair_overhead
+                if unreserved > 0:
+                    unreserved -= 1
+                    nbytes += len(key) + SORT_KEY_OVERHEAD
+                if max_nbytes is not None and nbytes > max_nbytes:
+                    return True
+            return False
+        finally:
+            self.nbytes = nbytes
+
+    def sort(self):
+        """Sorts the index of pairs by key."""
+        n = len(self)
+        chunks = []
+        for start in range(0, n, SORT_CHUNK_SIZE):
+            stop = min(start + SORT_CHUNK_SIZE, n)
+            keys = self._sort_keys(start, stop)
+            order = sorted(range(stop - start), key=keys.__getitem__)
+            del keys
+            chunks.append(array(INDEX_TYPECODE, (start + i for i in order)))
+            del order
+
+        if not chunks:
+            self._order = array(INDEX_TYPECODE)
+        elif len(chunks) == 1:
+            self._order = chunks[0]
+        else:
+            # Equal keys are ordered by index, which keeps the merge stable.
+            streams = [self._iter_sort_keys(chunk) for chunk in chunks]
+            self._order = array(INDEX_TYPECODE,
+                    (i for _, i in heapq.merge(*streams)))
+
+    def _sort_keys(self, start, stop):
+        """Returns a list of sort keys for the pairs in the given range."""
+        data = self._data
+        ranges = zip(self._offsets[start:stop],
+                self._key_lengths[start:stop])
+        if self.loads_key is None:
+            return [bytes(data[offset:offset + length])
+                    for offset, length in ranges]
+        else:
+            loads_key = self.loads_key
+            return [loads_key(bytes(data[offset:offset + length]))
+                    for offset, length in ranges]
+
+    def _iter_sort_keys(self, chunk):
+        """Iterates over (sort_key, index) for the pairs in a sorted chunk."""
+        data = self._data
+        offsets = self._offsets
+        key_lengths = self._key_lengths
+        loads_key = self.loads_key
+        for i in chunk:
+            offset = offsets[i]
+            key = bytes(data[offset:offset + key_lengths[i]])
+            if loads_key is not None:
+                key = loads_key(key)
+            yield key, i
+
+    def __iter__(self):
+        if self._order is None:
+            order = range(len(self))
+        else:
+            order = self._order
+        data = self._data
+        offsets = self._offsets
+        key_lengths = self._key_lengths
+        for i in order:
+            start = offsets[i]
+            middle = start + key_lengths[i]
+            yield bytes(data[start:middle]), bytes(data[middle:offsets[i + 1]])
+
+
+# vim: et sw=4 sts=4
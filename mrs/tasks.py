@@ -20,18 +20,41 @@ A Task represents a unit of work and the mechanism for carrying it out.
 
 from __future__ import division, print_function
 
+import binascii
+import bisect
 import copy
 import itertools
 from operator import itemgetter
+import sys
+import tempfile
+
+try:
+    import cPickle as pickle
+except ImportError:
+    import pickle
 
 from . import datasets
 from . import fileformats
 from . import serializers
 from . import util
+from .serializers import loads_functions
 
 from logging import getLogger
 logger = getLogger('mrs')
 
+# Suffix of the names of batch versions of map and reduce functions.
+BATCH_SUFFIX = '_batch'
+# Number of map output values to hold in RAM before combining them.
+COMBINE_TABLE_SIZE = 100000
+# Types of keys and values that are shared rather than copied in serial
+# MapReduce (see copy_object).
+if sys.version_info[0] == 3:
+    IMMUTABLE_TYPES = frozenset([bool, int, float, complex, str, bytes,
+        type(None)])
+else:
+    IMMUTABLE_TYPES = frozenset([bool, int, long, float, complex, str,
+        unicode, type(None)])
+
 
 class Task(object):
     """Manage input and output for a piece of a map or reduce operation.
@@ -56,7 +79,9 @@ class Task(object):
         self.sorted_ds = None
 
     def outurls(self):
-        return [(b.split, b.url) for b in self.output[:, :] if b.url]
+        """Returns a (split, url, nbytes, nrecords) tuple for each output."""
+        return [(b.split, b.url, b.nbytes, b.nrecords)
+                for b in self.output[:, :] if b.url]
 
     @staticmethod
     def from_op(op, *args):
@@ -111,22 +136,41 @@ class Task(object):
                 self.storage, self.ext, input_ser_names, ser_names)
 
     def _get_all_input(self, serial, sort=False, default_dir=None,
-            max_sort_size=None):
-        """Returns an iterator over all input data."""
-        if serial:
-            self.input_ds.fetchall(_called_in_runner=True)
-            uncopied_data = self.input_ds.data()
-            # Avoid subtle race conditions in serial MapReduce when objects
-            # are mutable by recklessly copying everything.  In the future, we
-            # might make this disableable, but performance in serial MapReduce
-            # is not a high priority.
-            data = (copy.deepcopy(x) for x in uncopied_data)
+            max_sort_size=None, sort_processes=1, copy_input=True):
+        """Returns an iterator over all input data.
+
+        If the input must be sorted, up to `sort_processes` processes sort it
+        (see `datasets.MergeSortData`).
+
+        In serial MapReduce, input held in RAM is shared with the input
+        dataset, so each pair is copied as it is read (see `copy_pair`)
+        unless `copy_input` is false.  Input that has not been fetched (such
+        as input files) is streamed instead, like in parallel MapReduce, and
+        needs no copying since every pair is freshly loaded.
+        """
+        if serial and self._serial_input_in_ram():
+            data = self.input_ds.data()
             if sort:
+                # The references are sorted before they are copied.
                 data = sorted(data, key=itemgetter(0))
+            if copy_input:
+                data = (copy_pair(pair) for pair in data)
+        elif serial and not sort:
+            buckets = [b for b in self.input_ds[:, :] if b.url]
+            data = itertools.chain.from_iterable(b.stream() for b in buckets)
+        elif sort and self.op.input_sorted:
+            data = self.input_ds.stream_split_sorted(self.task_index,
+                    _called_in_runner=True)
         elif sort:
+            # Serial tasks have no job directory or configured sort size.
+            if default_dir is None:
+                default_dir = tempfile.gettempdir()
+            if max_sort_size is None:
+                max_sort_size = datasets.DEFAULT_MAX_SORT_SIZE
             tmpdir = util.mktempdir(default_dir, 'merge_%s_' % self.dataset_id)
             sorted_ds = datasets.MergeSortData(self.input_ds, self.task_index,
-                    max_sort_size, dir=tmpdir, _called_in_runner=True)
+                    max_sort_size, dir=tmpdir, processes=sort_processes,
+                    _called_in_runner=True)
             data = sorted_ds.stream_data(_called_in_runner=True)
             self.sorted_ds = sorted_ds
         else:
@@ -134,11 +178,40 @@ class Task(object):
                     _called_in_runner=True)
         return data
 
-    def _outdata_kwds(self, program, permanent, serial):
+    def _get_input_batches(self, serial, copy_input=True):
+        """Returns an iterator over (keys, values) batches of input data."""
+        if serial and self._serial_input_in_ram():
+            return util.iter_batches(self._get_all_input(serial,
+                copy_input=copy_input))
+        elif serial:
+            buckets = [b for b in self.input_ds[:, :] if b.url]
+            return itertools.chain.from_iterable(b.stream_batches()
+                    for b in buckets)
+        else:
+            return self.input_ds.stream_split_batches(self.task_index,
+                    _called_in_runner=True)
+
+    def _serial_input_in_ram(self):
+        """Prepares the input for a serial task.
+
+        Returns True if the input is held in RAM (fetching it if it is a
+        dataset computed by another task).  Otherwise, the input files are
+        regrouped into a single split so that they can be streamed.
+        """
+        input_ds = self.input_ds
+        if not isinstance(input_ds, datasets.FileData) or input_ds._fetched:
+            input_ds.fetchall(_called_in_runner=True)
+            return True
+        urls = [b.url for b in input_ds[:, :] if b.url]
+        self.input_ds = datasets.FileData(urls, splits=1,
+                first_split=self.task_index, serializers=input_ds.serializers)
+        return False
+
+    def _outdata_kwds(self, program, permanent, serial, max_sort_size=None):
         """Returns arguments for the output dataset (common to all task types).
         """
         kwds = {'source': self.task_index,
-                'parter': self.op.parter(program),
+                'parter': self.op.parter(program, self.serializers),
                 'dir': self.outdir,
                 'format': self.format(),
                 'serializers': self.serializers,
@@ -146,6 +219,9 @@ class Task(object):
                 }
         if not serial:
             kwds['write_only'] = True
+            if self.op.sort_output:
+                kwds['sort'] = True
+                kwds['max_sort_size'] = max_sort_size
         return kwds
 
     def make_outdir(self, default_dir):
@@ -178,42 +254,58 @@ class Task(object):
 
 
 class MapTask(Task):
-    def run(self, program, default_dir, serial=False, max_sort_size=None):
+    def run(self, program, default_dir, serial=False, max_sort_size=None,
+            sort_processes=1):
         assert isinstance(self.op, MapOperation)
 
-        all_input = self._get_all_input(serial)
+        copy_input = not getattr(program, 'immutable_data', False)
+        if self.op.batch_mapper(program) is not None:
+            map_itr = self.op.map_batches(program,
+                    self._get_input_batches(serial, copy_input))
+        else:
+            map_itr = self.op.map(program, self._get_all_input(serial,
+                copy_input=copy_input))
         permanent = self.make_outdir(default_dir)
-        kwds = self._outdata_kwds(program, permanent, serial)
-        map_itr = self.op.map(program, all_input)
+        kwds = self._outdata_kwds(program, permanent, serial, max_sort_size)
         self.output = datasets.LocalData(map_itr, permanent=permanent, **kwds)
 
 
 class ReduceTask(Task):
-    def run(self, program, default_dir, serial=False, max_sort_size=None):
+    def run(self, program, default_dir, serial=False, max_sort_size=None,
+            sort_processes=1):
         assert isinstance(self.op, ReduceOperation)
 
         all_input = self._get_all_input(serial, sort=True,
-                default_dir=default_dir, max_sort_size=max_sort_size)
+                default_dir=default_dir, max_sort_size=max_sort_size,
+                sort_processes=sort_processes,
+                copy_input=not getattr(program, 'immutable_data', False))
 
         permanent = self.make_outdir(default_dir)
         kwds = self._outdata_kwds(program, permanent, serial)
-        reduce_itr = self.op.reduce(program, all_input)
+        reduce_itr = self.op.reduce(program, all_input,
+                self.input_ds.serializers)
         self.output = datasets.LocalData(reduce_itr, permanent=permanent,
                 **kwds)
+        # Reduce output is produced in key order.
+        self.output.sorted = True
         if self.sorted_ds is not None:
             self.sorted_ds.delete()
 
 
 class ReduceMapTask(Task):
-    def run(self, program, default_dir, serial=False, max_sort_size=None):
+    def run(self, program, default_dir, serial=False, max_sort_size=None,
+            sort_processes=1):
         assert isinstance(self.op, ReduceMapOperation)
 
         all_input = self._get_all_input(serial, sort=True,
-                default_dir=default_dir, max_sort_size=max_sort_size)
+                default_dir=default_dir, max_sort_size=max_sort_size,
+                sort_processes=sort_processes,
+                copy_input=not getattr(program, 'immutable_data', False))
 
         permanent = self.make_outdir(default_dir)
-        kwds = self._outdata_kwds(program, permanent, serial)
-        reduce_itr = self.op.reduce(program, all_input)
+        kwds = self._outdata_kwds(program, permanent, serial, max_sort_size)
+        reduce_itr = self.op.reduce(program, all_input,
+                self.input_ds.serializers)
         map_itr = self.op.map(program, reduce_itr)
         self.output = datasets.LocalData(map_itr, permanent=permanent, **kwds)
         if self.sorted_ds is not None:
@@ -221,11 +313,45 @@ class ReduceMapTask(Task):
 
 
 class Operation(object):
-    def __init__(self, part_name):
+    """An operation that can be carried out by tasks.
+
+    If `sort_output` is true, then each output bucket is sorted by key (see
+    `datasets.LocalData`).  If `input_sorted` is true, then each input
+    bucket is known to be sorted, so sorted input can be streamed with a
+    merge instead of being sorted again.  The `hot_keys` are hex-encoded
+    serialized keys that are spread across all output splits (see
+    `HotKeyParter`).  The `boundaries` are hex-encoded serialized keys, in
+    sorted order, that split the output into key ranges (see `RangeParter`)
+    instead of using the named partition function.  The `merge_keys` are
+    hex-encoded serialized input keys whose values are partial reduce results
+    to be merged; if any are given, only these keys are reduced, and the
+    values of other keys are passed straight through.
+    """
+    def __init__(self, part_name, sort_output=False, input_sorted=False,
+            hot_keys=(), boundaries=(), merge_keys=()):
         self.part_name = part_name
+        self.sort_output = bool(sort_output)
+        self.input_sorted = bool(input_sorted)
+        self.hot_keys = list(hot_keys)
+        self.boundaries = list(boundaries)
+        self.merge_keys = list(merge_keys)
+
+    def output_sorted(self):
+        """Returns whether each output bucket will be sorted by key."""
+        return self.sort_output
 
-    def parter(self, program):
-        return getattr(program, self.part_name)
+    def parter(self, program, serializers=None):
+        """Returns the partition function.
+
+        The output `serializers` are needed to load range boundaries.
+        """
+        if self.boundaries:
+            return RangeParter(load_keys(self.boundaries, serializers))
+        parter = getattr(program, self.part_name)
+        if self.hot_keys:
+            hot_keys = [binascii.unhexlify(k) for k in self.hot_keys]
+            parter = HotKeyParter(parter, hot_keys)
+        return parter
 
     @staticmethod
     def from_args(op_name, *args):
@@ -234,8 +360,16 @@ class Operation(object):
 
 
 class MapOperation(Operation):
+    """A map operation, optionally followed by a combiner.
+
+    If the program has a method named like the map function with a "_batch"
+    suffix (e.g., `map_batch` for `map`), it is called instead with batches
+    of input: `map_batch(keys, values)` takes equal-length sequences (lists,
+    or arrays for columnar input) and returns an iterable of key-value pairs.
+    """
     op_name = 'map'
     task_class = MapTask
+    combine_table_size = COMBINE_TABLE_SIZE
 
     def __init__(self, map_name, combine_name, *args):
         Operation.__init__(self, *args)
@@ -243,38 +377,106 @@ class MapOperation(Operation):
         self.combine_name = combine_name
         self.id = '%s' % self.map_name
 
+    def batch_mapper(self, program):
+        """Returns the batch version of the map function, or None."""
+        if self.map_name is None:
+            return None
+        return getattr(program, self.map_name + BATCH_SUFFIX, None)
+
     def map(self, program, input):
         """Yields map output iterating over the entries in input."""
+        if self.batch_mapper(program) is not None:
+            return self.map_batches(program, util.iter_batches(input))
+
         if self.map_name is None:
             mapper = None
         else:
             mapper = getattr(program, self.map_name)
-
+        return self._combine(program, self._map(mapper, input))
+
+    def map_batches(self, program, batches):
+        """Yields map output iterating over (keys, values) input batches."""
+        batch_mapper = self.batch_mapper(program)
+        if batch_mapper is None:
+            input = (kvpair for keys, values in batches
+                    for kvpair in zip(keys, values))
+            return self.map(program, input)
+        return self._combine(program, self._map_batches(batch_mapper, batches))
+
+    def _combine(self, program, map_iter):
+        """Applies the combiner (if any) to the map output."""
         if self.combine_name:
             combine_op = ReduceOperation(self.combine_name, self.part_name)
-        else:
-            combine_op = None
-
-        map_iter = self._map(mapper, input)
-        if combine_op:
-            # SORT PHASE
-            sorted_map_iter = sorted(map_iter, key=itemgetter(0))
-            combine_iter = combine_op.reduce(program, sorted_map_iter)
-            return combine_iter
+            return self._hash_combine(program, combine_op, map_iter)
         else:
             return map_iter
 
+    def _hash_combine(self, program, combine_op, map_iter):
+        """Combines map output using a bounded hash table.
+
+        Values are grouped by key in a dict until it holds
+        `combine_table_size` values, at which point each group is combined
+        and the output is yielded.  Since the combiner may see any subset of
+        the values for a key, it must be safe to apply it repeatedly (as is
+        already required of combiners).  If a key is unhashable, the
+        remaining output is combined by sorting instead.
+        """
+        table = {}
+        count = 0
+        table_size = self.combine_table_size
+        map_iter = iter(map_iter)
+        for key, value in map_iter:
+            try:
+                values = table.get(key)
+            except TypeError:
+                for kvpair in combine_op.reduce_groups(program, table.items()):
+                    yield kvpair
+                remaining = itertools.chain([(key, value)], map_iter)
+                sorted_map_iter = sorted(remaining, key=itemgetter(0))
+                for kvpair in combine_op.reduce(program, sorted_map_iter):
+                    yield kvpair
+                return
+
+            if values is None:
+                table[key] = [value]
+            else:
+                values.append(value)
+            count += 1
+            if count >= table_size:
+                for kvpair in combine_op.reduce_groups(program, table.items()):
+                    yield kvpair
+                table.clear()
+                count = 0
+
+        for kvpair in combine_op.reduce_groups(program, table.items()):
+            yield kvpair
+
     def _map(self, mapper, input):
         for inkey, invalue in input:
             for key, value in mapper(inkey, invalue):
                 yield (key, value)
 
+    def _map_batches(self, batch_mapper, batches):
+        for keys, values in batches:
+            for kvpair in batch_mapper(keys, values):
+                yield kvpair
+
     def to_args(self):
         return (self.op_name, self.map_name, self.combine_name,
-                self.part_name)
+                self.part_name, self.sort_output, self.input_sorted,
+                self.hot_keys, self.boundaries)
 
 
 class ReduceOperation(Operation):
+    """A reduce operation.
+
+    As with MapOperation, a method named like the reduce function with a
+    "_batch" suffix is called instead if it exists:
+    `reduce_batch(keys, grouped_values)` takes a list of distinct keys and a
+    list of the corresponding lists of values, and it returns an iterable of
+    key-value pairs.  Keys are grouped into batches of about
+    `util.BATCH_SIZE` values.
+    """
     op_name = 'reduce'
     task_class = ReduceTask
 
@@ -283,26 +485,86 @@ class ReduceOperation(Operation):
         self.reduce_name = reduce_name
         self.id = '%s' % self.reduce_name
 
-    def reduce(self, program, input):
+    def batch_reducer(self, program):
+        """Returns the batch version of the reduce function, or None."""
+        if self.reduce_name is None:
+            return None
+        return getattr(program, self.reduce_name + BATCH_SUFFIX, None)
+
+    def reduce(self, program, input, serializers=None):
         """Yields reduce output iterating over the entries in input.
 
         A reducer is an iterator taking a key and an iterator over values for
-        that key.  It yields values for that key.
+        that key.  It yields values for that key.  If there are `merge_keys`,
+        the input `serializers` are needed to load them.
         """
+        grouped_input = ((k, (pair[1] for pair in v)) for k, v in
+            itertools.groupby(input, key=itemgetter(0)))
+        if self.merge_keys:
+            merge_keys = load_keys(self.merge_keys, serializers)
+            return self._merge(program, grouped_input, merge_keys)
+        return self.reduce_groups(program, grouped_input)
+
+    def _merge(self, program, groups, merge_keys):
+        """Reduces the groups of the merge keys and passes others through."""
+        for key, values in groups:
+            if key in merge_keys:
+                for kvpair in self.reduce_groups(program, [(key, values)]):
+                    yield kvpair
+            else:
+                for value in values:
+                    yield (key, value)
+
+    def reduce_groups(self, program, groups):
+        """Yields reduce output iterating over (key, values) groups.
+
+        Each key should appear in only one group.
+        """
+        batch_reducer = self.batch_reducer(program)
+        if batch_reducer is not None:
+            return self._reduce_batches(batch_reducer, groups)
+
         if self.reduce_name is None:
             reducer = None
         else:
             reducer = getattr(program, self.reduce_name)
+        return self._reduce(reducer, groups)
 
-        grouped_input = ((k, (pair[1] for pair in v)) for k, v in
-            itertools.groupby(input, key=itemgetter(0)))
-
-        for key, iterator in grouped_input:
-            for value in reducer(key, iterator):
+    def _reduce(self, reducer, groups):
+        for key, values in groups:
+            for value in reducer(key, iter(values)):
                 yield (key, value)
 
+    def _reduce_batches(self, batch_reducer, groups):
+        keys = []
+        grouped_values = []
+        size = 0
+        for key, values in groups:
+            values = list(values)
+            keys.append(key)
+            grouped_values.append(values)
+            size += len(values)
+            if size >= util.BATCH_SIZE:
+                for kvpair in batch_reducer(keys, grouped_values):
+                    yield kvpair
+                keys = []
+                grouped_values = []
+                size = 0
+        if keys:
+            for kvpair in batch_reducer(keys, grouped_values):
+                yield kvpair
+
     def to_args(self):
-        return (self.op_name, self.reduce_name, self.part_name)
+        return (self.op_name, self.reduce_name, self.part_name,
+                self.sort_output, self.input_sorted, self.hot_keys,
+                self.boundaries, self.merge_keys)
+
+    def output_sorted(self):
+        """Returns whether each output bucket will be sorted by key.
+
+        Since the input is grouped in key order, reduce output always is.
+        """
+        return True
 
 
 class ReduceMapOperation(MapOperation, ReduceOperation):
@@ -318,7 +580,83 @@ class ReduceMapOperation(MapOperation, ReduceOperation):
 
     def to_args(self):
         return (self.op_name, self.reduce_name, self.map_name,
-                self.combine_name, self.part_name)
+                self.combine_name, self.part_name, self.sort_output,
+                self.input_sorted, self.hot_keys, self.boundaries,
+                self.merge_keys)
+
+    def output_sorted(self):
+        return self.sort_output
+
+
+def copy_pair(pair):
+    """Copies a key-value pair (see copy_object)."""
+    key, value = pair
+    return copy_object(key), copy_object(value)
+
+
+def copy_object(obj):
+    """Returns a copy of the object that can be safely modified.
+
+    Objects of immutable types (and tuples of them) are shared rather than
+    copied.  Other objects are copied with pickle, which is several times
+    faster than copy.deepcopy, or with copy.deepcopy if they can't be
+    pickled.
+    """
+    obj_type = type(obj)
+    if obj_type in IMMUTABLE_TYPES:
+        return obj
+    if obj_type is tuple and all(type(x) in IMMUTABLE_TYPES for x in obj):
+        return obj
+    try:
+        return pickle.loads(pickle.dumps(obj, pickle.HIGHEST_PROTOCOL))
+    except Exception:
+        return copy.deepcopy(obj)
+
+
+def load_keys(encoded_keys, serializers):
+    """Loads hex-encoded serialized keys (as given to an Operation)."""
+    loads_key, _ = loads_functions(serializers)
+    keys = [binascii.unhexlify(k) for k in encoded_keys]
+    if loads_key is not None:
+        keys = [loads_key(k) for k in keys]
+    return keys
+
+
+class HotKeyParter(object):
+    """A partition function that spreads hot keys across all splits.
+
+    Records with one of the given serialized `hot_keys` are assigned to
+    splits in round-robin order, so no single reduce task gets all of them.
+    Other keys are partitioned with `parter`.  Since a hot key then appears
+    in every split, reduce output for it is partial and must be merged by a
+    second (associative) reduce.
+    """
+    def __init__(self, parter, hot_keys):
+        self.parter = parter
+        self.hot_keys = frozenset(hot_keys)
+        self._count = 0
+
+    def __call__(self, key, serialized_key, n):
+        if serialized_key in self.hot_keys:
+            self._count += 1
+            return self._count % n
+        return self.parter(key, serialized_key, n)
+
+
+class RangeParter(object):
+    """A partition function that assigns keys to sorted key ranges.
+
+    Split i holds the keys between `boundaries[i - 1]` (inclusive) and
+    `boundaries[i]` (exclusive), so with n - 1 sorted boundaries for n
+    splits, every key in a split is smaller than every key in the next one.
+    Keys past the last available split go to the last split.  Keys are
+    compared as Python objects, as when sorting reduce input.
+    """
+    def __init__(self, boundaries):
+        self.boundaries = list(boundaries)
+
+    def __call__(self, key, serialized_key, n):
+        return min(bisect.bisect_right(self.boundaries, key), n - 1)
 
 
 OP_CLASSES = dict((op.op_name, op) for op in (MapOperation, ReduceOperation,
@@ -40,6 +40,16 @@ def run_mockparallel(program, args, tmpdir):
     assert exitcode == 0
 
 
+def run_local(program, args, tmpdir):
+    args = ['-I', 'Local', '--mrs-workers', '2', '--mrs-tmpdir',
+            tmpdir.strpath] + args
+
+    with pytest.raises(SystemExit) as excinfo:
+        main(program, args=args)
+    exitcode = excinfo.value.args[0]
+    assert exitcode == 0
+
+
 def run_master_slave(program, args, tmpdir):
     runfile = tmpdir.join('runfile')
 
@@ -18,6 +18,7 @@
 from __future__ import division, print_function
 
 import errno
+from itertools import islice
 import math
 import os
 import random
@@ -37,6 +38,8 @@ ID_CHARACTERS = string.ascii_letters + string.digits
 BITS_IN_DOUBLE = 53
 ID_MAXLEN = int(BITS_IN_DOUBLE * math.log(2) / math.log(len(ID_CHARACTERS)))
 ID_RANGES = [len(ID_CHARACTERS) ** i for i in range(ID_MAXLEN + 1)]
+# Number of records given to batch map and reduce functions at a time.
+BATCH_SIZE = 4096
 
 # Python 3 compatibility
 PY3 = sys.version_info[0] == 3
@@ -110,6 +113,15 @@ def try_makedirs(path):
         if e.errno != errno.EEXIST:
             raise
 
+def iter_batches(pairs, size=BATCH_SIZE):
+    """Groups an iterable of key-value pairs into (keys, values) lists."""
+    pairs = iter(pairs)
+    while True:
+        chunk = list(islice(pairs, size))
+        if not chunk:
+            return
+        yield [key for key, _ in chunk], [value for _, value in chunk]
+
 def remove_recursive(path):
     """Do the equivalent of rm -r."""
     p = subprocess.Popen(['/bin/rm', '-rf', path], close_fds=True)
@@ -21,9 +21,16 @@ process is terminated when the main process quits.
 """
 
 import os
+import threading
 import traceback
 
+try:
+    import cPickle as pickle
+except ImportError:
+    import pickle
+
 from . import datasets
+from . import fileformats
 from . import tasks
 from . import util
 
@@ -131,6 +138,10 @@ class Worker(object):
                 self.args = request.args
                 logger.debug('Starting to run the user setup function.')
                 util.log_ram_usage()
+                codec = getattr(self.opts, 'mrs__codec', '')
+                if codec:
+                    fileformats.set_default_codec(codec,
+                            self.opts.mrs__codec_level)
                 self.program = self.program_class(self.opts, self.args)
                 self.default_dir = request.default_dir
                 response = WorkerSetupSuccess()
@@ -147,9 +158,11 @@ class Worker(object):
                         (request.dataset_id, request.task_index))
                 util.log_ram_usage()
                 max_sort_size = getattr(self.opts, 'mrs__max_sort_size', None)
+                sort_processes = getattr(self.opts, 'mrs__sort_processes', 1)
                 t = tasks.Task.from_args(*request.args, program=self.program)
                 t.run(self.program, self.default_dir,
-                        max_sort_size=max_sort_size)
+                        max_sort_size=max_sort_size,
+                        sort_processes=sort_processes)
                 response = WorkerSuccess(request.dataset_id,
                         request.task_index, t.outdir, t.outurls(),
                         request.id())
@@ -163,6 +176,12 @@ class Worker(object):
                     (request.dataset_id, request.task_index))
             request_id = request.id() if request else None
             tb = traceback.format_exc()
+            try:
+                pickle.dumps(e, -1)
+            except Exception:
+                # Some exceptions (such as an HTTPError holding an open
+                # response) can't be sent back through the pipe.
+                e = RuntimeError(str(e))
             response = WorkerFailure(request.dataset_id, request.task_index,
                     e, tb, request_id)
 
@@ -191,7 +210,10 @@ class WorkerManager(object):
     def worker_setup(self, opts, args, default_dir):
         request = WorkerSetupRequest(opts, args, default_dir)
         self.worker_pipe.send(request)
-        response = self.worker_pipe.recv()
+        return self._setup_response(self.worker_pipe.recv())
+
+    def _setup_response(self, response):
+        """Checks the response to a WorkerSetupRequest."""
         if isinstance(response, WorkerSetupSuccess):
             return True
         if isinstance(response, WorkerFailure):
@@ -212,7 +234,10 @@ class WorkerManager(object):
 
         assert self.current_task == (r.dataset_id, r.task_index)
         self.current_task = None
+        self._task_response(r)
 
+    def _task_response(self, r):
+        """Reports a WorkerSuccess or WorkerFailure."""
         if isinstance(r, WorkerSuccess):
             self.worker_success(r)
         elif isinstance(r, WorkerFailure):
@@ -248,4 +273,80 @@ class WorkerManager(object):
         """Called when a worker sends a WorkerFailure for the given task."""
         raise NotImplementedError
 
+
+class WorkerPoolManager(WorkerManager):
+    """Mixin class that provides methods for dealing with several Workers.
+
+    Each Worker runs one task at a time, so the number of Workers is the
+    number of task slots.  Assumes that a worker_pipes attribute (a list of
+    pipes) is defined and that read_worker_pipe is called with the index of
+    a pipe when data is available on it.
+
+    Attributes:
+        current_tasks: a list with the current task of each Worker (or None)
+    """
+    def init_worker_pool(self, worker_pipes):
+        self.worker_pipes = list(worker_pipes)
+        self.current_tasks = [None] * len(self.worker_pipes)
+        self._current_tasks_lock = threading.Lock()
+
+    @property
+    def slots(self):
+        """The number of tasks that can run at once."""
+        return len(self.worker_pipes)
+
+    def idle_slots(self):
+        """Returns the number of Workers without a current task."""
+        with self._current_tasks_lock:
+            return self.current_tasks.count(None)
+
+    def worker_setup(self, opts, args, default_dir):
+        request = WorkerSetupRequest(opts, args, default_dir)
+        for pipe in self.worker_pipes:
+            pipe.send(request)
+        # Receive every response (even after a failure) to keep the pipes
+        # in a consistent state.
+        results = [self._setup_response(pipe.recv())
+                for pipe in self.worker_pipes]
+        return all(results)
+
+    def read_worker_pipe(self, index):
+        """Reads a single response from the worker pipe with the given index.
+        """
+        r = self.worker_pipes[index].recv()
+        if not (isinstance(r, WorkerSuccess) or isinstance(r, WorkerFailure)):
+            assert False, 'Unexpected response type'
+
+        with self._current_tasks_lock:
+            assert self.current_tasks[index] == (r.dataset_id, r.task_index)
+            self.current_tasks[index] = None
+        self._task_response(r)
+
+    def submit_request(self, request):
+        """Submit the given request to an idle worker.
+
+        Task requests are only accepted if some worker is idle.  Other
+        requests go to an idle worker if there is one and otherwise to the
+        first worker.  Returns a boolean indicating whether the request was
+        accepted.
+
+        Called from the RPC thread.
+        """
+        with self._current_tasks_lock:
+            try:
+                index = self.current_tasks.index(None)
+            except ValueError:
+                if isinstance(request, WorkerTaskRequest):
+                    return False
+                index = 0
+            if isinstance(request, WorkerTaskRequest):
+                task = (request.dataset_id, request.task_index)
+                if task in self.current_tasks:
+                    logger.error('Task %s, %s is already running.' % task)
+                    return False
+                self.current_tasks[index] = task
+
+            self.worker_pipes[index].send(request)
+        return True
+
 # vim: et sw=4 sts=4
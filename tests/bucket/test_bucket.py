@@ -108,4 +108,19 @@ def test_roundtrip_write_only(tmpdir):
     listdir = tmpdir.listdir()
     assert listdir == []
 
+def test_sizes(tmpdir):
+    b = WriteBucket(2, 4, dir=tmpdir.strpath, format=BinWriter)
+    b.addpair((4, 'test'), write_only=True)
+    b.collect([(3, 'a'), (1, 'This'), (2, 'is')], write_only=True)
+    b.collect(iter([(5, 'more')]), write_only=True)
+    assert b.nrecords == 5
+    assert b.nbytes == 0
+
+    b.close_writer(do_sync=False)
+    readonly_copy = b.readonly_copy()
+    assert readonly_copy.nrecords == 5
+    assert readonly_copy.nbytes == tmpdir.join(b.prefix() + '.mrsb').size()
+    assert readonly_copy.nbytes > 0
+    assert len(list(readonly_copy.stream())) == 5
+
 # vim: et sw=4 sts=4
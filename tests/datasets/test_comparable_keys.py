@@ -0,0 +1,94 @@
+import random
+
+from mrs import datasets
+from mrs.serializers import (Serializers, bytes_comparable, int_serializer,
+        make_primitive_serializer, raw_serializer, sortable_int_serializer,
+        str_serializer, ComparableSerializer)
+
+
+def parter(key, serialized_key, n):
+    return key % n
+
+
+def make_pairs(n=20000):
+    rand = random.Random(11)
+    return [(rand.randrange(-500, 500), 'value %s' % i) for i in range(n)]
+
+
+class CountingSerializers(Serializers):
+    """Sortable int keys that count how many times they are deserialized."""
+    def __init__(self):
+        self.calls = 0
+        key_s = ComparableSerializer(sortable_int_serializer.dumps,
+                self.loads_key)
+        super(CountingSerializers, self).__init__(key_s, 'key_s', None, None)
+
+    def loads_key(self, b):
+        self.calls += 1
+        return sortable_int_serializer.loads(b)
+
+
+def sorted_input(tmpdir, pairs, serializers, sources=4):
+    urls = []
+    for source in range(sources):
+        ds = datasets.LocalData(pairs[source::sources], splits=1,
+                source=source, parter=parter, dir=str(tmpdir),
+                write_only=True, sort=True, serializers=serializers)
+        urls += [bucket.url for bucket in ds[:, :]]
+    return datasets.FileData(urls, splits=1, serializers=serializers)
+
+
+def test_bytes_comparable():
+    def s(key_s):
+        return Serializers(key_s, 'key_s', None, None)
+
+    assert bytes_comparable(s(raw_serializer))
+    assert bytes_comparable(s(str_serializer))
+    assert bytes_comparable(s(sortable_int_serializer))
+    assert bytes_comparable(s(make_primitive_serializer('>I')))
+    assert not bytes_comparable(s(make_primitive_serializer('<I')))
+    assert not bytes_comparable(s(make_primitive_serializer('>i')))
+    assert not bytes_comparable(s(int_serializer))
+    assert not bytes_comparable(s(None))
+    assert not bytes_comparable(None)
+
+
+def test_sortable_int_order():
+    numbers = [-2**63, -2**40, -1000, -1, 0, 1, 255, 256, 2**40, 2**63 - 1]
+    dumped = [sortable_int_serializer.dumps(i) for i in numbers]
+    assert sorted(dumped) == dumped
+    assert [sortable_int_serializer.loads(b) for b in dumped] == numbers
+
+
+def test_stream_split_sorted_raw_keys(tmpdir):
+    pairs = make_pairs()
+    serializers = CountingSerializers()
+    input_ds = sorted_input(tmpdir, pairs, serializers)
+
+    serializers.calls = 0
+    merged = list(input_ds.stream_split_sorted(0))
+    assert [key for key, _ in merged] == sorted(key for key, _ in pairs)
+    assert sorted(merged) == sorted(pairs)
+    # Keys are only deserialized at group boundaries.
+    assert serializers.calls == len(set(key for key, _ in pairs))
+
+
+def test_merge_sort_raw_keys(tmpdir):
+    pairs = make_pairs()
+    serializers = CountingSerializers()
+    input_ds = sorted_input(tmpdir.mkdir('input'), pairs, serializers)
+
+    for max_sort_size in (100, 0.05):
+        serializers.calls = 0
+        sorted_ds = datasets.MergeSortData(input_ds, 0, max_sort_size,
+                dir=str(tmpdir.mkdir('sort_%s' % max_sort_size)))
+        merged = list(sorted_ds.stream_data())
+        assert [key for key, _ in merged] == sorted(key for key, _ in pairs)
+        assert sorted(merged) == sorted(pairs)
+        if max_sort_size == 100:
+            assert serializers.calls == len(set(key for key, _ in pairs))
+        else:
+            assert len(sorted_ds[:, :]) > 1
+        sorted_ds.close()
+
+# vim: et sw=4 sts=4
@@ -0,0 +1,74 @@
+import multiprocessing
+import random
+
+import pytest
+
+from mrs import datasets
+from mrs.serializers import Serializers, str_serializer
+
+
+def make_pairs(n=20000):
+    rand = random.Random(5)
+    return [(rand.randrange(1000), 'value %s' % i) for i in range(n)]
+
+
+def make_input(tmpdir, pairs, serializers=None):
+    ds = datasets.LocalData(pairs, splits=1, dir=str(tmpdir), write_only=True,
+            serializers=serializers)
+    urls = [bucket.url for bucket in ds[:, :]]
+    return datasets.FileData(urls, splits=1, serializers=serializers)
+
+
+@pytest.mark.parametrize('max_sort_size', [100, 0.05])
+def test_parallel_sort(tmpdir, monkeypatch, max_sort_size):
+    monkeypatch.setattr(datasets, 'MERGE_FAN_IN', 4)
+    pairs = make_pairs()
+    input_ds = make_input(tmpdir.mkdir('input'), pairs)
+
+    sort_dir = tmpdir.mkdir('sort')
+    sorted_ds = datasets.MergeSortData(input_ds, 0, max_sort_size,
+            dir=str(sort_dir), processes=3)
+    runs = len(sorted_ds[:, :])
+    assert runs <= 4
+    if max_sort_size < 1:
+        assert runs > 1
+    # Merged runs are removed.
+    assert len(sort_dir.listdir()) == runs
+
+    # The sort is stable.
+    result = list(sorted_ds.stream_data())
+    assert result == sorted(pairs, key=lambda pair: pair[0])
+    sorted_ds.delete()
+
+
+def test_parallel_sort_raw_keys(tmpdir, monkeypatch):
+    monkeypatch.setattr(datasets, 'MERGE_FAN_IN', 2)
+    pairs = [(str(k), v) for k, v in make_pairs()]
+    serializers = Serializers(str_serializer, 'str_serializer', None, None)
+    input_ds = make_input(tmpdir.mkdir('input'), pairs, serializers)
+
+    sorted_ds = datasets.MergeSortData(input_ds, 0, 0.05,
+            dir=str(tmpdir.mkdir('sort')), processes=2)
+    assert len(sorted_ds[:, :]) == 2
+    result = list(sorted_ds.stream_data())
+    assert result == sorted(pairs, key=lambda pair: pair[0])
+    sorted_ds.delete()
+
+
+def test_parallel_sort_without_fork(tmpdir, monkeypatch):
+    def get_context(method=None):
+        raise ValueError('cannot find context for %r' % method)
+    monkeypatch.setattr(multiprocessing, 'get_context', get_context,
+            raising=False)
+    monkeypatch.setattr(datasets.sys, 'platform', 'win32')
+    pairs = make_pairs()
+    input_ds = make_input(tmpdir.mkdir('input'), pairs)
+
+    # The sort falls back to a single process.
+    sorted_ds = datasets.MergeSortData(input_ds, 0, 0.05,
+            dir=str(tmpdir.mkdir('sort')), processes=3)
+    result = list(sorted_ds.stream_data())
+    assert result == sorted(pairs, key=lambda pair: pair[0])
+    sorted_ds.delete()
+
+# vim: et sw=4 sts=4
@@ -0,0 +1,100 @@
+import random
+
+from mrs import datasets
+from mrs.fileformats import open_url
+from mrs.tasks import Operation, MapOperation
+
+
+def parter(key, serialized_key, n):
+    return key % n
+
+
+def make_pairs(n=20000):
+    rand = random.Random(7)
+    return [(rand.randrange(1000), 'value %s' % i) for i in range(n)]
+
+
+def read_bucket(bucket):
+    with open_url(bucket.url) as reader:
+        return list(reader)
+
+
+def check_sorted(ds, pairs, splits):
+    output = []
+    for bucket in ds[:, :]:
+        data = read_bucket(bucket)
+        keys = [key for key, _ in data]
+        assert keys == sorted(keys)
+        assert all(key % splits == bucket.split for key in keys)
+        output += data
+    assert sorted(output) == sorted(pairs)
+
+
+def test_sorted_in_ram(tmpdir):
+    pairs = make_pairs()
+    ds = datasets.LocalData(pairs, splits=3, parter=parter, dir=str(tmpdir),
+            write_only=True, sort=True)
+    check_sorted(ds, pairs, 3)
+    assert ds.sorted
+
+    # Without files to sort, the data are not claimed to be sorted.
+    ds = datasets.LocalData(pairs, splits=3, parter=parter, sort=True)
+    assert not ds.sorted
+
+
+def test_sorted_spill(tmpdir):
+    pairs = make_pairs()
+    ds = datasets.LocalData(pairs, splits=3, parter=parter, dir=str(tmpdir),
+            write_only=True, sort=True, max_sort_size=0.05)
+    check_sorted(ds, pairs, 3)
+    # Spilled runs are removed after they are merged.
+    assert len(tmpdir.listdir()) == 3
+
+
+def test_spill_counts_records(tmpdir, monkeypatch):
+    spills = []
+    spill_runs = datasets.LocalData._spill_runs
+    def count_spills(self, buffers, runs, sort_index=0):
+        spills.append(sum(len(records) for records in buffers.values()))
+        spill_runs(self, buffers, runs, sort_index)
+    monkeypatch.setattr(datasets.LocalData, '_spill_runs', count_spills)
+
+    # Tiny pairs still fill the buffer through their per-record overhead.
+    pairs = [(i % 7, b'') for i in range(20000)]
+    datasets.LocalData(pairs, splits=1, parter=parter, dir=str(tmpdir),
+            write_only=True, sort=True, max_sort_size=0.5)
+    assert spills
+    assert max(spills) * datasets.SORT_RECORD_OVERHEAD <= 0.6 * 1024 * 1024
+
+
+def test_sorted_values_stable(tmpdir):
+    pairs = [(i % 5, i) for i in range(5000)]
+    ds = datasets.LocalData(pairs, splits=1, parter=parter, dir=str(tmpdir),
+            write_only=True, sort=True, max_sort_size=0.01)
+    data = read_bucket(ds[0, 0])
+    assert data == sorted(pairs)
+
+
+def test_op_args():
+    op = MapOperation('map', '', 'partition', True)
+    new_op = Operation.from_args(*op.to_args())
+    assert new_op.sort_output
+    assert not Operation.from_args('map', 'map', '', 'partition').sort_output
+
+
+
+def test_stream_split_sorted(tmpdir):
+    pairs = make_pairs()
+    urls = []
+    for source in range(4):
+        ds = datasets.LocalData(pairs[source::4], splits=2, source=source,
+                parter=parter, dir=str(tmpdir), write_only=True, sort=True)
+        urls += [bucket.url for bucket in ds[:, 1]]
+
+    input_ds = datasets.FileData(urls, splits=1, first_split=1)
+    merged = list(input_ds.stream_split_sorted(1))
+    assert [key for key, _ in merged] == sorted(key for key, _ in pairs
+            if key % 2 == 1)
+    assert sorted(merged) == sorted(pair for pair in pairs if pair[0] % 2)
+
+# vim: et sw=4 sts=4
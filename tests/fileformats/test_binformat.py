@@ -1,4 +1,7 @@
-from mrs.fileformats import BinReader, BinWriter
+import pytest
+
+from mrs.fileformats import (BinReader, BinWriter, MmapBinReader, open_url,
+        READ_BUFFER_SIZE)
 from mrs.serializers import raw_serializer, Serializers
 
 try:
@@ -56,4 +59,124 @@ def test_pickle_roundtrip():
 
     assert new_pairs == kv_pairs
 
+
+def test_writepairs():
+    kv_pairs = [(i, str(i)) for i in range(10000)]
+
+    f = BytesIO()
+    writer = BinWriter(f)
+    writer.writepairs(kv_pairs[:5000])
+    for pair in kv_pairs[5000:]:
+        writer.writepair(pair)
+    writer.finish()
+
+    f.seek(0)
+
+    reader = BinReader(f)
+    new_pairs = list(reader)
+
+    assert new_pairs == kv_pairs
+
+
+def test_writepairs_serialized_keys():
+    serializers = Serializers(raw_serializer, '', raw_serializer, '')
+    kv_pairs = [('ignored', b'value 1'), ('ignored', b'value 2')]
+    serialized_keys = [b'key 1', b'key 2']
+
+    f = BytesIO()
+    writer = BinWriter(f, serializers=serializers)
+    writer.writepairs(kv_pairs, serialized_keys)
+    writer.finish()
+
+    f.seek(0)
+
+    reader = BinReader(f, serializers=serializers)
+    new_pairs = list(reader)
+
+    assert new_pairs == [(b'key 1', b'value 1'), (b'key 2', b'value 2')]
+
+
+def test_records_span_blocks():
+    # Values larger than a read block and many small records force the
+    # reader to refill and compact its buffer mid-record.
+    kv_pairs = [(i, b'x' * (i % 1000)) for i in range(2000)]
+    kv_pairs.append((-1, b'y' * (3 * READ_BUFFER_SIZE)))
+    kv_pairs.append((-2, b''))
+
+    f = BytesIO()
+    writer = BinWriter(f)
+    for pair in kv_pairs:
+        writer.writepair(pair)
+    writer.finish()
+
+    f.seek(0)
+
+    reader = BinReader(f)
+    new_pairs = list(reader)
+
+    assert new_pairs == kv_pairs
+
+
+def test_truncated():
+    serializers = Serializers(raw_serializer, '', raw_serializer, '')
+
+    f = BytesIO()
+    writer = BinWriter(f, serializers=serializers)
+    writer.writepair((b'key', b'value'))
+    writer.finish()
+    data = f.getvalue()
+
+    reader = BinReader(BytesIO(data[:-2]), serializers=serializers)
+    with pytest.raises(RuntimeError):
+        list(reader)
+
+    lone_key = data[:4 + 4 + len(b'key')]
+    reader = BinReader(BytesIO(lone_key), serializers=serializers)
+    with pytest.raises(RuntimeError) as excinfo:
+        list(reader)
+    assert 'lone key' in str(excinfo.value)
+
+
+def test_mmap(tmpdir):
+    kv_pairs = [(i, b'x' * (i % 100)) for i in range(1000)]
+    path = tmpdir.join('data.mrsb').strpath
+
+    with open(path, 'wb') as f:
+        writer = BinWriter(f)
+        writer.writepairs(kv_pairs)
+        writer.finish()
+
+    with open_url(path) as reader:
+        assert isinstance(reader, MmapBinReader)
+        new_pairs = list(reader)
+
+    assert new_pairs == kv_pairs
+
+    # Closing the reader in the middle of iteration must not fail.
+    with open_url(path) as reader:
+        it = iter(reader)
+        assert next(it) == kv_pairs[0]
+
+    # Resuming the iterator afterwards fails like reading a closed file.
+    with pytest.raises(ValueError):
+        next(it)
+    with pytest.raises(ValueError):
+        list(reader)
+
+
+def test_mmap_truncated(tmpdir):
+    path = tmpdir.join('data.mrsb').strpath
+    with open(path, 'wb') as f:
+        writer = BinWriter(f)
+        writer.writepair((b'key', b'value'))
+        writer.finish()
+    with open(path, 'rb') as f:
+        data = f.read()
+    with open(path, 'wb') as f:
+        f.write(data[:-1])
+
+    with open_url(path) as reader:
+        with pytest.raises(RuntimeError):
+            list(reader)
+
 # vim: et sw=4 sts=4
@@ -0,0 +1,109 @@
+import gc
+import threading
+import time
+
+import pytest
+
+from mrs import fileformats
+from mrs.fileformats import (BlockReader, BlockWriter, codec_map,
+        codec_writer, writerformat)
+
+try:
+    from cStringIO import StringIO as BytesIO
+except ImportError:
+    from io import BytesIO
+
+
+def roundtrip(writer_cls, kv_pairs, threaded=True):
+    f = BytesIO()
+    writer = writer_cls(f)
+    writer.writepairs(kv_pairs)
+    writer.finish()
+
+    f.seek(0)
+
+    reader = BlockReader(f, threaded=threaded)
+    new_pairs = list(reader)
+    reader.close()
+    return new_pairs
+
+
+@pytest.mark.parametrize('codec', sorted(codec_map))
+def test_codecs(codec):
+    kv_pairs = [(i, 'value %s' % i) for i in range(50000)]
+    writer_cls = codec_writer(codec)
+
+    assert roundtrip(writer_cls, kv_pairs) == kv_pairs
+    assert roundtrip(writer_cls, kv_pairs, threaded=False) == kv_pairs
+
+
+def test_default_codec():
+    kv_pairs = [(b'key 1', b'value 1'), (b'hello', b'world')]
+    assert roundtrip(BlockWriter, kv_pairs) == kv_pairs
+    assert roundtrip(BlockWriter, []) == []
+
+
+def test_spec():
+    writer_cls = codec_writer('zlib', 3)
+    assert writer_cls.spec() == 'mrsc:zlib:3'
+    assert writer_cls.ext == 'mrsc'
+
+    new_cls = writerformat(writer_cls.spec())
+    assert issubclass(new_cls, BlockWriter)
+    assert new_cls.codec == 'zlib'
+    assert new_cls.level == 3
+
+    assert writerformat('mrsc') is BlockWriter
+    assert writerformat('mrsb') is fileformats.BinWriter
+
+
+def test_unknown_codec():
+    with pytest.raises(RuntimeError):
+        codec_writer('no-such-codec')
+
+
+def test_truncated():
+    f = BytesIO()
+    writer = codec_writer('zlib')(f)
+    writer.writepairs((i, i) for i in range(1000))
+    writer.finish()
+    data = f.getvalue()
+
+    reader = BlockReader(BytesIO(data[:-10]))
+    with pytest.raises(RuntimeError):
+        list(reader)
+    reader.close()
+
+
+def reader_threads():
+    return [t for t in threading.enumerate() if t.name == 'Block Reader']
+
+
+@pytest.mark.parametrize('truncate', [False, True])
+def test_abandoned_reader(truncate):
+    f = BytesIO()
+    writer = codec_writer('zlib')(f)
+    writer.buffer_size = 1024
+    writer.writepairs((i, 'value %s' % i) for i in range(50000))
+    writer.finish()
+    data = f.getvalue()
+    if truncate:
+        data = data[:-10]
+
+    before = len(reader_threads())
+    reader = BlockReader(BytesIO(data))
+    next(iter(reader))
+    assert len(reader_threads()) == before + 1
+
+    # The reader is dropped without being closed.
+    # (The thread may hold the reader while reading a block, so collection
+    # is retried.)
+    del reader
+    for _ in range(50):
+        gc.collect()
+        if len(reader_threads()) == before:
+            break
+        time.sleep(0.05)
+    assert len(reader_threads()) == before
+
+# vim: et sw=4 sts=4
@@ -0,0 +1,105 @@
+from __future__ import division
+
+import pytest
+
+from mrs import fileformats
+from mrs.fileformats import ColumnReader, ColumnWriter, writerformat
+from mrs.serializers import raw_serializer, Serializers
+
+try:
+    import cPickle as pickle
+except ImportError:
+    import pickle
+
+try:
+    from cStringIO import StringIO as BytesIO
+except ImportError:
+    from io import BytesIO
+
+
+def write(kv_pairs, writer_cls=ColumnWriter, batch_size=None):
+    f = BytesIO()
+    writer = writer_cls(f)
+    if batch_size is not None:
+        writer.batch_size = batch_size
+    writer.writepairs(kv_pairs)
+    writer.finish()
+    return f.getvalue()
+
+
+def test_roundtrip():
+    kv_pairs = [(i, i / 3) for i in range(10000)]
+    data = write(kv_pairs, batch_size=1000)
+
+    reader = ColumnReader(BytesIO(data))
+    assert list(reader) == kv_pairs
+    assert list(ColumnReader(BytesIO(write([])))) == []
+
+
+def test_batches():
+    kv_pairs = [(i, i / 3) for i in range(10000)]
+    data = write(kv_pairs, batch_size=1000)
+
+    reader = ColumnReader(BytesIO(data), use_numpy=False)
+    batches = list(reader.iterbatches())
+    assert len(batches) == 10
+    keys, values = batches[0]
+    assert keys.typecode == 'q'
+    assert list(keys) == list(range(1000))
+    assert list(values) == [i / 3 for i in range(1000)]
+
+
+def test_writebatch():
+    f = BytesIO()
+    writer = ColumnWriter.with_types('i', 'f')(f)
+    writer.writepair((-1, 0.5))
+    writer.writebatch(range(5), [2.0] * 5)
+    writer.finish()
+
+    reader = ColumnReader(BytesIO(f.getvalue()))
+    assert list(reader) == [(-1, 0.5)] + [(i, 2.0) for i in range(5)]
+    assert reader.key_type == 'i'
+    assert reader.value_type == 'f'
+
+    with pytest.raises(RuntimeError):
+        writer.writebatch([1, 2], [1.0])
+
+
+def test_numpy():
+    numpy = pytest.importorskip('numpy')
+    f = BytesIO()
+    writer = ColumnWriter(f)
+    writer.writebatch(numpy.arange(100), numpy.linspace(0, 1, 100))
+    writer.finish()
+
+    reader = ColumnReader(BytesIO(f.getvalue()))
+    (keys, values), = list(reader.iterbatches())
+    assert isinstance(keys, numpy.ndarray)
+    assert (keys == numpy.arange(100)).all()
+    assert (values == numpy.linspace(0, 1, 100)).all()
+
+
+def test_spec():
+    writer_cls = writerformat('mrsa:i:d')
+    assert issubclass(writer_cls, ColumnWriter)
+    assert writer_cls.key_type == 'i'
+    assert writer_cls.spec() == 'mrsa:i:d'
+    assert fileformats.fileformat('x.mrsa') is ColumnReader
+
+    with pytest.raises(RuntimeError):
+        ColumnWriter.with_types('O', 'd')
+
+
+def test_raw_serializers():
+    kv_pairs = [(i, i / 3) for i in range(100)]
+    raw = Serializers(raw_serializer, '', raw_serializer, '')
+    reader = ColumnReader(BytesIO(write(kv_pairs)), serializers=raw)
+    assert [(pickle.loads(k), pickle.loads(v)) for k, v in reader] == kv_pairs
+
+
+def test_truncated():
+    data = write([(i, i) for i in range(100)])
+    with pytest.raises(RuntimeError):
+        list(ColumnReader(BytesIO(data[:-1])))
+
+# vim: et sw=4 sts=4
@@ -0,0 +1,161 @@
+import pytest
+
+from mrs import datasets
+from mrs.fileformats import (IndexedReader, IndexedWriter, block_splits,
+        open_url, split_url, writerformat)
+from mrs.serializers import raw_serializer, Serializers
+
+try:
+    from cStringIO import StringIO as BytesIO
+except ImportError:
+    from io import BytesIO
+
+
+RAW = Serializers(raw_serializer, '', raw_serializer, '')
+
+
+def write(kv_pairs, writer_cls=IndexedWriter, block_size=None,
+        serializers=None):
+    f = BytesIO()
+    writer = writer_cls(f, serializers=serializers)
+    if block_size is not None:
+        writer.buffer_size = block_size
+    writer.writepairs(kv_pairs)
+    writer.finish()
+    return f.getvalue()
+
+
+def read(data, **kwds):
+    reader = IndexedReader(BytesIO(data), **kwds)
+    pairs = list(reader)
+    reader.close()
+    return pairs
+
+
+def sorted_pairs(n):
+    return [(('%06d' % i).encode('ascii'), b'value') for i in range(n)]
+
+
+def test_roundtrip():
+    kv_pairs = [(i, 'value %s' % i) for i in range(20000)]
+    data = write(kv_pairs, block_size=4096)
+    assert read(data) == kv_pairs
+    assert read(data, threaded=False) == kv_pairs
+    assert read(write([])) == []
+
+
+def test_compressed():
+    kv_pairs = [(i, 'value %s' % i) for i in range(20000)]
+    writer_cls = writerformat('mrsi:zlib:1')
+    assert issubclass(writer_cls, IndexedWriter)
+    assert writer_cls.spec() == 'mrsi:zlib:1'
+    assert read(write(kv_pairs, writer_cls)) == kv_pairs
+
+
+def test_index():
+    kv_pairs = sorted_pairs(10000)
+    data = write(kv_pairs, block_size=4096, serializers=RAW)
+
+    reader = IndexedReader(BytesIO(data), serializers=RAW)
+    index = reader.read_index()
+    assert reader.sorted
+    assert len(index) > 1
+    assert sum(info.count for info in index) == len(kv_pairs)
+    assert index[0].first_key == kv_pairs[0][0]
+    assert index[-1].last_key == kv_pairs[-1][0]
+    # Reading the index does not disturb iteration.
+    assert list(reader) == kv_pairs
+    reader.close()
+
+    unsorted = write(reversed(kv_pairs), serializers=RAW)
+    reader = IndexedReader(BytesIO(unsorted), serializers=RAW)
+    reader.read_index()
+    assert not reader.sorted
+    with pytest.raises(RuntimeError):
+        reader.find_blocks(b'000100')
+
+
+def test_splits():
+    kv_pairs = sorted_pairs(10000)
+    data = write(kv_pairs, block_size=4096, serializers=RAW)
+    index = IndexedReader(BytesIO(data)).read_index()
+
+    splits = block_splits(index, 4)
+    assert len(splits) == 4
+    pairs = []
+    for blocks in splits:
+        pairs += read(data, blocks=blocks, serializers=RAW)
+    assert pairs == kv_pairs
+
+
+def test_split_url(tmpdir):
+    kv_pairs = sorted_pairs(10000)
+    path = tmpdir.join('data.mrsi')
+    path.write(write(kv_pairs, block_size=4096, serializers=RAW), mode='wb')
+
+    urls = split_url(path.strpath, 30000)
+    assert len(urls) > 1
+    assert all('#blocks=' in url for url in urls)
+    pairs = []
+    for url in urls:
+        with open_url(url, serializers=RAW) as reader:
+            pairs += list(reader)
+    assert pairs == kv_pairs
+    assert split_url(path.strpath, 10**9) == [path.strpath]
+
+    ds = datasets.FileData([path.strpath], split_size=30000, serializers=RAW)
+    assert ds.splits == len(urls)
+    ds.fetchall()
+    assert sorted(ds.data()) == kv_pairs
+
+
+def test_index_after_records():
+    data = write(sorted_pairs(1000), block_size=4096, serializers=RAW)
+    reader = IndexedReader(BytesIO(data), serializers=RAW)
+    next(iter(reader))
+    # The read-ahead thread is using the file, so the index can't be read.
+    with pytest.raises(RuntimeError):
+        reader.read_index()
+    reader.close()
+
+
+def test_find_blocks():
+    kv_pairs = sorted_pairs(10000)
+    data = write(kv_pairs, block_size=4096, serializers=RAW)
+
+    reader = IndexedReader(BytesIO(data), serializers=RAW)
+    start, stop = reader.find_blocks(b'004000', b'004999')
+    assert 0 < start < stop < len(reader.read_index())
+    reader.close()
+
+    pairs = read(data, blocks=(start, stop), serializers=RAW)
+    keys = [key for key, value in pairs]
+    assert keys[0] <= b'004000'
+    assert keys[-1] >= b'004999'
+    assert len(keys) < len(kv_pairs)
+
+
+def test_corrupt():
+    kv_pairs = sorted_pairs(10000)
+    data = bytearray(write(kv_pairs, block_size=4096, serializers=RAW))
+    index = IndexedReader(BytesIO(bytes(data))).read_index()
+
+    # Change a value in the middle of the second block.
+    info = index[1]
+    position = data.find(b'value', info.offset + info.raw_len // 2)
+    data[position] = ord('V')
+    data = bytes(data)
+
+    with pytest.raises(RuntimeError):
+        read(data, serializers=RAW)
+    pairs = read(data, serializers=RAW, skip_corrupt=True)
+    assert len(pairs) == len(kv_pairs) - info.count
+    assert len(read(data, serializers=RAW, verify=False)) == len(kv_pairs)
+
+
+def test_truncated():
+    data = write([(i, i) for i in range(1000)])
+    with pytest.raises(RuntimeError):
+        read(data[:20])
+
+# vim: et sw=4 sts=4
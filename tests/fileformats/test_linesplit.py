@@ -0,0 +1,131 @@
+import random
+import threading
+
+import pytest
+
+try:
+    from http.server import BaseHTTPRequestHandler, HTTPServer
+except ImportError:
+    from BaseHTTPServer import BaseHTTPRequestHandler, HTTPServer
+
+from mrs import datasets
+from mrs import fileformats
+from mrs.fileformats import byte_range_url, open_url, split_url
+
+
+def make_file(tmpdir, n=1000):
+    rand = random.Random(42)
+    lines = [('line %s %s\n' % (i, 'x' * rand.randrange(100))).encode('ascii')
+            for i in range(n)]
+    path = tmpdir.join('input.txt')
+    path.write(b''.join(lines), mode='wb')
+    return str(path), lines
+
+
+def read_lines(url):
+    with open_url(url) as reader:
+        return [(key, value.encode('utf-8')) for key, value in reader]
+
+
+@pytest.mark.parametrize('split_size', [1, 7, 100, 1000, 10**6])
+def test_split_lines(tmpdir, split_size):
+    path, lines = make_file(tmpdir)
+    urls = split_url(path, split_size)
+
+    pairs = []
+    for url in urls:
+        pairs += read_lines(url)
+    assert [line for _, line in pairs] == lines
+
+    if len(urls) > 1:
+        # Keys are byte offsets.
+        offset = 0
+        for (key, _), line in zip(pairs, lines):
+            assert key == offset
+            offset += len(line)
+
+
+def test_split_boundaries(tmpdir):
+    path, lines = make_file(tmpdir, 10)
+    # A range starting exactly at the beginning of a line includes it.
+    second = len(lines[0])
+    pairs = read_lines(byte_range_url(path, second, second + 1))
+    assert pairs == [(second, lines[1])]
+    # A range ending exactly at the beginning of a line excludes it.
+    pairs = read_lines(byte_range_url(path, 0, second))
+    assert pairs == [(0, lines[0])]
+
+
+def test_unsplittable(tmpdir):
+    path = str(tmpdir.join('data.mrsb'))
+    with open(path, 'wb') as f:
+        writer = fileformats.BinWriter(f)
+        writer.writepairs((i, i) for i in range(1000))
+        writer.finish()
+    assert split_url(path, 100) == [path]
+
+
+def test_file_data(tmpdir):
+    path, lines = make_file(tmpdir)
+    data = datasets.FileData([path], split_size=4096)
+    buckets = data[:, :]
+    assert len(buckets) > 1
+
+    data.fetchall()
+    values = [value.encode('utf-8') for bucket in buckets
+            for _, value in bucket]
+    assert values == lines
+
+
+class RangeHandler(BaseHTTPRequestHandler):
+    """Serves `data`, honoring Range requests if `honor_range` is set."""
+    data = b''
+    honor_range = True
+
+    def do_GET(self):
+        data = self.data
+        byte_range = self.headers.get('Range')
+        if self.honor_range and byte_range:
+            start = int(byte_range.split('=')[1].rstrip('-'))
+            self.send_response(206)
+            self.send_header('Content-Range', 'bytes %s-%s/%s'
+                    % (start, len(data) - 1, len(data)))
+            data = data[start:]
+        else:
+            self.send_response(200)
+        self.send_header('Content-Length', str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+    def log_message(self, *args):
+        pass
+
+
+@pytest.mark.parametrize('honor_range', [True, False])
+def test_remote_range(tmpdir, honor_range):
+    path, lines = make_file(tmpdir, 100)
+    with open(path, 'rb') as f:
+        data = f.read()
+    handler = type('Handler', (RangeHandler,), {'data': data,
+        'honor_range': honor_range})
+    server = HTTPServer(('127.0.0.1', 0), handler)
+    thread = threading.Thread(target=server.serve_forever)
+    thread.daemon = True
+    thread.start()
+    try:
+        url = 'http://127.0.0.1:%s/input.txt' % server.server_address[1]
+        start = len(data) // 2
+        pairs = read_lines(byte_range_url(url, start, len(data)))
+    finally:
+        server.shutdown()
+        server.server_close()
+
+    expected = []
+    offset = 0
+    for line in lines:
+        if offset >= start:
+            expected.append((offset, line))
+        offset += len(line)
+    assert pairs == expected
+
+# vim: et sw=4 sts=4
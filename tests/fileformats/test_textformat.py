@@ -0,0 +1,86 @@
+# coding=utf-8
+
+from mrs import fileformats
+from mrs.fileformats import TextReader, TextWriter
+from mrs.serializers import (int_serializer, raw_serializer, str_serializer,
+        Serializers)
+
+from io import BytesIO
+import random
+
+
+def roundtrip(kv_pairs, serializers=None):
+    f = BytesIO()
+    writer = TextWriter(f)
+    writer.writepairs(kv_pairs)
+    writer.finish()
+    data = f.getvalue()
+
+    reader = TextReader(BytesIO(data), serializers)
+    return list(reader)
+
+
+def test_strings():
+    kv_pairs = [(u'key%s' % i, u'value %s ∞' % i) for i in range(50000)]
+    assert roundtrip(kv_pairs) == kv_pairs
+
+
+def test_type_hints():
+    kv_pairs = [(i, i * i) for i in range(1000)]
+    ints = Serializers(int_serializer, 'int', int_serializer, 'int')
+    assert roundtrip(kv_pairs, ints) == kv_pairs
+
+    mixed = Serializers(str_serializer, 'str', int_serializer, 'int')
+    assert roundtrip(kv_pairs, mixed) == [(str(k), v) for k, v in kv_pairs]
+
+    raw = Serializers(raw_serializer, 'raw', raw_serializer, 'raw')
+    assert roundtrip(kv_pairs, raw) == [(str(k).encode('ascii'),
+        str(v).encode('ascii')) for k, v in kv_pairs]
+
+
+def test_no_final_newline():
+    reader = TextReader(BytesIO(b'a 1\nb 2\nc'))
+    assert list(reader) == [(u'a', u'1'), (u'b', u'2'), (u'c', u'')]
+
+
+def test_registered(tmpdir):
+    path = tmpdir.join('output.mtxt')
+    path.write(b'word 3\nother 5\n', mode='wb')
+    ints = Serializers(str_serializer, 'str', int_serializer, 'int')
+    with fileformats.open_url(str(path), serializers=ints) as reader:
+        assert list(reader) == [(u'word', 3), (u'other', 5)]
+
+
+def read_range(reader_cls, data, start, end, **kwds):
+    f = BytesIO(data)
+    f.seek(max(start - 1, 0))
+    return reader_cls(f, byte_range=(start, end), **kwds)
+
+
+def test_byte_range():
+    rand = random.Random(3)
+    data = b''.join(('key%s value %s ∞\n' % (i, 'x' * rand.randrange(200))
+        ).encode('utf-8') for i in range(40000))
+    size = len(data)
+    assert size > 8 * fileformats.READ_BUFFER_SIZE
+    line_start = data.index(b'\n', size // 3) + 1
+    raw = Serializers(raw_serializer, 'raw', raw_serializer, 'raw')
+
+    # Ranges that start and end mid-line, at line starts, and past the end.
+    for start, end in [(0, size), (size // 7, size - 1000),
+            (line_start, size // 3 * 2 + 1), (size // 5, size + 10)]:
+        lines = [line.rstrip(b'\n') for _, line in
+                read_range(fileformats.BytesLineReader, data, start, end)]
+        expected = [tuple(line.split(b' ', 1)) for line in lines]
+
+        reader = read_range(TextReader, data, start, end, serializers=raw)
+        assert list(reader) == expected
+        reader = read_range(TextReader, data, start, end)
+        assert list(reader) == [(k.decode('utf-8'), v.decode('utf-8'))
+                for k, v in expected]
+
+    # The range is read in chunks rather than all at once.
+    reader = read_range(TextReader, data, size // 7, size - 1000)
+    assert len(list(reader._iter_line_blocks())) > 4
+
+# vim: et sw=4 sts=4
@@ -28,10 +28,14 @@ def pytest_generate_tests(metafunc):
             for i in (1, 3, 5):
                 metafunc.addcall(funcargs={'mrs_impl': 'mockparallel',
                     'mrs_reduce_tasks': i})
+            for i in (1, 3):
+                metafunc.addcall(funcargs={'mrs_impl': 'local',
+                    'mrs_reduce_tasks': i})
             metafunc.addcall(funcargs={'mrs_impl': 'master_slave',
                 'mrs_reduce_tasks': 1})
         else:
-            for mrs_impl in ['serial', 'mockparallel', 'master_slave']:
+            for mrs_impl in ['serial', 'mockparallel', 'local',
+                    'master_slave']:
                 metafunc.addcall(funcargs={'mrs_impl': mrs_impl})
 
 
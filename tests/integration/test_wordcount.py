@@ -16,7 +16,8 @@
 from collections import defaultdict
 import glob
 
-from mrs.test import run_serial, run_mockparallel, run_master_slave
+from mrs.test import (run_serial, run_mockparallel, run_local,
+        run_master_slave)
 from .wordcount import WordCount
 
 
@@ -31,6 +32,9 @@ def test_dickens(mrs_impl, mrs_reduce_tasks, tmpdir):
     elif mrs_impl == 'mockparallel':
         args = ['--mrs-reduce-tasks', str(mrs_reduce_tasks)] + args
         run_mockparallel(WordCount, args, tmpdir)
+    elif mrs_impl == 'local':
+        args = ['--mrs-reduce-tasks', str(mrs_reduce_tasks)] + args
+        run_local(WordCount, args, tmpdir)
     elif mrs_impl == 'master_slave':
         args = ['--mrs-reduce-tasks', str(mrs_reduce_tasks)] + args
         run_master_slave(WordCount, args, tmpdir)
@@ -19,7 +19,8 @@ from collections import defaultdict
 import glob
 import tempfile
 
-from mrs.test import run_serial, run_mockparallel, run_master_slave
+from mrs.test import (run_serial, run_mockparallel, run_local,
+        run_master_slave)
 from .wordcount2 import WordCount2
 
 
@@ -39,6 +40,9 @@ def test_dickens(mrs_impl, mrs_reduce_tasks, tmpdir):
         elif mrs_impl == 'mockparallel':
             args = ['--mrs-reduce-tasks', str(mrs_reduce_tasks)] + args
             run_mockparallel(WordCount2, args, tmpdir)
+        elif mrs_impl == 'local':
+            args = ['--mrs-reduce-tasks', str(mrs_reduce_tasks)] + args
+            run_local(WordCount2, args, tmpdir)
         elif mrs_impl == 'master_slave':
             args = ['--mrs-reduce-tasks', str(mrs_reduce_tasks)] + args
             run_master_slave(WordCount2, args, tmpdir)
@@ -0,0 +1,26 @@
+import pickle
+from collections import Counter
+
+from mrs.mapreduce import MapReduce
+
+
+class Program(MapReduce):
+    def __init__(self):
+        pass
+
+
+def test_default_partition():
+    program = Program()
+    assert program.partition == program.crc32_partition
+
+    # The split depends only on the serialized key, so it is the same in
+    # every process regardless of hash randomization.
+    assert program.partition('a', b'a', 1000) == 0xe8b7be43 % 1000
+
+    keys = [pickle.dumps('word%s' % i, 2) for i in range(10000)]
+    for n in (2, 7, 16):
+        counts = Counter(program.partition(None, k, n) for k in keys)
+        assert sorted(counts) == list(range(n))
+        assert max(counts.values()) < 1.1 * len(keys) / n
+
+# vim: et sw=4 sts=4
@@ -183,5 +183,79 @@ def test_add_to_smaller_host():
     assert slaves._max_count == 3
     slaves._consistency_check()
 
+def test_multiple_slots():
+    host1 = 'host1'
+    slave1 = Slave(host1, 'slave1')
+    host2 = 'host2'
+    slave2 = Slave(host2, 'slave2')
+    slave3 = Slave(host2, 'slave3')
+
+    slaves = IdleSlaves()
+    slaves.add(slave1, 4)
+    slaves.add(slave2, 1)
+    slaves.add(slave3, 2)
+    assert len(slaves) == 7
+    assert slaves._max_count == 4
+    assert slaves.slots(slave1) == 4
+    slaves._consistency_check()
+
+    # Setting the count again replaces it instead of adding to it.
+    slaves.add(slave1, 3)
+    assert len(slaves) == 6
+    assert slaves._max_count == 3
+    slaves._consistency_check()
+
+    # Slots are taken from the host with the most idle slots, so each host
+    # keeps getting work.
+    popped = [slaves.pop() for i in range(6)]
+    slaves._consistency_check()
+    assert len(slaves) == 0
+    assert popped.count(slave1) == 3
+    assert popped.count(slave2) == 1
+    assert popped.count(slave3) == 2
+    assert [s.host for s in popped[:2]] in ([host1, host2], [host2, host1])
+
+    with pytest.raises(KeyError):
+        slaves.pop()
+
+def test_zero_slots():
+    slave1 = Slave('host1', 'slave1')
+
+    slaves = IdleSlaves()
+    slaves.add(slave1, 2)
+    assert slave1 in slaves
+    slaves.add(slave1, 0)
+    assert slave1 not in slaves
+    assert len(slaves) == 0
+    slaves._consistency_check()
+
+def test_pop_host():
+    host1 = 'host1'
+    slave1 = Slave(host1, 'slave1')
+    host2 = 'host2'
+    slave2 = Slave(host2, 'slave2')
+    slave3 = Slave(host2, 'slave3')
+
+    slaves = IdleSlaves()
+    slaves.add(slave1, 1)
+    slaves.add(slave2, 2)
+    slaves.add(slave3, 1)
+    assert slaves.host_slots(host1) == 1
+    assert slaves.host_slots(host2) == 3
+
+    # A slot is taken from the requested host even if another is more idle.
+    assert slaves.pop(host1) is slave1
+    assert slaves.host_slots(host1) == 0
+    slaves._consistency_check()
+    with pytest.raises(KeyError):
+        slaves.pop(host1)
+    with pytest.raises(KeyError):
+        slaves.pop('host3')
+
+    assert slaves.pop(host2) is slave2
+    assert slaves.host_slots(host2) == 2
+    assert len(slaves) == 2
+    slaves._consistency_check()
+
 
 # vim: et sw=4 sts=4
@@ -0,0 +1,55 @@
+import os
+
+from mrs.master import Slaves
+
+
+class ChoreQueue(object):
+    def do(self, f, args=(), delay=None):
+        pass
+
+
+class RPC(object):
+    def __init__(self, results):
+        self.results = results
+        self.calls = []
+
+    def start_tasks(self, task_list, cookie):
+        self.calls.append(task_list)
+        return self.results
+
+    def start_task(self, *args):
+        self.calls.append([args[:-1]])
+        return self.results[0]
+
+
+def make_slave(results, assignments):
+    read_pipe, write_pipe = os.pipe()
+    slaves = Slaves(write_pipe, ChoreQueue(), 10, 10)
+    slave = slaves.new_slave('localhost', 0, 'cookie', slots=len(assignments))
+    slave._rpc = RPC(results)
+    for dataset_id, task_index in assignments:
+        assert slave.set_assignment((dataset_id, task_index))
+        slave._pending_tasks.append(((), [], dataset_id, task_index))
+    return slaves, slave
+
+
+def test_rejected_task():
+    assignments = [('ds', 0), ('ds', 1), ('ds', 2)]
+    slaves, slave = make_slave([True, False, True], assignments)
+    slave.send_assignments()
+
+    # Only the rejected task is requeued, and the slave is kept.
+    assert slave.alive()
+    assert slaves.get_failed_tasks() == [('ds', 1)]
+    assert sorted(slave.current_assignments()) == [('ds', 0), ('ds', 2)]
+    assert slaves.get_changed_slaves() == set([slave])
+
+
+def test_single_rejected_task():
+    slaves, slave = make_slave([False], [('ds', 3)])
+    slave.send_assignments()
+    assert slave.alive()
+    assert slaves.get_failed_tasks() == [('ds', 3)]
+    assert not slave.current_assignments()
+
+# vim: et sw=4 sts=4
@@ -0,0 +1,102 @@
+# Mrs
+# Copyright 2008-2012 Brigham Young University
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+from mrs import runner
+from mrs.runner import TaskList
+
+class Bucket(object):
+    def __init__(self, source, nbytes=0):
+        self.source = source
+        self.url = 'file:///bucket_%s' % source
+        self.nbytes = nbytes
+
+class Dataset(object):
+    def __init__(self, ntasks, sizes=None):
+        self.id = 'ds'
+        self.ntasks = ntasks
+        self.permanent = False
+        self.sizes = sizes
+
+    def __getitem__(self, key):
+        _, task_index = key
+        if self.sizes is None:
+            return [Bucket(task_index)]
+        else:
+            return [Bucket(source, nbytes)
+                    for source, nbytes in enumerate(self.sizes[task_index])]
+
+class Clock(object):
+    def __init__(self):
+        self.now = 1000.0
+
+    def time(self):
+        return self.now
+
+def make_tasklist(ntasks, monkeypatch):
+    clock = Clock()
+    monkeypatch.setattr(runner.time, 'time', clock.time)
+    tasklist = TaskList(Dataset(ntasks), Dataset(ntasks))
+    tasklist.make_tasks(set(), set(), ())
+    return tasklist, clock
+
+def test_largest_first():
+    sizes = [[10, 0], [], [300], [5, 95], [50, 50]]
+    tasklist = TaskList(Dataset(5), Dataset(5, sizes))
+    tasklist.make_tasks(set(), set(), ())
+    # Ties keep their original order, and task 1 has no input.
+    order = [tasklist.pop()[1] for i in range(len(tasklist))]
+    assert order == [2, 3, 4, 0]
+
+def test_straggler(monkeypatch):
+    tasklist, clock = make_tasklist(4, monkeypatch)
+    tasks = [tasklist.pop() for i in range(4)]
+    assert tasklist.pop() is None
+    # Nothing is backed up before any task completes.
+    assert tasklist.pop_straggler(2) is None
+
+    clock.now += 10
+    for t in tasks[:3]:
+        tasklist.task_done(t[1])
+    assert tasklist.median_runtime() == 10
+    assert tasklist.pop_straggler(2) is None
+
+    clock.now += 11
+    assert tasklist.pop_straggler(2, exclude=[tasks[3]]) is None
+    assert tasklist.pop_straggler(2) == tasks[3]
+    # Only one backup is made of each task.
+    assert tasklist.pop_straggler(2) is None
+
+    # A failed copy is not retried while its backup is still running.
+    assert tasklist.task_failed(tasks[3][1]) == 1
+    assert tasklist.pop() is None
+    tasklist.task_done(tasks[3][1])
+    assert tasklist.complete()
+    # The loser is ignored once the task is done.
+    assert tasklist.task_failed(tasks[3][1]) == 0
+    assert tasklist.pop() is None
+
+def test_min_runtime(monkeypatch):
+    tasklist, clock = make_tasklist(2, monkeypatch)
+    first, second = tasklist.pop(), tasklist.pop()
+    clock.now += 0.01
+    tasklist.task_done(first[1])
+
+    # Very short tasks are not worth backing up.
+    clock.now += runner.MIN_SPECULATIVE_RUNTIME / 2
+    assert tasklist.pop_straggler(2) is None
+    clock.now += runner.MIN_SPECULATIVE_RUNTIME
+    assert tasklist.pop_straggler(2) == second
+
+# vim: et sw=4 sts=4
@@ -0,0 +1,81 @@
+import pickle
+import random
+
+import pytest
+
+from mrs import sortbuffer
+from mrs.sortbuffer import SortBuffer
+
+
+def make_pairs(n=5000):
+    rand = random.Random(3)
+    return [(rand.randrange(100), i) for i in range(n)]
+
+
+def serialize(pairs):
+    return [(pickle.dumps(k), pickle.dumps(v)) for k, v in pairs]
+
+
+@pytest.mark.parametrize('chunk_size', [1, 7, 1000, 1024 * 1024])
+def test_sort_stable(monkeypatch, chunk_size):
+    monkeypatch.setattr(sortbuffer, 'SORT_CHUNK_SIZE', chunk_size)
+    pairs = make_pairs()
+    buf = SortBuffer(pickle.loads)
+    for key, value in serialize(pairs):
+        buf.append(key, value)
+    assert len(buf) == len(pairs)
+
+    # Before sorting, pairs come out in insertion order.
+    assert list(buf) == serialize(pairs)
+
+    buf.sort()
+    result = [(pickle.loads(k), pickle.loads(v)) for k, v in buf]
+    assert result == sorted(pairs, key=lambda pair: pair[0])
+
+
+def test_sort_raw_keys(monkeypatch):
+    monkeypatch.setattr(sortbuffer, 'SORT_CHUNK_SIZE', 100)
+    pairs = [(str(k).encode(), str(v).encode()) for k, v in make_pairs()]
+    buf = SortBuffer()
+    buf.fill(iter(pairs))
+    buf.sort()
+    assert list(buf) == sorted(pairs, key=lambda pair: pair[0])
+
+
+def test_empty():
+    buf = SortBuffer()
+    buf.sort()
+    assert list(buf) == []
+    buf.append(b'', b'')
+    buf.sort()
+    assert list(buf) == [(b'', b'')]
+
+
+def test_fill_and_nbytes():
+    pairs = serialize(make_pairs())
+    buf = SortBuffer(pickle.loads)
+    itr = iter(pairs)
+    assert buf.fill(itr, 10000)
+    count = len(buf)
+    assert 0 < count < len(pairs)
+    assert buf.nbytes > 10000
+    assert buf.nbytes == sum(len(k) + len(v) + buf._pair_overhead
+            + len(k) + sortbuffer.SORT_KEY_OVERHEAD for k, v in pairs[:count])
+
+    buf.clear()
+    assert buf.nbytes == 0
+    assert not buf.fill(itr)
+    assert list(buf) == pairs[count:]
+
+
+def test_sort_reserve(monkeypatch):
+    monkeypatch.setattr(sortbuffer, 'SORT_CHUNK_SIZE', 10)
+    pairs = [(b'%03d' % i, b'x') for i in range(25)]
+    buf = SortBuffer()
+    buf.fill(iter(pairs[:5]))
+    buf.fill(iter(pairs[5:]))
+    # Room for sorting is only reserved for the first chunk.
+    assert buf.nbytes == sum(4 + buf._pair_overhead for _ in pairs) + 10 * (
+            3 + sortbuffer.SORT_KEY_OVERHEAD)
+
+# vim: et sw=4 sts=4
@@ -0,0 +1,78 @@
+from mrs import datasets
+from mrs import util
+from mrs.tasks import MapOperation, ReduceOperation, MapTask
+
+
+class Program(object):
+    def __init__(self):
+        self.batch_calls = 0
+
+    def map(self, key, value):
+        yield key % 3, value
+
+    def map_batch(self, keys, values):
+        self.batch_calls += 1
+        return [(key % 3, value) for key, value in zip(keys, values)]
+
+    def reduce(self, key, values):
+        yield sum(values)
+
+    def reduce_batch(self, keys, grouped_values):
+        self.batch_calls += 1
+        return [(key, sum(values)) for key, values in
+                zip(keys, grouped_values)]
+
+    def plain(self, key, value):
+        yield key % 3, value
+
+    def partition(self, key, serialized_key, n):
+        return key % n
+
+
+def test_map_batch():
+    program = Program()
+    n = 3 * util.BATCH_SIZE
+    input = [(i, i) for i in range(n)]
+
+    op = MapOperation('map', None, 'partition')
+    assert op.batch_mapper(program) is not None
+    output = list(op.map(program, input))
+    assert program.batch_calls == 3
+    assert output == [(i % 3, i) for i in range(n)]
+
+    op = MapOperation('plain', None, 'partition')
+    assert op.batch_mapper(program) is None
+    assert list(op.map(program, input)) == output
+
+
+def test_map_batches_combine():
+    program = Program()
+    op = MapOperation('map', 'reduce', 'partition')
+    batches = [([0, 1, 2], [1, 1, 1]), ([3, 4, 5], [1, 1, 1])]
+    output = list(op.map_batches(program, batches))
+    assert output == [(0, 2), (1, 2), (2, 2)]
+    assert program.batch_calls == 3
+
+
+def test_reduce_batch():
+    program = Program()
+    input = sorted((i % 10, i) for i in range(3 * util.BATCH_SIZE))
+    expected = [(k, sum(v for kk, v in input if kk == k)) for k in range(10)]
+
+    op = ReduceOperation('reduce', 'partition')
+    assert list(op.reduce(program, input)) == expected
+    assert program.batch_calls > 1
+
+
+def test_map_task_serial():
+    program = Program()
+    input_ds = datasets.LocalData([(i, i) for i in range(100)], splits=1)
+    op = MapOperation('map', None, 'partition')
+    task = MapTask(op, input_ds, 'test', 0, 3, None, '', None)
+    task.run(program, None, serial=True)
+
+    output = sorted(task.output.data())
+    assert output == sorted((i % 3, i) for i in range(100))
+    assert program.batch_calls == 1
+
+# vim: et sw=4 sts=4
@@ -0,0 +1,68 @@
+from collections import Counter
+
+from mrs.tasks import MapOperation
+
+
+class WordCount(object):
+    def map(self, key, value):
+        for word in value.split():
+            yield word, 1
+
+    def listmap(self, key, value):
+        for word in value.split():
+            yield [word], 1
+
+    def combine(self, key, values):
+        yield sum(values)
+
+    def partition(self, key, serialized_key, n):
+        return 0
+
+
+LINES = ['a b c a', 'b a', 'c c c d'] * 100
+
+
+def totals(pairs):
+    counts = Counter()
+    for key, value in pairs:
+        if isinstance(key, list):
+            key = key[0]
+        counts[key] += value
+    return counts
+
+
+def test_hash_combine():
+    program = WordCount()
+    input = list(enumerate(LINES))
+    expected = totals((w, 1) for line in LINES for w in line.split())
+
+    op = MapOperation('map', 'combine', 'partition')
+    output = list(op.map(program, input))
+    assert totals(output) == expected
+    # With a large table, each key is combined exactly once.
+    assert len(output) == len(expected)
+
+
+def test_bounded_table():
+    program = WordCount()
+    input = list(enumerate(LINES))
+    expected = totals((w, 1) for line in LINES for w in line.split())
+
+    op = MapOperation('map', 'combine', 'partition')
+    op.combine_table_size = 10
+    output = list(op.map(program, input))
+    assert totals(output) == expected
+    assert len(expected) < len(output) < sum(expected.values())
+
+
+def test_unhashable_keys():
+    program = WordCount()
+    input = list(enumerate(LINES))
+    expected = totals((w, 1) for line in LINES for w in line.split())
+
+    op = MapOperation('listmap', 'combine', 'partition')
+    output = list(op.map(program, input))
+    assert totals(output) == expected
+    assert len(output) == len(expected)
+
+# vim: et sw=4 sts=4
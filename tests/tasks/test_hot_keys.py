@@ -0,0 +1,98 @@
+import binascii
+from collections import defaultdict
+
+from mrs import datasets
+from mrs.serializers import Serializers, str_serializer
+from mrs.tasks import MapOperation, Operation, ReduceOperation
+
+
+class Program(object):
+    def map(self, key, value):
+        for word in value.split():
+            yield word, 1
+
+    def reduce(self, key, values):
+        yield sum(values)
+
+    def partition(self, key, serialized_key, n):
+        return len(key) % n
+
+
+def str_serializers():
+    return Serializers(str_serializer, 'str_serializer', None, None)
+
+
+def hex_keys(keys):
+    return [binascii.hexlify(k).decode('ascii') for k in keys]
+
+
+def test_hot_key_parter():
+    program = Program()
+    op = MapOperation('map', '', 'partition', False, False,
+            hex_keys([b'hot']))
+    parter = op.parter(program)
+
+    hot_splits = set(parter('hot', b'hot', 4) for i in range(8))
+    assert hot_splits == set(range(4))
+    assert set(parter('cold', b'cold', 4) for i in range(8)) == set([0])
+
+    # Hot keys survive the conversion to and from args.
+    op2 = Operation.from_args(*op.to_args())
+    assert op2.hot_keys == op.hot_keys
+    assert op2.parter(program)('hot', b'hot', 4) in range(4)
+    assert not ReduceOperation('reduce', 'partition').hot_keys
+
+
+def test_salted_partial_reduce(tmpdir):
+    program = Program()
+    lines = ['hot cold hot', 'hot warm', 'cold hot']
+    op = MapOperation('map', '', 'partition', False, False,
+            hex_keys([b'hot']))
+    output = datasets.LocalData(op.map(program, enumerate(lines)), splits=3,
+            parter=op.parter(program), dir=tmpdir.strpath, write_only=True,
+            serializers=str_serializers())
+
+    # The hot key is in every split, so the first reduce gives partial sums.
+    reduce_op = ReduceOperation('reduce', 'partition')
+    partials = defaultdict(list)
+    for split in range(3):
+        pairs = sorted(pair for b in output[:, split] for pair in b.stream())
+        for key, value in reduce_op.reduce(program, pairs):
+            partials[key].append(value)
+    assert len(partials['hot']) == 3
+    assert len(partials['cold']) == 1
+
+    merged = dict(reduce_op.reduce(program, sorted((key, value)
+        for key, values in partials.items() for value in values)))
+    assert merged == {'hot': 4, 'cold': 2, 'warm': 1}
+
+    sizes = output.split_sizes()
+    assert sum(n for _, n in sizes) == 7
+    assert all(nbytes > 0 for nbytes, _ in sizes)
+    assert 1 <= output.skew() <= 3
+
+
+class CountingProgram(Program):
+    def __init__(self):
+        self.reduced = []
+
+    def reduce(self, key, values):
+        self.reduced.append(key)
+        yield sum(values)
+
+
+def test_merge_keys():
+    program = CountingProgram()
+    op = ReduceOperation('reduce', 'partition', False, True, (), (),
+            hex_keys([b'hot']))
+    op = Operation.from_args(*op.to_args())
+    assert op.merge_keys == hex_keys([b'hot'])
+
+    # Only the hot key is reduced; other keys pass straight through.
+    partials = [('cold', 2), ('hot', 1), ('hot', 2), ('hot', 1), ('warm', 1),
+            ('warm', 5)]
+    output = list(op.reduce(program, partials, str_serializers()))
+    assert output == [('cold', 2), ('hot', 4), ('warm', 1), ('warm', 5)]
+    assert program.reduced == ['hot']
+
+# vim: et sw=4 sts=4
@@ -0,0 +1,82 @@
+import random
+
+from mrs import datasets
+from mrs.job import Job
+from mrs.serializers import Serializers, raw_serializer
+from mrs.tasks import MapOperation, Operation, RangeParter
+
+
+class Program(object):
+    def map(self, key, value):
+        for word in value.split():
+            yield word, 1
+
+    def partition(self, key, serialized_key, n):
+        return 0
+
+
+class Opts(object):
+    mrs__reduce_tasks = 4
+
+
+def test_range_parter():
+    parter = RangeParter([10, 20, 30])
+    assert [parter(k, None, 4) for k in (-5, 9, 10, 19, 20, 30, 99)] == [
+            0, 0, 1, 1, 2, 3, 3]
+    # Keys past the last split go to the last split.
+    assert parter(99, None, 2) == 1
+
+
+def test_raw_keys(tmpdir):
+    program = Program()
+    job = Job(None, program, Opts())
+    serializers = Serializers(raw_serializer, 'raw_serializer',
+            raw_serializer, 'raw_serializer')
+    boundaries = job._encode_keys([b'm'], serializers)
+    op = MapOperation('map', '', 'partition', False, False, (), boundaries)
+    parter = op.parter(program, serializers)
+    assert parter(b'apple', b'apple', 2) == 0
+    assert parter(b'zebra', b'zebra', 2) == 1
+
+    pairs = [(w, b'1') for w in (b'kiwi', b'pear', b'fig', b'melon', b'm')]
+    output = datasets.LocalData(pairs, splits=2, parter=parter,
+            dir=tmpdir.strpath, write_only=True, serializers=serializers)
+    splits = [sorted(k for b in output[:, split] for k, _ in b.stream())
+            for split in range(2)]
+    assert splits == [[b'fig', b'kiwi'], [b'm', b'melon', b'pear']]
+
+
+def test_sample_boundaries(tmpdir):
+    program = Program()
+    job = Job(None, program, Opts())
+    rand = random.Random(5)
+    lines = [' '.join('w%03d' % rand.randrange(1000) for _ in range(10))
+            for _ in range(400)]
+    written = datasets.LocalData(enumerate(lines), splits=2,
+            parter=lambda k, sk, n: k % n, dir=tmpdir.mkdir('in').strpath,
+            write_only=True)
+    input = datasets.FileData([b.url for b in written[:, :]], splits=2)
+
+    boundaries = job.sample_boundaries(input, 'map', sample_size=200)
+    assert len(boundaries) == 3
+    assert boundaries == sorted(boundaries)
+    assert job.sample_boundaries(input, 'map', splits=1) == []
+
+    # Boundaries survive the conversion to and from args.
+    op = MapOperation('map', '', 'partition', False, False, (),
+            job._encode_keys(boundaries, None))
+    op = Operation.from_args(*op.to_args())
+    output = datasets.LocalData(op.map(program, enumerate(lines)), splits=4,
+            parter=op.parter(program), dir=tmpdir.mkdir('out').strpath,
+            write_only=True)
+
+    # Concatenating the sorted splits gives globally sorted output.
+    keys = []
+    for split in range(4):
+        split_keys = sorted(k for b in output[:, split] for k, _ in b.stream())
+        assert split_keys
+        keys.extend(split_keys)
+    assert keys == sorted(keys)
+    assert output.skew() < 2
+
+# vim: et sw=4 sts=4
@@ -0,0 +1,80 @@
+from mrs import datasets
+from mrs.tasks import (MapOperation, MapTask, ReduceOperation, ReduceTask,
+        copy_object)
+
+
+class Program(object):
+    def map(self, key, value):
+        value.append(key)
+        yield key % 3, value
+
+    def reduce(self, key, values):
+        yield sum(values)
+
+    def partition(self, key, serialized_key, n):
+        return key % n
+
+
+class ImmutableProgram(Program):
+    immutable_data = True
+
+
+def test_copy_object():
+    shared = ['word', b'bytes', 5, 2.5, None, ('word', 1)]
+    for obj in shared:
+        assert copy_object(obj) is obj
+
+    value = {'a': [1, 2], 'b': (3, [4])}
+    copied = copy_object(value)
+    assert copied == value
+    assert copied['a'] is not value['a']
+    assert copied['b'][1] is not value['b'][1]
+
+    # Unpicklable objects are copied with deepcopy.
+    functions = [lambda x: x]
+    copied = copy_object(functions)
+    assert copied == functions and copied is not functions
+
+
+def test_serial_map_copies_input():
+    values = [[] for i in range(10)]
+    input_ds = datasets.LocalData(list(enumerate(values)), splits=1)
+    op = MapOperation('map', None, 'partition')
+
+    task = MapTask(op, input_ds, 'test', 0, 3, None, '', None)
+    task.run(Program(), None, serial=True)
+    assert sorted(task.output.data()) == sorted((i % 3, [i])
+            for i in range(10))
+    assert values == [[]] * 10
+
+    task = MapTask(op, input_ds, 'test', 0, 3, None, '', None)
+    task.run(ImmutableProgram(), None, serial=True)
+    assert values == [[i] for i in range(10)]
+
+
+def test_serial_reduce_streams_files(tmpdir):
+    pairs = [(i % 7, i) for i in range(1000)]
+    written = datasets.LocalData(pairs, splits=3, parter=lambda k, sk, n: k % n,
+            dir=tmpdir.strpath, write_only=True)
+    input_ds = datasets.FileData([b.url for b in written[:, :]], splits=3)
+
+    op = ReduceOperation('reduce', 'partition')
+    task = ReduceTask(op, input_ds, 'test', 0, 1, None, '', None)
+    task.run(Program(), None, serial=True)
+
+    expected = [(k, sum(v for kk, v in pairs if kk == k)) for k in range(7)]
+    assert list(task.output.data()) == expected
+    assert not input_ds._fetched
+    assert task.output.sorted
+
+
+def test_serial_map_output_not_sorted():
+    input_ds = datasets.LocalData([(i, []) for i in range(10)], splits=1)
+    op = MapOperation('map', None, 'partition', True)
+    task = MapTask(op, input_ds, 'test', 0, 3, None, '', None)
+    task.run(Program(), None, serial=True)
+    # Serial output is kept in RAM and is never sorted.
+    assert op.output_sorted()
+    assert not task.output.sorted
+
+# vim: et sw=4 sts=4
@@ -0,0 +1,59 @@
+import multiprocessing
+
+from mrs.worker import (WorkerPoolManager, WorkerRemoveRequest,
+        WorkerSetupRequest, WorkerSetupSuccess, WorkerSuccess,
+        WorkerTaskRequest)
+
+
+class Manager(WorkerPoolManager):
+    def __init__(self, n):
+        pipes = [multiprocessing.Pipe() for _ in range(n)]
+        self.init_worker_pool([ours for ours, _ in pipes])
+        self.worker_ends = [theirs for _, theirs in pipes]
+        self.successes = []
+
+    def worker_success(self, response):
+        self.successes.append((response.dataset_id, response.task_index))
+
+    def worker_failure(self, response):
+        assert False
+
+
+def task_request(task_index):
+    return WorkerTaskRequest(('map',), [], 'ds', task_index, 1, '', '', '',
+            '')
+
+
+def test_setup():
+    manager = Manager(3)
+    for end in manager.worker_ends:
+        end.send(WorkerSetupSuccess())
+    assert manager.worker_setup(None, [], '/tmp')
+    for end in manager.worker_ends:
+        assert isinstance(end.recv(), WorkerSetupRequest)
+
+
+def test_slots():
+    manager = Manager(2)
+    assert manager.slots == 2
+    assert manager.submit_request(task_request(0))
+    assert manager.submit_request(task_request(0)) is False
+    assert manager.submit_request(task_request(1))
+    assert manager.idle_slots() == 0
+    assert manager.submit_request(task_request(2)) is False
+
+    # Other requests are accepted even if all workers are busy.
+    assert manager.submit_request(WorkerRemoveRequest('/nonexistent'))
+
+    end = manager.worker_ends[1]
+    request = end.recv()
+    assert request.task_index == 1
+    end.send(WorkerSuccess('ds', 1, '', [], request.id()))
+    manager.read_worker_pipe(1)
+    assert manager.successes == [('ds', 1)]
+    assert manager.current_tasks == [('ds', 0), None]
+
+    assert manager.submit_request(task_request(2))
+    assert manager.current_tasks == [('ds', 0), ('ds', 2)]
+
+# vim: et sw=4 sts=4
@@ -0,0 +1,138 @@
+#!/usr/bin/env python3
+# Mrs
+# Copyright 2008-2012 Brigham Young University
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""Measure reading throughput (records per second) of the Mrs file formats.
+
+The "legacy" reader is the original BinReader implementation, which copies
+the remainder of its buffer after every key and value.  It is kept here only
+for comparison.
+"""
+
+from __future__ import division, print_function
+
+import argparse
+import io
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+
+from mrs import fileformats
+from mrs.serializers import raw_serializer, Serializers
+
+
+class LegacyBinReader(fileformats.Reader):
+    """The original BinReader (before it read records in place)."""
+    magic = b'MrsB'
+
+    def __init__(self, fileobj, *args, **kwds):
+        super(LegacyBinReader, self).__init__(fileobj, *args, **kwds)
+        self._buffer = b''
+
+    def __iter__(self):
+        self.fileobj.read(len(self.magic))
+        while True:
+            key = self._read_record()
+            if key is None:
+                return
+            value = self._read_record()
+            if self.loads_key is not None:
+                key = self.loads_key(key)
+            if self.loads_value is not None:
+                value = self.loads_value(value)
+            yield (key, value)
+
+    def _read_record(self):
+        size = fileformats.len_struct.size
+        if len(self._buffer) < size:
+            self._buffer += self.fileobj.read(4096)
+        if not self._buffer:
+            return None
+        length, = fileformats.len_struct.unpack(self._buffer[:size])
+        end = size + length
+        if end > len(self._buffer):
+            self._buffer += self.fileobj.read(end - len(self._buffer))
+        data = self._buffer[size:end]
+        self._buffer = self._buffer[end:]
+        return data
+
+
+def make_data(writer_cls, records, value_size, serializers):
+    f = io.BytesIO()
+    writer = writer_cls(f, serializers=serializers)
+    value = b'v' * value_size
+    for i in range(records):
+        if serializers is None:
+            writer.writepair((i, value))
+        else:
+            writer.writepair((str(i).encode('ascii'), value))
+    writer.finish()
+    return f.getvalue()
+
+
+def bench(reader_cls, data, serializers, repeat):
+    best = None
+    for _ in range(repeat):
+        start = time.time()
+        count = 0
+        for _ in reader_cls(io.BytesIO(data), serializers=serializers):
+            count += 1
+        elapsed = time.time() - start
+        if best is None or elapsed < best:
+            best = elapsed
+    return count / best
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('-n', '--records', type=int, default=200000,
+            help='number of key-value pairs')
+    parser.add_argument('-s', '--value-size', type=int, default=32,
+            help='size of each value in bytes')
+    parser.add_argument('-r', '--repeat', type=int, default=3,
+            help='number of repetitions (the best is reported)')
+    parser.add_argument('--raw', action='store_true',
+            help='use raw serializers instead of pickle')
+    args = parser.parse_args()
+
+    if args.raw:
+        serializers = Serializers(raw_serializer, '', raw_serializer, '')
+    else:
+        serializers = None
+
+    bin_data = make_data(fileformats.BinWriter, args.records,
+            args.value_size, serializers)
+    zip_data = make_data(fileformats.ZipWriter, args.records,
+            args.value_size, serializers)
+    text_data = make_data(fileformats.TextWriter, args.records,
+            args.value_size, serializers)
+
+    cases = [
+            ('legacy mrsb', LegacyBinReader, bin_data),
+            ('mrsb', fileformats.BinReader, bin_data),
+            ('mrsz', fileformats.ZipReader, zip_data),
+            ('mtxt', fileformats.TextReader, text_data),
+            ]
+    for name, reader_cls, data in cases:
+        rate = bench(reader_cls, data, serializers, args.repeat)
+        print('%-12s %12.0f records/sec' % (name, rate))
+
+
+if __name__ == '__main__':
+    main()
+
+# vim: et sw=4 sts=4